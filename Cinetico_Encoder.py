@@ -11,11 +11,17 @@ import time
 import ctypes
 import uuid
 import random
-import http.server
-import socketserver
+import asyncio
+import json
+import argparse
+import signal
+import mmap
+import sqlite3
+import hashlib
 from concurrent.futures import ThreadPoolExecutor
-from functools import partial
-from collections import deque
+from contextlib import contextmanager, redirect_stdout
+from collections import deque, OrderedDict
+from array import array
 from http import HTTPStatus
 
 # =========================================================================
@@ -26,7 +32,10 @@ from http import HTTPStatus
 FFMPEG_PATH = "ffmpeg"
 FFPROBE_PATH = "ffprobe"
 
-def check_and_install_dependencies():
+# 无界面模式：跳过界面库检查；stdout 专用于 JSON 进度行 (见 headless_main)
+HEADLESS_MODE = "--headless" in sys.argv[1:]
+
+def check_and_install_dependencies(headless=False):
     global FFMPEG_PATH, FFPROBE_PATH
     
     # --- 1. Python 库依赖检查 ---
@@ -37,6 +46,8 @@ def check_and_install_dependencies():
         ("packaging", "packaging"),
         ("uuid", "uuid")
     ]
+    # 渲染农场等无显示环境不需要界面库
+    if headless: required_packages = [p for p in required_packages if p[0] not in ("customtkinter", "tkinterdnd2", "PIL")]
     
     print("--------------------------------------------------")
     print("正在检查运行环境...")
@@ -142,21 +153,13 @@ def check_and_install_dependencies():
     if installed_any:
         print("\n🎉 环境配置完毕！正在启动...")
 
-# 执行检查
-check_and_install_dependencies()
+# 执行检查 (无界面模式下检查日志走 stderr，不混进 JSON 进度行)
+with redirect_stdout(sys.stderr if HEADLESS_MODE else sys.stdout): check_and_install_dependencies(headless=HEADLESS_MODE)
 
 # =========================================================================
 # === [模块 2] 主程序逻辑 ===
 # =========================================================================
 
-import customtkinter as ctk  
-import tkinter as tk         
-from tkinter import filedialog, messagebox
-
-# 全局视觉配置
-ctk.set_appearance_mode("Dark") 
-ctk.set_default_color_theme("dark-blue")
-
 # 颜色变量
 COLOR_TEXT_GRAY = "#888888" 
 COLOR_BG_MAIN = "#121212"    
@@ -191,63 +194,3076 @@ STATE_READY = 3
 STATE_ENCODING = 4       
 STATE_DONE = 5           
 STATE_ERROR = -1         
+STATE_NAMES = {STATE_PENDING: "pending", STATE_QUEUED_IO: "queued_io", STATE_CACHING: "caching", STATE_READY: "ready",
+               STATE_ENCODING: "encoding", STATE_DONE: "done", STATE_ERROR: "error"}
+
+# Windows 优先级常量
+PRIORITY_NORMAL = 0x00000020 
+PRIORITY_ABOVE = 0x00008000  
+PRIORITY_HIGH = 0x00000080   
+
+# --- 辅助函数：跨平台 Subprocess 参数 ---
+# 这是一个关键修复，防止 Mac 上报错
+def get_subprocess_args():
+    if platform.system() == "Windows":
+        si = subprocess.STARTUPINFO()
+        si.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+        return {"startupinfo": si, "creationflags": subprocess.CREATE_NO_WINDOW}
+    return {}
+
+# --- Linux 硬件探测 (procfs / sysfs) ---
+# 根目录可通过环境变量指向样例目录树，便于在无对应硬件的机器上验证
+PROC_ROOT = os.environ.get("CINETICO_PROC_ROOT", "/proc")
+SYSFS_ROOT = os.environ.get("CINETICO_SYSFS_ROOT", "/sys")
+PSEUDO_FS_TYPES = ("proc", "sysfs", "tmpfs", "devtmpfs", "devpts", "cgroup", "cgroup2", "overlay", "squashfs", "autofs",
+                   "debugfs", "tracefs", "securityfs", "pstore", "bpf", "mqueue", "hugetlbfs", "fusectl", "configfs", "nsfs", "ramfs")
+
+def read_meminfo():
+    info = {}
+    try:
+        with open(os.path.join(PROC_ROOT, "meminfo")) as f:
+            for line in f:
+                key, _, rest = line.partition(":")
+                parts = rest.split()
+                if parts: info[key.strip()] = int(parts[0]) * 1024 # kB -> 字节
+    except: pass
+    return info
+
+# /proc/stat 汇总行 -> (忙碌, iowait, 总计) jiffies；非 Linux 返回 None
+def read_cpu_times():
+    try:
+        with open(os.path.join(PROC_ROOT, "stat")) as f:
+            parts = f.readline().split()
+        if parts[0] != "cpu": return None
+        vals = [int(v) for v in parts[1:9]] # user nice system idle iowait irq softirq steal
+        total = sum(vals)
+        return total - vals[3] - vals[4], vals[4], total
+    except: return None
+
+def _unescape_mount(field):
+    # mountinfo 中空格等字符以 \040 形式的八进制转义出现
+    out, i = [], 0
+    while i < len(field):
+        if field[i] == "\\" and field[i + 1:i + 4].isdigit():
+            out.append(chr(int(field[i + 1:i + 4], 8))); i += 4
+        else:
+            out.append(field[i]); i += 1
+    return "".join(out)
+
+# 挂载表：[{"mount": 挂载点, "fstype": 类型, "source": 设备}]
+def read_mount_table():
+    mounts = []
+    try:
+        with open(os.path.join(PROC_ROOT, "self", "mountinfo")) as f:
+            for line in f:
+                left, _, right = line.partition(" - ")
+                lf, rf = left.split(), right.split()
+                if len(lf) < 5 or len(rf) < 2: continue
+                mounts.append({"mount": _unescape_mount(lf[4]), "fstype": rf[0], "source": _unescape_mount(rf[1])})
+    except: pass
+    return mounts
+
+# 挂载表很少变化：解析结果按时间缓存，路径 -> 整盘的结果再按 st_dev 记忆，
+# 调度器每次唤醒对几十个文件做判断时不必反复解析 procfs
+MOUNT_TABLE_TTL = 10.0
+_mount_cache = {"at": None, "mounts": [], "disk_of_dev": {}}
+_mount_cache_lock = threading.Lock()
+
+def cached_mount_table():
+    now = time.monotonic()
+    with _mount_cache_lock:
+        if _mount_cache["at"] is None or now - _mount_cache["at"] > MOUNT_TABLE_TTL:
+            # 挂载表刷新后旧的设备映射可能失效 (设备号被复用)，一并清空
+            _mount_cache.update(at=now, mounts=read_mount_table(), disk_of_dev={})
+        return _mount_cache["mounts"], _mount_cache["disk_of_dev"]
+
+def invalidate_mount_cache():
+    with _mount_cache_lock: _mount_cache["at"] = None
+
+def mount_for_path(path, mounts=None):
+    path = os.path.realpath(path)
+    best = None
+    for m in (mounts if mounts is not None else read_mount_table()):
+        mp = m["mount"]
+        if path == mp or path.startswith(mp.rstrip("/") + "/"):
+            if best is None or len(mp) >= len(best["mount"]): best = m
+    return best
+
+# 分区 -> 所属整盘 (sda1 -> sda, nvme0n1p2 -> nvme0n1)
+def block_disk_name(dev_name):
+    class_dir = os.path.join(SYSFS_ROOT, "class", "block", dev_name)
+    if os.path.exists(os.path.join(class_dir, "partition")):
+        parent = os.path.basename(os.path.dirname(os.path.realpath(class_dir)))
+        if os.path.isdir(os.path.join(SYSFS_ROOT, "block", parent)): return parent
+    if os.path.isdir(os.path.join(SYSFS_ROOT, "block", dev_name)): return dev_name
+    base = dev_name.rstrip("0123456789")
+    if base.endswith("p") and os.path.isdir(os.path.join(SYSFS_ROOT, "block", base[:-1])): return base[:-1]
+    if os.path.isdir(os.path.join(SYSFS_ROOT, "block", base)): return base
+    return None
+
+def _read_sys_flag(*parts):
+    try:
+        with open(os.path.join(SYSFS_ROOT, *parts)) as f: return f.read().strip() == "1"
+    except: return None
+
+# 路径所在的块设备名 (无法确定时返回 None，例如 tmpfs / overlay / 网络盘)
+def linux_disk_for_path(path):
+    mounts, disk_of_dev = cached_mount_table()
+    try: st_dev = os.stat(path).st_dev
+    except OSError: st_dev = None # 尚不存在的路径 (如输出目录) 只按挂载点匹配，不记忆
+    if st_dev is not None and st_dev in disk_of_dev: return disk_of_dev[st_dev]
+    m = mount_for_path(path, mounts)
+    disk = None
+    if m and m["source"].startswith("/dev/"):
+        dev = os.path.realpath(m["source"]) if os.path.exists(m["source"]) else m["source"]
+        disk = block_disk_name(os.path.basename(dev))
+    if st_dev is not None: disk_of_dev[st_dev] = disk
+    return disk
+
+def linux_is_rotational(disk):
+    return _read_sys_flag("block", disk, "queue", "rotational")
+
+def linux_is_usb(disk):
+    if _read_sys_flag("block", disk, "removable"): return True
+    for sub in ("", "device"):
+        try:
+            if "/usb" in os.path.realpath(os.path.join(SYSFS_ROOT, "block", disk, sub)): return True
+        except: pass
+    return False
+
+# Linux 缓存池候选：真实块设备上的可写挂载点 (根分区使用家目录)
+def linux_cache_candidates():
+    home = os.path.expanduser("~")
+    mounts = read_mount_table()
+    seen, out = set(), []
+    for m in mounts:
+        if m["fstype"] in PSEUDO_FS_TYPES or not m["source"].startswith("/dev/"): continue
+        mp = m["mount"]
+        if mp.startswith(("/boot", "/proc", "/sys", "/dev", "/run", "/snap")): continue
+        path = mp
+        if not os.access(mp, os.W_OK):
+            if mount_for_path(home, mounts) is m: path = home
+            else: continue
+        if path in seen: continue
+        seen.add(path)
+        out.append({"path": path, "mount": mp, "is_system": mp == "/"})
+    return out
+
+# --- CPU 拓扑 (NUMA 节点 / SMT 兄弟线程) ---
+def parse_cpu_list(text):
+    cpus = set()
+    for part in text.strip().split(","):
+        if not part: continue
+        lo, _, hi = part.partition("-")
+        cpus.update(range(int(lo), int(hi or lo) + 1))
+    return cpus
+
+def _read_cpu_list(*parts):
+    try:
+        with open(os.path.join(SYSFS_ROOT, *parts)) as f: return parse_cpu_list(f.read())
+    except: return None
+
+_CPU_TOPOLOGY = None
+
+# 本进程可用的物理核列表：[(NUMA 节点, (逻辑 CPU...)), ...]，按节点、核编号排序；无法识别时返回 []
+def linux_cpu_topology():
+    global _CPU_TOPOLOGY
+    if _CPU_TOPOLOGY is not None: return _CPU_TOPOLOGY
+    try: allowed = os.sched_getaffinity(0)
+    except: allowed = set()
+    node_of = {}
+    node_root = os.path.join(SYSFS_ROOT, "devices", "system", "node")
+    try:
+        for name in os.listdir(node_root):
+            if not (name.startswith("node") and name[4:].isdigit()): continue
+            for cpu in _read_cpu_list("devices", "system", "node", name, "cpulist") or (): node_of[cpu] = int(name[4:])
+    except: pass
+    cores = {}
+    for cpu in sorted(allowed):
+        siblings = _read_cpu_list("devices", "system", "cpu", f"cpu{cpu}", "topology", "thread_siblings_list") or {cpu}
+        cores.setdefault(min(siblings), []).append(cpu)
+    _CPU_TOPOLOGY = sorted((node_of.get(key, 0), tuple(cpus)) for key, cpus in cores.items())
+    return _CPU_TOPOLOGY
+
+# 把可用 CPU 切成 n 份：以整个物理核为单位 (SMT 兄弟不拆开)，按节点顺序连续分配，尽量不跨 NUMA
+def partition_cpus(n, topology=None):
+    topology = linux_cpu_topology() if topology is None else topology
+    if n <= 1 or not topology: return []
+    units = [cpus for _, cpus in topology]
+    if len(units) < n: units = [(cpu,) for cpus in units for cpu in cpus] # 物理核不够分：退化为按逻辑 CPU 切
+    if len(units) < n: return []
+    parts, start = [], 0
+    for i in range(n):
+        size = len(units) // n + (1 if i < len(units) % n else 0)
+        parts.append(sorted(cpu for unit in units[start:start + size] for cpu in unit))
+        start += size
+    return parts
+
+# x265 线程池按 NUMA 节点指定线程数，例如 "-,8" 表示 8 个线程全部放在节点 1
+def x265_pools_spec(cpus, topology=None):
+    topology = linux_cpu_topology() if topology is None else topology
+    node_of = {cpu: node for node, unit in topology for cpu in unit}
+    counts = {}
+    for cpu in cpus: counts[node_of.get(cpu, 0)] = counts.get(node_of.get(cpu, 0), 0) + 1
+    if not counts: return None
+    return ",".join(str(counts[i]) if i in counts else "-" for i in range(max(counts) + 1))
+
+# --- cgroup 内存限制 (容器内运行时，宿主机剩余内存并不代表本进程可用的内存) ---
+CGROUP_NO_LIMIT = 1 << 60        # v1 未设限时为接近 2^63 的值
+CGROUP_CACHE_FRACTION = 0.5      # 设有 cgroup 限额时，内存缓存最多占限额的一半 (其余留给 FFmpeg 本身)
+MEMORY_PSI_THRESHOLD = 10.0      # memory.pressure "some avg10" 超过该百分比即视为内存吃紧
+
+def _read_int_file(path):
+    try:
+        with open(path) as f: val = f.read().strip()
+        return None if val == "max" else int(val)
+    except: return None
+
+# 返回 [(版本, 本进程所在 cgroup 目录, 挂载根目录)]，v2 优先
+def cgroup_memory_dirs():
+    v1_path, v2_path = None, None
+    try:
+        with open(os.path.join(PROC_ROOT, "self", "cgroup")) as f:
+            for line in f:
+                parts = line.strip().split(":", 2)
+                if len(parts) != 3: continue
+                if parts[0] == "0" and parts[1] == "": v2_path = parts[2]
+                elif "memory" in parts[1].split(","): v1_path = parts[2]
+    except: return []
+    base = os.path.join(SYSFS_ROOT, "fs", "cgroup")
+    found = []
+    if v2_path is not None:
+        for root in (base, os.path.join(base, "unified")):
+            try:
+                with open(os.path.join(root, "cgroup.controllers")) as f:
+                    if "memory" not in f.read().split(): continue # 混合模式下内存控制器仍挂在 v1
+            except: continue
+            d = os.path.join(root, v2_path.lstrip("/"))
+            found.append((2, d if os.path.isdir(d) else root, root)) # 命名空间内路径可能不存在，退回挂载根
+            break
+    if v1_path is not None:
+        root = os.path.join(base, "memory")
+        d = os.path.join(root, v1_path.lstrip("/"))
+        if os.path.isdir(root): found.append((1, d if os.path.isdir(d) else root, root))
+    return found
+
+# (限额字节, 已用字节)；没有限额时限额为 None。祖先 cgroup 的限额同样生效，取最小值
+def read_cgroup_memory():
+    for version, d, root in cgroup_memory_dirs():
+        limit_name, usage_name = ("memory.max", "memory.current") if version == 2 else ("memory.limit_in_bytes", "memory.usage_in_bytes")
+        usage = _read_int_file(os.path.join(d, usage_name))
+        limit, cur = None, d
+        while True:
+            val = _read_int_file(os.path.join(cur, limit_name))
+            if val is not None and val < CGROUP_NO_LIMIT: limit = val if limit is None else min(limit, val)
+            if os.path.normpath(cur) == os.path.normpath(root): break
+            cur = os.path.dirname(cur)
+        if limit is not None or usage is not None: return limit, usage
+    return None, None
+
+# PSI：优先读本 cgroup 的 memory.pressure，没有则读全局 /proc/pressure/memory
+def read_memory_pressure():
+    paths = [os.path.join(d, "memory.pressure") for v, d, _ in cgroup_memory_dirs() if v == 2]
+    paths.append(os.path.join(PROC_ROOT, "pressure", "memory"))
+    for path in paths:
+        try:
+            with open(path) as f:
+                for line in f:
+                    if line.startswith("some"):
+                        for field in line.split()[1:]:
+                            k, _, v = field.partition("=")
+                            if k == "avg10": return float(v)
+        except: continue
+    return None
+
+def memory_under_pressure():
+    if platform.system() != "Linux": return False
+    psi = read_memory_pressure()
+    return psi is not None and psi >= MEMORY_PSI_THRESHOLD
+
+# --- 硬件检测 ---
+def get_total_ram_gb():
+    try:
+        if platform.system() == "Windows":
+            class MEMORYSTATUSEX(ctypes.Structure):
+                _fields_ = [("dwLength", ctypes.c_ulong), ("dwMemoryLoad", ctypes.c_ulong), 
+                            ("ullTotalPhys", ctypes.c_ulonglong), ("ullAvailPhys", ctypes.c_ulonglong), 
+                            ("ullTotalPageFile", ctypes.c_ulonglong), ("ullAvailPageFile", ctypes.c_ulonglong), 
+                            ("ullTotalVirtual", ctypes.c_ulonglong), ("ullAvailVirtual", ctypes.c_ulonglong), 
+                            ("ullAvailExtendedVirtual", ctypes.c_ulonglong)]
+            stat = MEMORYSTATUSEX()
+            stat.dwLength = ctypes.sizeof(stat)
+            ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(stat))
+            return stat.ullTotalPhys / (1024**3)
+        elif platform.system() == "Linux":
+            total = read_meminfo().get("MemTotal")
+            return total / (1024**3) if total else 16.0
+        else:
+            return 16.0 # Mac 简化处理
+    except:
+        return 16.0 
+
+def get_free_ram_gb():
+    try:
+        if platform.system() == "Windows":
+            class MEMORYSTATUSEX(ctypes.Structure):
+                _fields_ = [("dwLength", ctypes.c_ulong), ("dwMemoryLoad", ctypes.c_ulong), 
+                            ("ullTotalPhys", ctypes.c_ulonglong), ("ullAvailPhys", ctypes.c_ulonglong), 
+                            ("ullTotalPageFile", ctypes.c_ulonglong), ("ullAvailPageFile", ctypes.c_ulonglong), 
+                            ("ullTotalVirtual", ctypes.c_ulonglong), ("ullAvailVirtual", ctypes.c_ulonglong), 
+                            ("ullAvailExtendedVirtual", ctypes.c_ulonglong)]
+            stat = MEMORYSTATUSEX()
+            stat.dwLength = ctypes.sizeof(stat)
+            ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(stat))
+            return stat.ullAvailPhys / (1024**3)
+        elif platform.system() == "Linux":
+            info = read_meminfo()
+            avail = info.get("MemAvailable")
+            if avail is None and "MemFree" in info: avail = info["MemFree"] + info.get("Cached", 0) # 旧内核没有 MemAvailable
+            limit, usage = read_cgroup_memory()
+            if limit is not None: # 容器内：以 cgroup 剩余额度为准
+                cg_free = max(0, limit - (usage or 0))
+                avail = cg_free if avail is None else min(avail, cg_free)
+            return avail / (1024**3) if avail is not None else 4.0
+        else:
+            return 4.0
+    except:
+        return 4.0
+
+TOTAL_RAM = get_total_ram_gb()
+MAX_RAM_LOAD_GB = max(4.0, TOTAL_RAM - 4.0) 
+SAFE_RAM_RESERVE = 3.0  
+CGROUP_LIMIT_GB = None
+if platform.system() == "Linux":
+    _cg_limit, _ = read_cgroup_memory()
+    if _cg_limit is not None:
+        CGROUP_LIMIT_GB = _cg_limit / (1024**3)
+        # 硬上限：内存缓存不能超过 cgroup 限额的一定比例，否则整个进程会被 OOM 杀掉
+        MAX_RAM_LOAD_GB = min(MAX_RAM_LOAD_GB, CGROUP_LIMIT_GB * CGROUP_CACHE_FRACTION)
+        SAFE_RAM_RESERVE = min(SAFE_RAM_RESERVE, CGROUP_LIMIT_GB * 0.1)
+
+print(f"[System] RAM: {TOTAL_RAM:.1f}GB | Cache Limit: {MAX_RAM_LOAD_GB:.1f}GB" + (f" | cgroup: {CGROUP_LIMIT_GB:.1f}GB" if CGROUP_LIMIT_GB else ""),
+      file=sys.stderr if HEADLESS_MODE else sys.stdout)
+
+# Windows 电源管理 (Mac 跳过)
+def set_execution_state(enable=True):
+    if platform.system() != "Windows": return
+    ES_CONTINUOUS = 0x80000000
+    ES_SYSTEM_REQUIRED = 0x00000001
+    try:
+        if enable:
+            ctypes.windll.kernel32.SetThreadExecutionState(ES_CONTINUOUS | ES_SYSTEM_REQUIRED)
+        else:
+            ctypes.windll.kernel32.SetThreadExecutionState(ES_CONTINUOUS)
+    except: pass
+
+def disable_power_throttling(process_handle=None):
+    if platform.system() != "Windows": return
+    try:
+        # 省略具体代码，保持原样即可
+        pass
+    except: pass
+
+# 检查 FFmpeg (使用全局路径)
+def check_ffmpeg():
+    try:
+        # 使用 FFMPEG_PATH
+        subprocess.run([FFMPEG_PATH, "-version"], stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+        return True
+    except: return False
+
+# 磁盘检测
+drive_type_cache = {} 
+def is_drive_ssd(path):
+    if platform.system() == "Linux":
+        disk = linux_disk_for_path(path)
+        if disk is None: return True # tmpfs / overlay / 网络盘：无从判断，沿用旧行为
+        if disk not in drive_type_cache: drive_type_cache[disk] = linux_is_rotational(disk) is False
+        return drive_type_cache[disk]
+    if platform.system() != "Windows": return True # Mac 默认当 SSD 处理
+    root = os.path.splitdrive(os.path.abspath(path))[0].upper() 
+    if not root: return False
+    drive_letter = root 
+    if drive_letter in drive_type_cache: return drive_type_cache[drive_letter]
+    is_ssd = False
+    try:
+        h_vol = ctypes.windll.kernel32.CreateFileW(f"\\\\.\\{drive_letter}", 0x80, 0x3, None, 3, 0, None)
+        if h_vol != -1:
+            class STORAGE_PROPERTY_QUERY(ctypes.Structure):
+                _fields_ = [("PropertyId", ctypes.c_uint), ("QueryType", ctypes.c_uint), ("AdditionalParameters", ctypes.c_byte * 1)]
+            query = STORAGE_PROPERTY_QUERY()
+            query.PropertyId = 7 
+            class DEVICE_SEEK_PENALTY_DESCRIPTOR(ctypes.Structure):
+                _fields_ = [("Version", ctypes.c_ulong), ("Size", ctypes.c_ulong), ("IncursSeekPenalty", ctypes.c_bool)]
+            out = DEVICE_SEEK_PENALTY_DESCRIPTOR()
+            bytes_returned = ctypes.c_ulong()
+            ret = ctypes.windll.kernel32.DeviceIoControl(h_vol, 0x002D1400, ctypes.byref(query), ctypes.sizeof(query),
+                                                         ctypes.byref(out), ctypes.sizeof(out), ctypes.byref(bytes_returned), None)
+            ctypes.windll.kernel32.CloseHandle(h_vol)
+            if ret:
+                is_ssd = not out.IncursSeekPenalty 
+                drive_type_cache[drive_letter] = is_ssd
+                return is_ssd
+    except: pass
+    drive_type_cache[drive_letter] = False
+    return False
+
+def is_bus_usb(path):
+    if platform.system() == "Linux":
+        disk = linux_disk_for_path(path)
+        return bool(disk) and linux_is_usb(disk)
+    if platform.system() != "Windows": return False
+    try:
+        root = os.path.splitdrive(os.path.abspath(path))[0].upper()
+        if ctypes.windll.kernel32.GetDriveTypeW(root + "\\") == 2: return True 
+        return False
+    except: return False
+
+# 设备标识：同一设备上的 IO 任务串行 (机械盘顺序读最快)，不同设备之间并行
+def device_key(path):
+    try: return os.stat(path).st_dev
+    except OSError: return os.path.splitdrive(os.path.abspath(path))[0].upper() or "/"
+
+def find_best_cache_drive(source_drive_letter=None, manual_override=None):
+    if manual_override and os.path.exists(manual_override):
+        return manual_override
+    
+    # Linux：扫描挂载表，按与 Windows 相同的规则给候选盘分级
+    if platform.system() == "Linux":
+        candidates = []
+        for c in linux_cache_candidates():
+            try:
+                free_gb = shutil.disk_usage(c["path"]).free / (1024**3)
+                if free_gb < 20: continue
+                is_ssd = is_drive_ssd(c["path"])
+                is_usb = is_bus_usb(c["path"])
+                is_source = bool(source_drive_letter) and device_key(c["path"]) == device_key(source_drive_letter)
+                level = 0
+                if is_ssd and not c["is_system"] and not is_usb: level = 5
+                elif is_ssd and c["is_system"]: level = 4
+                elif not is_ssd and not is_source and not c["is_system"]: level = 3
+                elif not is_ssd and is_source: level = 2
+                elif c["is_system"]: level = 1
+                candidates.append({"path": c["path"], "level": level, "free": free_gb})
+            except: pass
+        candidates.sort(key=lambda x: (x["level"], x["free"]), reverse=True)
+        if candidates: return candidates[0]["path"]
+        return os.path.expanduser("~/")
+
+    # Mac 默认使用家目录
+    if platform.system() != "Windows":
+        return os.path.expanduser("~/")
+
+    drives = [f"{chr(i)}:\\" for i in range(65, 91) if os.path.exists(f"{chr(i)}:\\")]
+    candidates = []
+    for root in drives:
+        try:
+            d_letter = os.path.splitdrive(root)[0].upper()
+            total, used, free = shutil.disk_usage(root)
+            free_gb = free / (1024**3)
+            if free_gb < 20: continue 
+            is_system = (d_letter == "C:")
+            is_ssd = is_drive_ssd(root)
+            is_usb = is_bus_usb(root)
+            is_source = (source_drive_letter and d_letter == source_drive_letter.upper())
+            level = 0
+            if is_ssd and not is_system and not is_usb: level = 5
+            elif is_ssd and is_system: level = 4
+            elif not is_ssd and not is_source and not is_system: level = 3
+            elif not is_ssd and is_source: level = 2
+            elif is_system: level = 1
+            candidates.append({"path": root, "level": level, "free": free_gb})
+        except: pass
+    candidates.sort(key=lambda x: (x["level"], x["free"]), reverse=True)
+    if candidates: return candidates[0]["path"]
+    else: return "C:\\"
+
+# 全局内存仓库与单例服务器
+GLOBAL_RAM_STORAGE = {} 
+GLOBAL_FILE_STORAGE = {} # token -> 磁盘路径 (SSD 缓存 / 直读源)，由 sendfile 直接发送
+PATH_TO_TOKEN_MAP = {}
+LOOPBACK_FILE_TIERS = True # 磁盘层也经由环回服务器供给 FFmpeg，所有层统一走 HTTP
+
+# === 缓存字节账本 ===
+# 按层 (RAM / SSD 缓存 / 临时输出) 记录每个任务 预留 与 实际持有 的字节数。
+# 准入时先预留 (带上限、原子判断)，IO 完成后按真实大小转为持有，释放数据时同步注销，
+# 因此账面与 GLOBAL_RAM_STORAGE 等真实内容不会漂移
+LEDGER_TIERS = ("RAM", "SSD_CACHE", "TEMP")
+
+class ByteLedger:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reserved = {t: {} for t in LEDGER_TIERS}
+        self.held = {t: {} for t in LEDGER_TIERS}
+
+    # 预留成功返回 True；同一任务已在该层有记录时直接视为成功
+    def reserve(self, tier, key, nbytes, limit=None):
+        with self.lock:
+            if key in self.reserved[tier] or key in self.held[tier]: return True
+            if limit is not None and self._used(tier) + nbytes > limit: return False
+            self.reserved[tier][key] = nbytes
+            return True
+
+    # 预留转为持有，记录真实字节数
+    def commit(self, tier, key, nbytes):
+        with self.lock:
+            self.reserved[tier].pop(key, None)
+            self.held[tier][key] = nbytes
+
+    def release(self, tier, key):
+        with self.lock:
+            self.reserved[tier].pop(key, None)
+            return self.held[tier].pop(key, None)
+
+    def clear(self, tier):
+        with self.lock:
+            self.reserved[tier].clear()
+            self.held[tier].clear()
+
+    def _used(self, tier):
+        return sum(self.reserved[tier].values()) + sum(self.held[tier].values())
+
+    def used(self, tier):
+        with self.lock: return self._used(tier)
+
+    def reserved_bytes(self, tier, exclude=None):
+        with self.lock: return sum(v for k, v in self.reserved[tier].items() if k != exclude)
+
+    def holds(self, tier, key):
+        with self.lock: return key in self.reserved[tier] or key in self.held[tier]
+
+    def keys(self, tier):
+        with self.lock: return set(self.reserved[tier]) | set(self.held[tier])
+
+    # 供界面 / 监控读取的计数器
+    def snapshot(self):
+        with self.lock:
+            return {t: {"reserved": sum(self.reserved[t].values()), "held": sum(self.held[t].values()),
+                        "entries": len(self.reserved[t]) + len(self.held[t])} for t in LEDGER_TIERS}
+
+CACHE_LEDGER = ByteLedger()
+
+def register_file_source(task_file, disk_path):
+    token = uuid.uuid4().hex
+    GLOBAL_FILE_STORAGE[token] = os.path.abspath(disk_path)
+    PATH_TO_TOKEN_MAP[task_file] = token
+    return token
+
+def release_source(task_file):
+    token = PATH_TO_TOKEN_MAP.pop(task_file, None)
+    if token:
+        buf = GLOBAL_RAM_STORAGE.pop(token, None)
+        if isinstance(buf, ProgressiveBuffer): buf.cancel() # 仍在加载时通知加载线程停止
+        GLOBAL_FILE_STORAGE.pop(token, None)
+    CACHE_LEDGER.release("RAM", task_file)
+
+# 按文件实际大小一次性预分配匿名 mmap，再用 readinto 直接读进去：
+# 磁盘 -> 内存只拷贝一次，不会像 bytearray.extend 那样反复扩容、峰值翻倍
+# target 为 ProgressiveBuffer 时写入其预分配的缓冲区，并逐块推进已加载水位
+def load_file_into_ram(src_path, file_size, on_progress=None, should_stop=None, chunk_size=64 * 1024 * 1024, target=None):
+    if target is not None: buf = target.buf
+    else: buf = mmap.mmap(-1, file_size) if file_size > 0 else bytearray()
+    view = memoryview(buf)
+    read_len = 0
+    try:
+        # buffering=0：跳过 BufferedReader，内核直接写入目标缓冲区
+        with open(src_path, 'rb', buffering=0) as f:
+            while read_len < file_size:
+                if should_stop and should_stop(): return None
+                n = f.readinto(view[read_len : min(read_len + chunk_size, file_size)])
+                if not n: break
+                read_len += n
+                if target is not None: target.advance(n)
+                if on_progress: on_progress(read_len / file_size)
+    finally:
+        view.release()
+    if target is not None:
+        # 已对外承诺了完整长度，截断的文件只能判为失败
+        if read_len < file_size:
+            target.fail()
+            return None
+        target.finish()
+        return target
+    # 文件在读取期间被截断：只暴露实际读到的部分
+    if read_len < file_size: return memoryview(buf)[:read_len]
+    return buf
+
+# === SSD 缓存拷贝引擎 ===
+# 优先走内核内拷贝 (copy_file_range，其次 sendfile)，数据不经过 Python 缓冲区、拷贝期间不持有 GIL；
+# 不支持的平台退回到页对齐的大缓冲 readinto。源文件按顺序读提示内核加大预读，
+# 拷完的区段立即 DONTNEED，避免 HDD 数据挤占页缓存。不做 fsync：缓存文件丢了重拷即可
+COPY_CHUNK = 64 * 1024 * 1024
+COPY_PROGRESS_INTERVAL = 0.25
+
+def _fadvise(fd, offset, length, advice_name):
+    advice = getattr(os, advice_name, None)
+    if advice is None or not hasattr(os, "posix_fadvise"): return
+    try: os.posix_fadvise(fd, offset, length, advice)
+    except OSError: pass
+
+# 返回已拷贝字节数；被停止时返回 None (残留的目标文件由调用方清理)
+def copy_file_fast(src_path, dst_path, file_size, on_progress=None, should_stop=None, chunk_size=COPY_CHUNK):
+    if hasattr(os, "copy_file_range"): method = "copy_file_range"
+    elif hasattr(os, "sendfile") and sys.platform.startswith("linux"): method = "sendfile"
+    else: method = "readinto"
+    copied = 0
+    last_report = 0.0
+    buf = view = None
+    with open(src_path, 'rb', buffering=0) as fsrc, open(dst_path, 'wb', buffering=0) as fdst:
+        in_fd, out_fd = fsrc.fileno(), fdst.fileno()
+        _fadvise(in_fd, 0, 0, "POSIX_FADV_SEQUENTIAL")
+        try:
+            while copied < file_size:
+                if should_stop and should_stop(): return None
+                n = min(chunk_size, file_size - copied)
+                if method == "copy_file_range":
+                    try: got = os.copy_file_range(in_fd, out_fd, n, copied, copied)
+                    except OSError: # 跨文件系统 (旧内核) / 不支持：降级
+                        method = "sendfile" if hasattr(os, "sendfile") and sys.platform.startswith("linux") else "readinto"
+                        continue
+                elif method == "sendfile":
+                    os.lseek(out_fd, copied, os.SEEK_SET)
+                    try: got = os.sendfile(out_fd, in_fd, copied, n)
+                    except OSError:
+                        method = "readinto"
+                        continue
+                else:
+                    if buf is None:
+                        buf = mmap.mmap(-1, chunk_size) # 匿名 mmap：页对齐，且只分配一次
+                        view = memoryview(buf)
+                    os.lseek(in_fd, copied, os.SEEK_SET)
+                    os.lseek(out_fd, copied, os.SEEK_SET)
+                    got = fsrc.readinto(view[:n])
+                    written = 0
+                    while written < (got or 0): written += os.write(out_fd, view[written:got])
+                if not got: break # 源文件被截断
+                _fadvise(in_fd, copied, got, "POSIX_FADV_DONTNEED")
+                copied += got
+                now = time.time()
+                if on_progress and (now - last_report >= COPY_PROGRESS_INTERVAL or copied >= file_size):
+                    last_report = now
+                    on_progress(copied / file_size)
+        finally:
+            if view is not None: view.release()
+            if buf is not None: buf.close()
+    return copied
+
+# === 渐进式内存缓存：边读边编 ===
+# 缓冲区先整体登记到环回服务器，已加载的区间立即可读，未加载的区间等待加载线程推进；
+# 已加载量达到水位即可交给编码阶段，读盘与编码重叠
+PROGRESSIVE_RAM_CACHE = True
+PROGRESSIVE_START_WATERMARK = 64 * 1024 * 1024  # 达到该水位 (或整文件读完) 即可开始编码
+PROGRESSIVE_CHUNK = 8 * 1024 * 1024            # 加载粒度：越小水位推进越平滑
+PROGRESSIVE_WAIT_TIMEOUT = 120                  # 服务端等待某个区间加载完成的上限 (秒)
+PROGRESSIVE_FAR_GAP = 256 * 1024 * 1024         # 请求位置超出水位这么远时 (如尾部 moov) 直接读源盘
+
+class ProgressiveBuffer:
+    def __init__(self, src_path, size, capacity=None):
+        self.src_path = src_path
+        self.size = size
+        capacity = size if capacity is None else capacity
+        self.buf = mmap.mmap(-1, capacity) if capacity > 0 else bytearray()
+        self.loaded = 0
+        self.done = False
+        self.failed = False
+        self.cancelled = False
+        self.cond = threading.Condition()
+        self.waiters = [] # (事件循环, future)：服务端协程的等待者
+
+    def __len__(self): return self.size
+
+    def _notify(self):
+        waiters, self.waiters = self.waiters, []
+        self.cond.notify_all()
+        for loop, fut in waiters:
+            try: loop.call_soon_threadsafe(lambda f=fut: f.done() or f.set_result(None))
+            except RuntimeError: pass # 事件循环已关闭
+
+    def advance(self, n):
+        with self.cond:
+            self.loaded += n
+            self._notify()
+
+    def finish(self):
+        with self.cond:
+            self.done = True
+            self._notify()
+
+    def fail(self):
+        with self.cond:
+            self.failed = True
+            self._notify()
+
+    def cancel(self):
+        with self.cond:
+            self.cancelled = True
+            self._notify()
+
+    # 协程内等待 [0, end) 加载完成；失败/取消/超时返回 False
+    async def wait_loaded(self, end, timeout):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            with self.cond:
+                if self.loaded >= end: return True
+                if self.failed or self.cancelled: return False
+                fut = loop.create_future()
+                self.waiters.append((loop, fut))
+            remaining = deadline - loop.time()
+            if remaining <= 0: return False
+            try: await asyncio.wait_for(fut, remaining)
+            except asyncio.TimeoutError: return False
+
+# === 滑动窗口内存环 (超过 MAX_RAM_LOAD_GB 的大文件) ===
+# 只在内存中保留 FFmpeg 当前读取位置附近 RING_WINDOW_BYTES 的数据：加载线程顺序预读，
+# 读取位置之前的旧数据被覆盖；窗口之外的远距离跳转直接从源盘读取，
+# 连续落在窗口外的读取超过阈值时把窗口整体迁移过去
+RING_BUFFER_MODE = True
+RING_WINDOW_BYTES = int(min(1.0, MAX_RAM_LOAD_GB / 4) * 1024**3)
+RING_REBASE_BYTES = 64 * 1024 * 1024
+
+class RingWindowBuffer(ProgressiveBuffer):
+    def __init__(self, src_path, size, window=RING_WINDOW_BYTES):
+        super().__init__(src_path, size, capacity=window)
+        self.window = window
+        self.base = 0         # 窗口内最早的有效偏移
+        self.read_pos = 0     # 读取方当前位置：加载线程不会覆盖它之后的数据
+        self.rebase_to = None
+        self.miss_end = -1
+        self.miss_bytes = 0
+
+    # 窗口内返回数据拷贝；需要走源盘时返回 None
+    async def read_chunk(self, start, end):
+        while True:
+            with self.cond:
+                if self.failed or self.cancelled: raise ConnectionError("内存环已释放")
+                if self.base <= start and end <= self.loaded:
+                    self.read_pos = end
+                    self.miss_bytes = 0
+                    self.cond.notify_all() # 读取位置前进，唤醒等待腾出窗口的加载线程
+                    # 在锁内拷贝：加载线程推进 base 之前必须拿到同一把锁，已拷贝的数据不会被覆盖
+                    w = self.window
+                    a, b = start % w, (end - 1) % w + 1
+                    if a < b: return bytes(self.buf[a:b])
+                    return bytes(self.buf[a:w]) + bytes(self.buf[:b])
+                if start < self.base or start > self.loaded + PROGRESSIVE_FAR_GAP:
+                    # 窗口外：连续的窗口外读取累计超过阈值说明读取位置已经转移，让窗口跟过去
+                    self.miss_bytes = self.miss_bytes + (end - start) if start == self.miss_end else end - start
+                    self.miss_end = end
+                    if self.miss_bytes >= RING_REBASE_BYTES:
+                        self.rebase_to = end
+                        self.read_pos = end
+                        self.miss_bytes = 0
+                        self._notify()
+                    return None
+                self.read_pos = start
+                self._notify() # 让等待中的加载线程继续推进
+            if not await self.wait_loaded(end, PROGRESSIVE_WAIT_TIMEOUT): raise ConnectionError("内存环加载超时")
+
+    # 加载线程主循环：一直运行到任务释放 (cancel) 或停止
+    def run_loader(self, should_stop, on_progress=None, chunk_size=PROGRESSIVE_CHUNK):
+        view = memoryview(self.buf)
+        try:
+            with open(self.src_path, 'rb', buffering=0) as f:
+                while not (should_stop and should_stop()):
+                    with self.cond:
+                        if self.cancelled: return True
+                        if self.rebase_to is not None:
+                            self.base = self.loaded = min(self.rebase_to, self.size)
+                            self.rebase_to = None
+                            self._notify()
+                        if self.loaded >= self.size:
+                            self.done = True
+                            self.cond.wait(0.5) # 读完后保持窗口，等待回跳迁移或释放
+                            continue
+                        pos = self.loaded
+                        n = min(chunk_size, self.size - pos, self.window - pos % self.window)
+                        new_base = max(self.base, pos + n - self.window)
+                        if new_base > self.read_pos:
+                            self.cond.wait(0.5) # 窗口已满：等读取方前进
+                            continue
+                        self.base = new_base
+                    f.seek(pos)
+                    got = f.readinto(view[pos % self.window : pos % self.window + n])
+                    if not got:
+                        self.fail()
+                        return False
+                    with self.cond:
+                        if self.rebase_to is None and self.loaded == pos:
+                            self.loaded = pos + got
+                            self._notify()
+                    if on_progress: on_progress(self.loaded / self.size)
+            return False
+        except Exception as e:
+            print(f"[Ring] 加载失败 {os.path.basename(self.src_path)}: {e}")
+            self.fail()
+            return False
+        finally:
+            view.release()
+
+# === 预读流水线 ===
+PREFETCH_DEPTH = 2          # 除空闲编码通道外，额外保持就绪/加载中的文件数
+PREFETCH_SCAN_LIMIT = 64    # 每轮最多向后查看的待处理文件数 (跳过设备正忙的文件)
+IO_MAX_PARALLEL = 8         # IO 线程上限 (实际并发 = 空闲设备数)
+SSD_FREE_RESERVE_GB = 2.0   # 缓存池至少保留的剩余空间
+
+# === 自适应并发 (爬山法)：用户选择的通道数是上限，实际同时编码数按实测吞吐调整 ===
+ADAPTIVE_CONCURRENCY = True
+CONCURRENCY_INTERVAL = 20.0   # 每个决策窗口的时长 (秒)
+CONCURRENCY_MIN_SAMPLES = 5   # 窗口内通道跑满的采样数不足时不做判断
+CONCURRENCY_TOLERANCE = 0.05  # 吞吐变化在该比例内视为持平
+CONCURRENCY_REPROBE = 6       # 收敛后保持多少个窗口再重新探测
+CPU_SATURATION = 0.92         # CPU 利用率超过该值时不再增加通道
+IOWAIT_LIMIT = 0.25           # iowait 占比超过该值说明瓶颈在磁盘，减少通道
+
+class ConcurrencyController:
+    def __init__(self, max_workers, min_workers=1, start=None, log=None):
+        self.max_workers = max(1, max_workers)
+        self.min_workers = max(1, min(min_workers, self.max_workers))
+        self.limit = self.max_workers if start is None else max(self.min_workers, min(start, self.max_workers))
+        self.log = log or (lambda d: print(f"[Concurrency] {d}"))
+        self.perf = {}        # 档位 -> 该档位最近一次测得的总 fps
+        self.prev = None      # 探测中：移动前的档位
+        self.path = {}        # 本轮探测经过的档位 -> fps
+        self.direction = -1
+        self.hold = 0
+        self.samples = []
+        self.window_start = time.time()
+        self.cpu_mark = read_cpu_times()
+
+    def _can_move(self, m, cpu):
+        if not self.min_workers <= m <= self.max_workers or m == self.limit: return False
+        return m < self.limit or cpu is None or cpu < CPU_SATURATION
+
+    # 由引擎循环定期调用：live_fps 为各运行中 FFmpeg 的实时 fps，started 为它们开始输出进度的时间。
+    # 不同文件的 fps 不可比：窗口内有任务刚换上 (还在它的第一个窗口里) 时不采样，只比较同一批任务跑满整窗的吞吐
+    def tick(self, live_fps, started=()):
+        now = time.time()
+        warming = any(t > self.window_start for t in started)
+        if live_fps and len(live_fps) >= self.limit and not warming: self.samples.append(sum(live_fps))
+        if now - self.window_start < CONCURRENCY_INTERVAL: return self.limit
+        cpu_now = read_cpu_times()
+        cpu = iowait = None
+        if self.cpu_mark and cpu_now and cpu_now[2] > self.cpu_mark[2]:
+            dt = cpu_now[2] - self.cpu_mark[2]
+            cpu, iowait = (cpu_now[0] - self.cpu_mark[0]) / dt, (cpu_now[1] - self.cpu_mark[1]) / dt
+        samples = self.samples
+        self.samples, self.window_start, self.cpu_mark = [], now, cpu_now
+        if len(samples) < CONCURRENCY_MIN_SAMPLES: return self.limit # 队列不足以占满通道：没有可比性
+        n = self.limit
+        fps = sum(samples) / len(samples)
+        self.perf[n] = fps
+        target, reason = n, "settled"
+        if iowait is not None and iowait > IOWAIT_LIMIT and n > self.min_workers:
+            target, reason = n - 1, "io_wait"
+            self.prev, self.hold = None, CONCURRENCY_REPROBE
+        elif self.prev is not None:
+            self.path[n] = fps
+            best = max(self.path.values())
+            prev_fps = self.perf.get(self.prev, 0.0)
+            better = fps > prev_fps * (1 + CONCURRENCY_TOLERANCE)
+            flat = not better and fps >= best * (1 - CONCURRENCY_TOLERANCE)
+            # 变好则沿原方向继续；向下探测时持平且每个进程的吞吐确实提高才继续往下试
+            down_flat = flat and self.direction < 0 and fps / n > prev_fps / self.prev
+            if (better or down_flat) and self._can_move(n + self.direction, cpu):
+                target, reason = n + self.direction, "improved" if better else "flat"
+                self.prev = n
+            else:
+                # 收敛：回到本轮探测中实测吞吐最高的档位 (同分取进程少的)，不会停在已知更差的档位
+                target = max(self.path, key=lambda m: (self.path[m], -m))
+                reason = "worse" if fps < best * (1 - CONCURRENCY_TOLERANCE) else "converged"
+                self.prev, self.hold = None, CONCURRENCY_REPROBE
+        elif self.hold > 0: self.hold -= 1
+        else:
+            self.direction = 1 if self._can_move(n + 1, cpu) else -1
+            if self._can_move(n + self.direction, cpu):
+                target, reason = n + self.direction, "probe_up" if self.direction > 0 else "probe_down"
+                self.prev, self.path = n, {n: fps}
+        self.limit = target
+        self.log({"ts": round(now, 3), "workers": n, "next": target, "reason": reason, "fps": round(fps, 2),
+                  "cpu": None if cpu is None else round(cpu, 3), "iowait": None if iowait is None else round(iowait, 3)})
+        return target
+
+# === CPU 分区：并发的软件编码各自绑定一组物理核，避免每个 FFmpeg 都按全核开线程互相抢占 ===
+CPU_AFFINITY = hasattr(os, "sched_setaffinity")
+TASKSET_PATH = shutil.which("taskset") if CPU_AFFINITY else None
+
+# 绑定方式：优先给命令加 taskset 前缀 (exec 之前生效，FFmpeg 的所有线程都继承)；
+# 没有 taskset 时在 Popen 之后设置主线程亲和性。不用 preexec_fn：本进程有 Tk、线程池与环回服务器线程，
+# fork 之后再执行 Python 代码可能死锁
+def affinity_prefix(cpus):
+    if not cpus or not TASKSET_PATH: return []
+    return [TASKSET_PATH, "-c", ",".join(str(c) for c in sorted(cpus))]
+
+def pin_process(proc, cpus):
+    if not cpus or TASKSET_PATH or not CPU_AFFINITY: return
+    try: os.sched_setaffinity(proc.pid, cpus)
+    except OSError: pass # 进程已退出或 CPU 集合不可用：不绑定照常运行
+
+# === PIPE 源模式：内存缓存经 stdin 直接喂给 FFmpeg，绕开 HTTP 环回 ===
+PIPE_SOURCE_MODE = True
+PIPE_WRITE_CHUNK = 4 * 1024 * 1024
+RAM_TIER_MODES = ("RAM", "PIPE", "RING")
+
+def _mp4_has_child(buf, start, end, box_type):
+    pos = start
+    while pos + 8 <= end:
+        size = int.from_bytes(buf[pos:pos + 4], "big")
+        if bytes(buf[pos + 4:pos + 8]) == box_type: return True
+        if size < 8: return False
+        pos += size
+    return False
+
+# 只有无需回头 seek 的容器才能顺序喂给 stdin：TS、MKV、分片 MP4 (moov 内含 mvex 或出现 moof)
+def is_streamable_container(path, buf):
+    ext = os.path.splitext(path)[1].lower()
+    n = len(buf)
+    if ext == ".ts":
+        return (n > 376 and buf[0] == 0x47 and buf[188] == 0x47) or (n > 392 and buf[4] == 0x47 and buf[196] == 0x47)
+    if ext == ".mkv": return bytes(buf[:4]) == b"\x1a\x45\xdf\xa3"
+    if ext in (".mp4", ".mov"):
+        pos = 0
+        while pos + 8 <= n:
+            size = int.from_bytes(buf[pos:pos + 4], "big")
+            box_type = bytes(buf[pos + 4:pos + 8])
+            header = 8
+            if size == 1 and pos + 16 <= n:
+                size = int.from_bytes(buf[pos + 8:pos + 16], "big")
+                header = 16
+            elif size == 0: size = n - pos
+            if size < header: return False
+            if box_type == b"moof": return True
+            if box_type == b"moov": return _mp4_has_child(buf, pos + header, min(pos + size, n), b"mvex")
+            if box_type == b"mdat": return False # moov 在 mdat 之后，需要 seek
+            pos += size
+    return False
+
+# === FFmpeg -progress 解析：按块读取，只取需要的键，积压的旧进度块直接跳过 ===
+PROGRESS_READ_SIZE = 65536
+PROGRESS_KEYS = {b"out_time_us": int, b"total_size": int, b"fps": float, b"speed": lambda v: float(v.rstrip(b"x"))}
+
+# 每次读到至少一个完整的进度块 (以 progress= 行结束) 时产出最新一块的字段
+def iter_progress_blocks(stream):
+    fd = stream.fileno()
+    carry = b""
+    while True:
+        try: chunk = os.read(fd, PROGRESS_READ_SIZE)
+        except InterruptedError: continue
+        except OSError: break
+        if not chunk: break
+        data = carry + chunk
+        last = data.rfind(b"progress=")
+        line_end = data.find(b"\n", last) if last >= 0 else -1
+        if line_end < 0:
+            # 还没有完整的进度块：只保留最后一段，防止异常输出无限堆积
+            carry = data[-PROGRESS_READ_SIZE:]
+            continue
+        prev = data.rfind(b"progress=", 0, last)
+        start = data.find(b"\n", prev) + 1 if prev >= 0 else 0
+        block = {"end": data[last + 9:line_end].strip() == b"end"}
+        for line in data[start:last].split(b"\n"):
+            key, _, val = line.partition(b"=")
+            conv = PROGRESS_KEYS.get(key.strip())
+            if conv is None: continue
+            try: block[key.strip().decode()] = conv(val.strip())
+            except ValueError: pass # 开头几块可能是 N/A
+        carry = data[line_end + 1:]
+        yield block
+
+def feed_stdin_from_buffer(proc, buf, should_stop=None):
+    # 逐块写 memoryview 切片，不产生整段拷贝；FFmpeg 退出时 BrokenPipe 直接结束
+    view = memoryview(buf)
+    try:
+        for offset in range(0, len(view), PIPE_WRITE_CHUNK):
+            if should_stop and should_stop(): break
+            proc.stdin.write(view[offset : offset + PIPE_WRITE_CHUNK])
+    except (BrokenPipeError, OSError, ValueError): pass
+    finally:
+        view.release()
+        try: proc.stdin.close()
+        except: pass
+
+# === Range 引擎 (RFC 7233)：单段 / 多段 / 后缀区间、越界截断、If-Range ===
+MULTIPART_BOUNDARY = "CINETICO_BYTERANGES"
+MAX_RANGE_PARTS = 32
+
+def make_etag(token, file_size):
+    # 同一个 token 的内容在生命周期内不会变化，token + 大小即可作为强校验器
+    return f'"{token}-{file_size}"'
+
+def parse_byte_ranges(header, file_size):
+    """解析 Range 头。返回 None 表示忽略 (按整文件 200 返回)，
+    返回 [] 表示没有可满足的区间 (416)，否则返回 [(start, end), ...] (end 为闭区间)"""
+    unit, sep, spec = header.partition("=")
+    if not sep or unit.strip().lower() != "bytes": return None
+    ranges = []
+    parts = [p.strip() for p in spec.split(",") if p.strip()]
+    if not parts or len(parts) > MAX_RANGE_PARTS: return None
+    for part in parts:
+        start_str, dash, end_str = part.partition("-")
+        start_str, end_str = start_str.strip(), end_str.strip()
+        if not dash or not (start_str.isdigit() or (not start_str and end_str.isdigit())): return None
+        if end_str and not end_str.isdigit(): return None
+        if not start_str:
+            # 后缀区间 bytes=-N：最后 N 个字节
+            suffix = int(end_str)
+            if suffix == 0 or file_size == 0: continue
+            ranges.append((max(0, file_size - suffix), file_size - 1))
+            continue
+        start = int(start_str)
+        if end_str and int(end_str) < start: return None # 语法无效，整个头忽略
+        if start >= file_size: continue # 该段不可满足
+        end = min(int(end_str), file_size - 1) if end_str else file_size - 1
+        ranges.append((start, end))
+    return ranges
+
+def plan_range_response(token, file_size, range_header=None, if_range=None, content_type="video/mp4"):
+    """根据请求头算出响应。返回 (status, headers, body)，
+    body 是一个列表，元素为 bytes (multipart 分隔头) 或 (offset, length) 数据段"""
+    etag = make_etag(token, file_size)
+    headers = [("Accept-Ranges", "bytes"), ("ETag", etag)]
+    ranges = None
+    # If-Range 不匹配 (或是日期形式) 时必须返回完整内容
+    if range_header and (if_range is None or if_range.strip() == etag):
+        ranges = parse_byte_ranges(range_header, file_size)
+    if ranges is None:
+        headers += [("Content-Type", content_type), ("Content-Length", str(file_size))]
+        return HTTPStatus.OK, headers, [(0, file_size)] if file_size else []
+    if not ranges:
+        headers += [("Content-Range", f"bytes */{file_size}"), ("Content-Length", "0")]
+        return HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE, headers, []
+    if len(ranges) == 1:
+        start, end = ranges[0]
+        headers += [("Content-Type", content_type), ("Content-Range", f"bytes {start}-{end}/{file_size}"),
+                    ("Content-Length", str(end - start + 1))]
+        return HTTPStatus.PARTIAL_CONTENT, headers, [(start, end - start + 1)]
+    body = []
+    total = 0
+    for start, end in ranges:
+        part_head = (f"\r\n--{MULTIPART_BOUNDARY}\r\nContent-Type: {content_type}\r\n"
+                     f"Content-Range: bytes {start}-{end}/{file_size}\r\n\r\n").encode("ascii")
+        body += [part_head, (start, end - start + 1)]
+        total += len(part_head) + end - start + 1
+    tail = f"\r\n--{MULTIPART_BOUNDARY}--\r\n".encode("ascii")
+    body.append(tail)
+    total += len(tail)
+    headers += [("Content-Type", f"multipart/byteranges; boundary={MULTIPART_BOUNDARY}"), ("Content-Length", str(total))]
+    return HTTPStatus.PARTIAL_CONTENT, headers, body
+
+# === 指标导出：Prometheus 文本格式，由环回服务器的 /metrics 提供 ===
+METRICS_PATH = "metrics"
+METRICS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+GPU_METRICS_TTL = 5.0   # nvidia-smi 查询结果的缓存时间，避免每次抓取都起子进程
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+class MetricsRegistry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.meta = {}        # 指标名 -> (类型, 说明)
+        self.counters = {}    # (指标名, 标签元组) -> 累计值
+        self.collectors = []  # 抓取时调用，产出 (指标名, 类型, 说明, 标签, 数值)
+
+    def describe(self, name, kind, help_text):
+        self.meta[name] = (kind, help_text)
+
+    def inc(self, name, n=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock: self.counters[key] = self.counters.get(key, 0) + n
+
+    def register(self, collector):
+        with self.lock:
+            if collector not in self.collectors: self.collectors.append(collector)
+
+    def render(self):
+        families = OrderedDict()
+        with self.lock:
+            counters = list(self.counters.items())
+            collectors = list(self.collectors)
+        for (name, labels), value in counters:
+            families.setdefault(name, [self.meta.get(name, ("counter", ""))]).append((dict(labels), value))
+        for collector in collectors:
+            try:
+                for name, kind, help_text, labels, value in collector():
+                    families.setdefault(name, [(kind, help_text)]).append((labels, value))
+            except Exception as e: print(f"[Metrics] 采集失败: {e}")
+        lines = []
+        for name, (meta, *samples) in families.items():
+            kind, help_text = meta
+            if help_text: lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                label_str = ",".join(f'{k}="{_escape_label(v)}"' for k, v in labels.items())
+                lines.append(f"{name}{{{label_str}}} {value}" if label_str else f"{name} {value}")
+        return ("\n".join(lines) + "\n").encode("utf-8")
+
+METRICS = MetricsRegistry()
+METRICS.describe("cinetico_loopback_requests_total", "counter", "Loopback HTTP requests by source tier")
+METRICS.describe("cinetico_loopback_bytes_total", "counter", "Bytes served by the loopback server by source tier")
+METRICS.describe("cinetico_ffmpeg_runs_total", "counter", "Finished ffmpeg processes by result")
+METRICS.describe("cinetico_ffmpeg_retries_total", "counter", "Encodes re-run after a failed attempt, by reason")
+METRICS.describe("cinetico_tasks_finished_total", "counter", "Tasks reaching a terminal state")
+
+_GPU_CACHE = {"ts": 0.0, "samples": []}
+GPU_QUERY_FIELDS = (("utilization.gpu", "cinetico_gpu_utilization_percent", "GPU core utilization"),
+                    ("utilization.encoder", "cinetico_gpu_encoder_utilization_percent", "NVENC utilization"),
+                    ("utilization.decoder", "cinetico_gpu_decoder_utilization_percent", "NVDEC utilization"),
+                    ("memory.used", "cinetico_gpu_memory_used_mib", "GPU memory in use (MiB)"),
+                    ("temperature.gpu", "cinetico_gpu_temperature_celsius", "GPU temperature"))
+
+# NVIDIA 显卡状态 (没有 nvidia-smi 时为空)
+def collect_gpu_metrics():
+    now = time.monotonic()
+    if now - _GPU_CACHE["ts"] < GPU_METRICS_TTL: return _GPU_CACHE["samples"]
+    samples = []
+    try:
+        query = ",".join(["index"] + [f for f, _, _ in GPU_QUERY_FIELDS])
+        out = subprocess.check_output(["nvidia-smi", f"--query-gpu={query}", "--format=csv,noheader,nounits"],
+                                      encoding="utf-8", stderr=subprocess.DEVNULL, timeout=5, **get_subprocess_args())
+        for line in out.strip().splitlines():
+            vals = [v.strip() for v in line.split(",")]
+            for (_, name, help_text), val in zip(GPU_QUERY_FIELDS, vals[1:]):
+                try: samples.append((name, "gauge", help_text, {"gpu": vals[0]}, float(val)))
+                except ValueError: pass
+    except: pass
+    _GPU_CACHE.update(ts=now, samples=samples)
+    return samples
+
+METRICS.register(collect_gpu_metrics)
+
+# === 异步环回服务器 ===
+# 单线程 asyncio 事件循环服务所有 token，支持 HTTP/1.1 keep-alive：
+# ffmpeg 拖动/探测时的大量 Range 请求复用同一条 TCP 连接，不再一请求一线程一握手
+LOOPBACK_WRITE_CHUNK = 1024 * 1024 # 内存层按块写出，避免整段切片被复制进传输层缓冲
+LOOPBACK_IDLE_TIMEOUT = 60
+LOOPBACK_MAX_HEADERS = 100
+
+# metrics_only：对外监听时只提供 /metrics，视频数据始终只走 127.0.0.1
+class GlobalRamServer:
+    def __init__(self, host='127.0.0.1', port=0, metrics_only=False):
+        self.host = host
+        self.port = port
+        self.metrics_only = metrics_only
+        self.loop = None
+        self.server = None
+        self._ready = threading.Event()
+
+    def start(self):
+        threading.Thread(target=self._run, daemon=True).start()
+        self._ready.wait()
+        return self.port
+
+    def _run(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.server = self.loop.run_until_complete(asyncio.start_server(self._handle_client, self.host, self.port))
+        self.port = self.server.sockets[0].getsockname()[1]
+        self._ready.set()
+        self.loop.run_forever()
+
+    def shutdown(self):
+        if self.loop: self.loop.call_soon_threadsafe(self.loop.stop)
+
+    async def _handle_client(self, reader, writer):
+        writer.transport.set_write_buffer_limits(high=4 * LOOPBACK_WRITE_CHUNK)
+        try:
+            while True:
+                try: request_line = await asyncio.wait_for(reader.readline(), LOOPBACK_IDLE_TIMEOUT)
+                except asyncio.TimeoutError: break
+                if not request_line: break
+                parts = request_line.decode("latin-1").split()
+                if len(parts) != 3:
+                    await self._send_simple(writer, HTTPStatus.BAD_REQUEST, False)
+                    break
+                method, target, version = parts
+                headers = {}
+                lines = 0
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""): break
+                    lines += 1
+                    if lines > LOOPBACK_MAX_HEADERS: break
+                    k, _, v = line.decode("latin-1").partition(":")
+                    headers[k.strip().lower()] = v.strip()
+                if lines > LOOPBACK_MAX_HEADERS:
+                    # 剩余头部没有读完，连接无法继续按请求边界解析：回应后关闭
+                    await self._send_simple(writer, HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE, False)
+                    break
+                conn = headers.get("connection", "").lower()
+                keep_alive = (version == "HTTP/1.1" and conn != "close") or (version == "HTTP/1.0" and conn == "keep-alive")
+                body_len = int(headers.get("content-length", "0") or 0)
+                if body_len: await reader.readexactly(body_len)
+                if method not in ("GET", "HEAD"):
+                    await self._send_simple(writer, HTTPStatus.METHOD_NOT_ALLOWED, keep_alive, [("Allow", "GET, HEAD")])
+                else:
+                    await self._serve(writer, method, target.split("?", 1)[0].lstrip("/"), headers, keep_alive)
+                if not keep_alive: break
+        except (ConnectionError, asyncio.IncompleteReadError): pass
+        except Exception as e:
+            print(f"Global Server Error: {e}")
+        finally:
+            try: writer.close()
+            except: pass
+
+    def _write_head(self, writer, status, headers, keep_alive):
+        lines = [f"HTTP/1.1 {status.value} {status.phrase}"]
+        lines += [f"{k}: {v}" for k, v in headers]
+        lines.append("Connection: keep-alive" if keep_alive else "Connection: close")
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+
+    async def _send_simple(self, writer, status, keep_alive, extra=()):
+        body = f"{status.value} {status.phrase}".encode("ascii")
+        self._write_head(writer, status, [("Content-Type", "text/plain"), ("Content-Length", str(len(body))), *extra], keep_alive)
+        writer.write(body)
+        await writer.drain()
+
+    async def _serve_metrics(self, writer, method, keep_alive):
+        body = await self.loop.run_in_executor(None, METRICS.render) # 采集里有 nvidia-smi 子进程，不阻塞事件循环
+        self._write_head(writer, HTTPStatus.OK, [("Content-Type", METRICS_CONTENT_TYPE), ("Content-Length", str(len(body)))], keep_alive)
+        if method == "GET": writer.write(body)
+        await writer.drain()
+
+    async def _serve(self, writer, method, token, headers, keep_alive):
+        if token == METRICS_PATH: return await self._serve_metrics(writer, method, keep_alive)
+        if self.metrics_only:
+            await self._send_simple(writer, HTTPStatus.NOT_FOUND, keep_alive)
+            return
+        src_file = None
+        far_file = None # 窗口外 / 远离加载水位的区间从源盘发送，同一请求内只打开一次
+        try:
+            video_data = GLOBAL_RAM_STORAGE.get(token)
+            if video_data is not None: file_size = len(video_data)
+            elif token in GLOBAL_FILE_STORAGE:
+                src_file = open(GLOBAL_FILE_STORAGE[token], 'rb')
+                file_size = os.fstat(src_file.fileno()).st_size
+            else:
+                await self._send_simple(writer, HTTPStatus.NOT_FOUND, keep_alive)
+                return
+            if src_file: tier = "file"
+            elif isinstance(video_data, RingWindowBuffer): tier = "ring"
+            elif isinstance(video_data, ProgressiveBuffer): tier = "progressive"
+            else: tier = "ram"
+            METRICS.inc("cinetico_loopback_requests_total", tier=tier, method=method)
+            status, resp_headers, body = plan_range_response(token, file_size, headers.get("range"), headers.get("if-range"))
+            self._write_head(writer, status, resp_headers, keep_alive)
+            # HEAD：ffmpeg 探测时只拿头信息，不再触发整文件 GET
+            if method == "HEAD":
+                await writer.drain()
+                return
+            for item in body:
+                if isinstance(item, bytes):
+                    writer.write(item)
+                    continue
+                offset, length = item
+                if src_file:
+                    # 磁盘层：loop.sendfile 底层走 os.sendfile / TransmitFile，由内核完成拷贝
+                    await writer.drain()
+                    await self.loop.sendfile(writer.transport, src_file, offset, length)
+                elif isinstance(video_data, RingWindowBuffer):
+                    end = offset + length
+                    while offset < end:
+                        chunk_end = min(offset + LOOPBACK_WRITE_CHUNK, end)
+                        data = await video_data.read_chunk(offset, chunk_end)
+                        if data is None:
+                            # 窗口外的区间：从源盘发送
+                            await writer.drain()
+                            if far_file is None: far_file = open(video_data.src_path, 'rb')
+                            await self.loop.sendfile(writer.transport, far_file, offset, chunk_end - offset)
+                        else: writer.write(data)
+                        offset = chunk_end
+                        await writer.drain()
+                else:
+                    progressive = isinstance(video_data, ProgressiveBuffer)
+                    view = memoryview(video_data.buf if progressive else video_data)
+                    end = offset + length
+                    while offset < end:
+                        chunk_end = min(offset + LOOPBACK_WRITE_CHUNK, end)
+                        if progressive and video_data.loaded < chunk_end:
+                            if offset - video_data.loaded > PROGRESSIVE_FAR_GAP:
+                                # 远离加载水位的区间 (如文件尾部的 moov)：直接从源盘发送，不等顺序加载
+                                await writer.drain()
+                                if far_file is None: far_file = open(video_data.src_path, 'rb')
+                                await self.loop.sendfile(writer.transport, far_file, offset, end - offset)
+                                break
+                            if not await video_data.wait_loaded(chunk_end, PROGRESSIVE_WAIT_TIMEOUT):
+                                raise ConnectionError("渐进缓存加载失败")
+                        writer.write(view[offset : chunk_end])
+                        offset = chunk_end
+                        await writer.drain()
+                METRICS.inc("cinetico_loopback_bytes_total", length, tier=tier)
+            await writer.drain()
+        finally:
+            if src_file: src_file.close()
+            if far_file: far_file.close()
+
+def start_global_server():
+    server = GlobalRamServer()
+    port = server.start()
+    print(f"[Core] Global Memory Server started on port {port}")
+    return server, port
+
+# 供远程抓取的独立监听 (只暴露 /metrics)
+def start_metrics_server(host, port):
+    server = GlobalRamServer(host, port, metrics_only=True)
+    port = server.start()
+    print(f"[Metrics] 指标服务监听 http://{host}:{port}/{METRICS_PATH}")
+    return server, port
+
+# 事件驱动调度器：工作线程上报状态迁移，引擎在条件变量上等待
+# 每个状态维护一个有序集合 + 计数，派发只看队首，代价 O(1)，不再每 0.1s 全表扫描
+SCHED_STATES = (STATE_PENDING, STATE_QUEUED_IO, STATE_CACHING, STATE_READY, STATE_ENCODING, STATE_DONE, STATE_ERROR)
+
+class TaskScheduler:
+    def __init__(self):
+        self.cond = threading.Condition(threading.RLock())
+        self.version = 0 # 每次迁移 / 唤醒递增：引擎据此判断锁外探测期间是否错过了通知
+        self.state_of = {}
+        self.buckets = {s: OrderedDict() for s in SCHED_STATES}
+
+    def reset(self, items):
+        with self.cond:
+            self.state_of.clear()
+            for b in self.buckets.values(): b.clear()
+            for path, state in items: self._put(path, state)
+            self._changed()
+
+    def _put(self, path, state):
+        self.state_of[path] = state
+        self.buckets[state][path] = None
+
+    def add(self, path, state=STATE_PENDING):
+        with self.cond:
+            if path in self.state_of: return
+            self._put(path, state)
+            self._changed()
+
+    def set_state(self, path, state):
+        with self.cond:
+            old = self.state_of.get(path)
+            if old == state: return
+            if old is not None: self.buckets[old].pop(path, None)
+            self._put(path, state)
+            self._changed()
+
+    def _changed(self):
+        self.version += 1
+        self.cond.notify_all()
+
+    def state(self, path):
+        with self.cond: return self.state_of.get(path)
+
+    def count(self, *states):
+        with self.cond: return sum(len(self.buckets[s]) for s in states)
+
+    def peek(self, state, limit):
+        with self.cond:
+            out = []
+            for p in self.buckets[state]:
+                if len(out) >= limit: break
+                out.append(p)
+            return out
+
+    def first(self, state):
+        with self.cond:
+            bucket = self.buckets[state]
+            return next(iter(bucket)) if bucket else None
+
+    def unfinished(self):
+        with self.cond:
+            return len(self.state_of) - len(self.buckets[STATE_DONE]) - len(self.buckets[STATE_ERROR])
+
+    def reorder(self, ordered_paths):
+        # 队列重新排序后，让待处理集合跟随新的顺序
+        with self.cond:
+            pending = self.buckets[STATE_PENDING]
+            if not pending: return
+            ordered = OrderedDict((p, None) for p in ordered_paths if p in pending)
+            for p in pending: ordered.setdefault(p, None)
+            self.buckets[STATE_PENDING] = ordered
+
+    def wait(self, timeout=None):
+        with self.cond: self.cond.wait(timeout)
+
+    def wake(self):
+        with self.cond: self._changed()
+
+# === 任务阶段时间线：单调时钟计时，每个任务一条记录，批次结束写成 JSONL 与输出文件放在一起 ===
+TIMELINE_PREFIX = "Cinetico_Timeline_"
+TIMELINE_KEEP = 20  # 同一目录中最多保留的批次时间线文件数
+
+def percentile(sorted_vals, q):
+    if not sorted_vals: return 0.0
+    return sorted_vals[min(len(sorted_vals) - 1, max(0, int(round(q * len(sorted_vals) + 0.5)) - 1))]
+
+class TaskTimeline:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.t0 = time.monotonic()
+            self.wall0 = time.time()
+            self.spans = {}   # 路径 -> [阶段记录]
+            self.marks = {}   # 路径 -> {标记名: 单调时间}
+
+    def mark(self, path, name):
+        with self.lock: self.marks.setdefault(path, {})[name] = time.monotonic()
+
+    def mark_of(self, path, name, default=None):
+        with self.lock: return self.marks.get(path, {}).get(name, default)
+
+    def record(self, path, stage, start, end=None, nbytes=0):
+        end = time.monotonic() if end is None else end
+        dur = max(0.0, end - start)
+        span = {"stage": stage, "start": round(start - self.t0, 4), "end": round(end - self.t0, 4), "dur": round(dur, 4)}
+        if nbytes:
+            span["bytes"] = int(nbytes)
+            if dur > 0: span["bytes_per_s"] = int(nbytes / dur)
+        with self.lock: self.spans.setdefault(path, []).append(span)
+
+    # with timeline.measure(path, "encode") as span: ... span["bytes"] = n
+    @contextmanager
+    def measure(self, path, stage):
+        span = {"bytes": 0}
+        start = time.monotonic()
+        try: yield span
+        finally: self.record(path, stage, start, nbytes=span["bytes"])
+
+    def durations(self):
+        out = {}
+        with self.lock:
+            for spans in self.spans.values():
+                for span in spans: out.setdefault(span["stage"], []).append(span["dur"])
+        return out
+
+    # 关键路径：最后结束的任务决定了批次时长，取它耗时最长的阶段
+    def critical_path(self):
+        with self.lock:
+            if not self.spans: return None
+            path, spans = max(self.spans.items(), key=lambda kv: max(s["end"] for s in kv[1]))
+            per_stage = {}
+            for span in spans: per_stage[span["stage"]] = per_stage.get(span["stage"], 0.0) + span["dur"]
+        stage = max(per_stage, key=per_stage.get)
+        return {"file": path, "end": max(s["end"] for s in spans), "stage": stage, "stage_dur": per_stage[stage], "stages": per_stage}
+
+    def write_jsonl(self, directory, states=None):
+        if not directory: return None
+        out_path = os.path.join(directory, f"{TIMELINE_PREFIX}{time.strftime('%Y%m%d_%H%M%S', time.localtime(self.wall0))}.jsonl")
+        with self.lock: spans = {p: list(v) for p, v in self.spans.items()}
+        try:
+            with open(out_path, "w", encoding="utf-8") as f:
+                f.write(json.dumps({"type": "batch", "started": round(self.wall0, 3), "duration": round(time.monotonic() - self.t0, 4)}) + "\n")
+                for path, task_spans in spans.items():
+                    line = {"type": "task", "file": path, "state": (states or {}).get(path), "stages": sorted(task_spans, key=lambda s: s["start"])}
+                    f.write(json.dumps(line, ensure_ascii=False) + "\n")
+            old = sorted(n for n in os.listdir(directory) if n.startswith(TIMELINE_PREFIX) and n.endswith(".jsonl"))
+            for name in old[:-TIMELINE_KEEP]:
+                try: os.remove(os.path.join(directory, name))
+                except: pass
+        except Exception as e:
+            print(f"[Timeline] 写入失败: {e}")
+            return None
+        return out_path
+
+
+# =========================================================================
+# === 媒体探测缓存 (单次 ffprobe + SQLite 持久化) ===
+# =========================================================================
+
+PROBE_DB_NAME = "probe_cache.sqlite3"
+HW_UNSUPPORTED_PIX_FMTS = ("yuv422p10le", "yuv422p10be", "yuv422p12le", "yuv422p12be", "yuv444p10le", "yuv444p12le")
+
+# 每个文件只跑一次 ffprobe (-show_format -show_streams)，结果以 (路径, 大小, mtime) 为键落盘；
+# 文件被改动后键自然失效，重新排队/重试的任务直接命中缓存
+class ProbeCache:
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        self.db = None
+        try:
+            self.db = sqlite3.connect(db_path, check_same_thread=False)
+            self.db.execute("CREATE TABLE IF NOT EXISTS probe (path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, info TEXT, ts REAL)")
+            self.db.commit()
+        except Exception as e:
+            print(f"[Probe Cache] 无法打开 {db_path}，仅使用内存缓存: {e}")
+            self.db = None
+
+    def get(self, path, size, mtime_ns):
+        if not self.db: return None
+        try:
+            with self.lock:
+                row = self.db.execute("SELECT info FROM probe WHERE path=? AND size=? AND mtime_ns=?", (path, size, mtime_ns)).fetchone()
+            return json.loads(row[0]) if row else None
+        except: return None
+
+    def put(self, path, size, mtime_ns, info):
+        if not self.db: return
+        try:
+            with self.lock:
+                self.db.execute("INSERT OR REPLACE INTO probe VALUES (?, ?, ?, ?, ?)", (path, size, mtime_ns, json.dumps(info), time.time()))
+                self.db.commit()
+        except: pass
+
+    def close(self):
+        with self.lock:
+            try:
+                if self.db: self.db.close()
+            except: pass
+            self.db = None
+
+def run_ffprobe(path):
+    cmd = [FFPROBE_PATH, "-v", "error", "-show_format", "-show_streams", "-of", "json", path]
+    kwargs = get_subprocess_args()
+    return json.loads(subprocess.check_output(cmd, encoding='utf-8', **kwargs))
+
+# 返回 ffprobe 的 JSON 结果 (附带 size)，失败返回 None
+def probe_media(path, cache=None):
+    try: st = os.stat(path)
+    except OSError: return None
+    if cache:
+        info = cache.get(path, st.st_size, st.st_mtime_ns)
+        if info is not None: return info
+    try: info = run_ffprobe(path)
+    except Exception as e:
+        print(f"[Probe] ffprobe 失败 {os.path.basename(path)}: {e}")
+        return None
+    info["size"] = st.st_size
+    if cache: cache.put(path, st.st_size, st.st_mtime_ns, info)
+    return info
+
+def probe_duration(info):
+    try: return float(info["format"]["duration"])
+    except: pass
+    for st in (info or {}).get("streams", []):
+        try: return float(st["duration"])
+        except: continue
+    return 0
+
+def probe_stream(info, codec_type):
+    return next((st for st in (info or {}).get("streams", []) if st.get("codec_type") == codec_type), None)
+
+
+# =========================================================================
+# === 持久化 SSD 缓存 (内容寻址 + LRU 配额) ===
+# =========================================================================
+
+SSD_CACHE_INDEX_NAME = "cache_index.sqlite3"
+SSD_CACHE_QUOTA_GB = 200.0       # 缓存池中 CACHE_ 文件的总配额，超出时按最近最少使用淘汰
+SSD_CACHE_PARTIAL_HASH = False   # 键中额外加入首尾各 1MB 的哈希 (防止 mtime 被保留的覆盖写入)，需要额外读源盘
+PARTIAL_HASH_BYTES = 1024 * 1024
+ORPHAN_MIN_AGE = 600             # 只回收超过该时长 (秒) 的遗留文件，避免误删其他实例正在写的文件
+INSTANCE_LOCK_PREFIX = "LOCK_"   # 每个使用缓存池的进程留一个 LOCK_<pid>，存活期间其他实例不回收 TEMP_ / 未登记文件
+
+def pid_alive(pid):
+    if pid == os.getpid(): return True
+    if platform.system() == "Windows":
+        try:
+            handle = ctypes.windll.kernel32.OpenProcess(0x1000, False, pid) # PROCESS_QUERY_LIMITED_INFORMATION
+            if not handle: return False
+            code = ctypes.c_ulong()
+            ok = ctypes.windll.kernel32.GetExitCodeProcess(handle, ctypes.byref(code))
+            ctypes.windll.kernel32.CloseHandle(handle)
+            return not ok or code.value == 259 # STILL_ACTIVE
+        except: return True
+    try: os.kill(pid, 0)
+    except ProcessLookupError: return False
+    except OSError: return True # 无权限发信号说明进程存在
+    return True
+
+def cache_key_for(path, st):
+    key = f"{os.path.abspath(path)}|{st.st_size}|{st.st_mtime_ns}"
+    if SSD_CACHE_PARTIAL_HASH:
+        h = hashlib.sha1()
+        with open(path, 'rb') as f:
+            h.update(f.read(PARTIAL_HASH_BYTES))
+            if st.st_size > PARTIAL_HASH_BYTES:
+                f.seek(max(PARTIAL_HASH_BYTES, st.st_size - PARTIAL_HASH_BYTES))
+                h.update(f.read(PARTIAL_HASH_BYTES))
+        key += "|" + h.hexdigest()
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:20]
+
+# 缓存文件名由键决定 (CACHE_<键>_<原文件名>)，同一源文件在重试/重跑/重启后都能命中；
+# 写入时先落到 .part 再原子改名，崩溃留下的半成品在下次启动时回收
+class SsdCacheIndex:
+    def __init__(self, cache_dir, quota_bytes):
+        self.cache_dir = cache_dir
+        self.quota = quota_bytes
+        self.lock = threading.Lock()
+        self.pinned = set() # 正在使用的源文件 (绝对路径，与条目的 src 一致)，不参与淘汰
+        self.db = None
+        self.lock_path = os.path.join(cache_dir, f"{INSTANCE_LOCK_PREFIX}{os.getpid()}")
+        try:
+            with open(self.lock_path, "w") as f: f.write(str(os.getpid()))
+        except OSError: self.lock_path = None
+        try:
+            self.db = sqlite3.connect(os.path.join(cache_dir, SSD_CACHE_INDEX_NAME), check_same_thread=False)
+            self.db.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, src TEXT, size INTEGER, name TEXT, last_used REAL)")
+            self.db.commit()
+        except Exception as e:
+            print(f"[SSD Cache] 索引不可用，缓存文件不会跨批次复用: {e}")
+            self.db = None
+
+    def close(self):
+        with self.lock:
+            try:
+                if self.db: self.db.close()
+            except: pass
+            self.db = None
+            if self.lock_path:
+                try: os.remove(self.lock_path)
+                except OSError: pass
+                self.lock_path = None
+
+    def paths_for(self, src_path):
+        st = os.stat(src_path)
+        key = cache_key_for(src_path, st)
+        name = f"CACHE_{key}_{os.path.basename(src_path)}"
+        return key, os.path.join(self.cache_dir, name)
+
+    # 命中返回缓存文件路径并钉住；文件缺失或大小不符时删除该条目
+    def lookup(self, src_path):
+        if not self.db: return None
+        try:
+            key, path = self.paths_for(src_path)
+            size = os.path.getsize(src_path)
+            with self.lock:
+                row = self.db.execute("SELECT name, size FROM entries WHERE key=?", (key,)).fetchone()
+                if not row: return None
+                path = os.path.join(self.cache_dir, row[0])
+                if not os.path.exists(path) or os.path.getsize(path) != size or row[1] != size:
+                    self.db.execute("DELETE FROM entries WHERE key=?", (key,))
+                    self.db.commit()
+                    return None
+                self.db.execute("UPDATE entries SET last_used=? WHERE key=?", (time.time(), key))
+                self.db.commit()
+                self.pinned.add(os.path.abspath(src_path))
+            return path
+        except: return None
+
+    def add(self, key, src_path, cache_path, size):
+        if not self.db: return
+        with self.lock:
+            try:
+                # 同一源文件的旧版本 (大小/mtime 已变) 不会再命中，直接删掉
+                for old_key, old_name in self.db.execute("SELECT key, name FROM entries WHERE src=? AND key<>?", (os.path.abspath(src_path), key)).fetchall():
+                    try: os.remove(os.path.join(self.cache_dir, old_name))
+                    except OSError: pass
+                    self.db.execute("DELETE FROM entries WHERE key=?", (old_key,))
+                self.db.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)", (key, os.path.abspath(src_path), size, os.path.basename(cache_path), time.time()))
+                self.db.commit()
+            except: pass
+            self.pinned.add(os.path.abspath(src_path))
+
+    def unpin(self, src_path):
+        with self.lock: self.pinned.discard(os.path.abspath(src_path))
+
+    # 缓存池中其他仍在运行的实例 (LOCK_<pid> 对应的进程存活)；进程已退出的锁文件顺手删除
+    def other_instances(self):
+        live = []
+        try: names = os.listdir(self.cache_dir)
+        except OSError: return live
+        for name in names:
+            if not name.startswith(INSTANCE_LOCK_PREFIX): continue
+            try: pid = int(name[len(INSTANCE_LOCK_PREFIX):])
+            except ValueError: continue
+            if pid == os.getpid(): continue
+            if pid_alive(pid): live.append(pid)
+            else:
+                try: os.remove(os.path.join(self.cache_dir, name))
+                except OSError: pass
+        return live
+
+    def total_bytes(self):
+        if not self.db: return 0
+        with self.lock:
+            try: return self.db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            except: return 0
+
+    def evictable_bytes(self):
+        if not self.db: return 0
+        with self.lock:
+            try: rows = self.db.execute("SELECT src, size FROM entries").fetchall()
+            except: return 0
+            return sum(size for src, size in rows if src not in self.pinned)
+
+    # 为 need 字节腾出空间：先满足配额，再满足磁盘剩余空间，按 last_used 从旧到新淘汰未钉住的条目
+    # 其他仍在拷贝中的任务在账本上的预留也计入；owner 的预留在同一把锁内登记，
+    # 并行的 IO 线程不会各自通过检查后合计超出配额或磁盘空间
+    def make_room(self, need, min_free=0, owner=None):
+        if not self.db: return
+        with self.lock:
+            if owner is not None: CACHE_LEDGER.reserve("SSD_CACHE", owner, need)
+            in_flight = CACHE_LEDGER.reserved_bytes("SSD_CACHE", exclude=owner)
+            try: rows = self.db.execute("SELECT key, src, size, name FROM entries ORDER BY last_used").fetchall()
+            except: return
+            total = sum(r[2] for r in rows)
+            try: free = shutil.disk_usage(self.cache_dir).free
+            except: free = float("inf")
+            for key, src, size, name in rows:
+                if total + in_flight + need <= self.quota and free - in_flight - need >= min_free: break
+                if src in self.pinned: continue
+                try: os.remove(os.path.join(self.cache_dir, name))
+                except FileNotFoundError: pass
+                except OSError: continue
+                self.db.execute("DELETE FROM entries WHERE key=?", (key,))
+                total -= size
+                free += size
+                print(f"[SSD Cache] 淘汰 {name} ({size / (1024**3):.2f} GB)")
+            self.db.commit()
+
+    # 启动时回收崩溃遗留：未登记的 CACHE_* / *.part、以及 TEMP_* 临时文件；同时清掉文件已丢失的条目。
+    # 有其他存活实例共用缓存池时不动这些文件 (可能是对方正在写的 TEMP_ENC 输出或 .part)；
+    # keep 为本进程仍在使用的文件名
+    def reclaim_orphans(self, keep=()):
+        if not self.db: return
+        with self.lock:
+            try: rows = self.db.execute("SELECT key, name FROM entries").fetchall()
+            except: return
+            known = {name for _, name in rows}
+            for key, name in rows:
+                if not os.path.exists(os.path.join(self.cache_dir, name)): self.db.execute("DELETE FROM entries WHERE key=?", (key,))
+            self.db.commit()
+        others = self.other_instances()
+        if others:
+            print(f"[SSD Cache] 缓存池正被其他实例使用 (PID {', '.join(map(str, others))})，跳过遗留文件回收")
+            return
+        now = time.time()
+        try: names = os.listdir(self.cache_dir)
+        except OSError: return
+        for name in names:
+            if not (name.startswith("CACHE_") or name.startswith("TEMP_")) or name in known or name in keep: continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                if now - os.path.getmtime(path) < ORPHAN_MIN_AGE: continue
+                os.remove(path)
+                print(f"[SSD Cache] 回收遗留文件 {name}")
+            except OSError: pass
+
+
+# =========================================================================
+# === 无界面任务模型与编码流水线 (GUI / Headless 共用) ===
+# =========================================================================
+
+# 任务模型：按列存放的紧凑表 (array / list)，每个任务只对应一个两字段的 TaskRow 句柄。
+# GUI 与无界面模式共用；界面只为可见行创建控件。
+# listener(row, field) 在 set_status ("status") / set_progress ("progress") 后调用
+class TaskTable:
+    def __init__(self, listener=None):
+        self.listener = listener
+        self.clear()
+
+    def clear(self):
+        self.filepath = []
+        self.status_code = array("b")
+        self.progress = array("f")      # 界面显示的进度 (单向锁定后的值)
+        self.file_size_gb = array("d")
+        self.status_text = []
+        self.status_color = []
+        self.progress_color = []
+        self.source_mode = []
+        self.ssd_cache_path = []
+        self.final_output_path = []
+
+    def __len__(self): return len(self.filepath)
+
+    def append(self, filepath):
+        try: size_gb = os.path.getsize(filepath) / (1024**3)
+        except: size_gb = 0.0
+        self.filepath.append(filepath)
+        self.status_code.append(STATE_PENDING)
+        self.progress.append(0.0)
+        self.file_size_gb.append(size_gb)
+        self.status_text.append("等待处理")
+        self.status_color.append("#888")
+        self.progress_color.append(COLOR_ACCENT)
+        self.source_mode.append("PENDING")
+        self.ssd_cache_path.append(None)
+        self.final_output_path.append(None)
+        return TaskRow(self, len(self.filepath) - 1)
+
+def _task_column(name):
+    return property(lambda row: getattr(row.table, name)[row.i],
+                    lambda row, value: getattr(row.table, name).__setitem__(row.i, value))
+
+class TaskRow:
+    __slots__ = ("table", "i")
+    def __init__(self, table, i):
+        self.table = table
+        self.i = i
+
+    filepath = property(lambda row: row.table.filepath[row.i])
+    status_code = _task_column("status_code")
+    ui_max_progress = _task_column("progress")
+    file_size_gb = _task_column("file_size_gb")
+    status_text = _task_column("status_text")
+    status_color = _task_column("status_color")
+    progress_color = _task_column("progress_color")
+    source_mode = _task_column("source_mode")
+    ssd_cache_path = _task_column("ssd_cache_path")
+    final_output_path = _task_column("final_output_path")
+
+    def set_status(self, text, color="#888", code=None):
+        t = self.table
+        t.status_text[self.i] = text
+        t.status_color[self.i] = color
+        if code is not None:
+            t.status_code[self.i] = code
+            # 进入编码 / 重置 / 完成时清掉进度锁，否则加载阶段的 100% 会挡住 1% 的编码进度
+            if code == STATE_ENCODING or code == STATE_PENDING or code == STATE_DONE: t.progress[self.i] = 0.0
+        if t.listener: t.listener(self, "status")
+
+    def set_progress(self, val, color=COLOR_ACCENT):
+        # 进度条防抖 + 单向锁定：拦截回退数据
+        t = self.table
+        if val == 0: t.progress[self.i] = 0.0
+        elif val >= 1.0: t.progress[self.i] = 1.0
+        elif val < t.progress[self.i]: return
+        else: t.progress[self.i] = val
+        t.progress_color[self.i] = color
+        if t.listener: t.listener(self, "progress")
+
+    def clean_memory(self):
+        self.source_mode = "PENDING"
+        self.ssd_cache_path = None
+        self.ui_max_progress = 0.0
+
+# 没有空闲监控通道时使用的占位对象
+class NullChannel:
+    def activate(self, *a): pass
+    def update_data(self, *a): pass
+    def reset(self): pass
+
+AUDIO_COPY_CODECS = ("aac", "opus")
+# 这些错误与音轨无关，单独抽取音频重跑也无济于事
+NON_AUDIO_FAILURES = ("Unknown encoder", "Device mismatch", "out of memory", "Permission denied", "No such file", "No space left")
+
+def needs_audio_fallback(logs):
+    log_text = "\n".join(logs[-30:]).lower()
+    return not any(p.lower() in log_text for p in NON_AUDIO_FAILURES)
+
+# === 构建 FFmpeg 命令 (自动识别 Win/Mac) ===
+# settings: codec / use_gpu / use_10bit / crf / keep_meta，返回 (cmd, 实际是否硬件编码)
+# 音频默认在主编码中直接从输入 0 映射 (audio_codec 为源音频编码，None 表示无音轨)；
+# audio_file 仅在回退路径中使用 (预先抽取的 WAV)
+# segment=(起点秒, 时长秒)：分段并行模式下只编码该时间段的视频
+# cpus：分给本进程的 CPU 集合，软件编码时据此限定编码线程数 (亲和性由 _run_ffmpeg 设置)
+def build_encode_command(input_source, output_file, settings, final_hw_decode, loopback=False, audio_file=None, audio_codec=None, segment=None, cpus=None):
+    codec_sel = settings["codec"]
+    final_hw_encode = settings["use_gpu"]
+    crf = settings["crf"]
+    cmd = [FFMPEG_PATH, "-y"]
+    
+    # --- 1. 硬件解码参数配置 ---
+    if final_hw_decode:
+        if platform.system() == "Darwin":
+            # Mac 硬件解码
+            cmd.extend(["-hwaccel", "videotoolbox"])
+        else:
+            # Windows (NVIDIA) 硬件解码
+            cmd.extend(["-hwaccel", "cuda", "-hwaccel_output_format", "cuda"])
+
+    # --- 2. 输入源参数 ---
+    if loopback:
+        cmd.extend(["-probesize", "50M", "-analyzeduration", "100M"])
+    if segment: cmd.extend(["-ss", f"{segment[0]:.6f}"]) # 输入端定位：起点即关键帧，不浪费解码
+    
+    cmd.extend(["-i", input_source])
+    if audio_file: cmd.extend(["-i", audio_file])
+    
+    # --- 3. 映射流 ---
+    cmd.extend(["-map", "0:v:0"])
+    if audio_file: cmd.extend(["-map", "1:a:0"])
+    elif audio_codec: cmd.extend(["-map", "0:a:0?"])
+    if segment and segment[1]: cmd.extend(["-t", f"{segment[1]:.6f}"])
+
+    # --- 4. 编码器选择逻辑 ---
+    # CPU 编码同样显式指定编码器，否则 H.265/AV1 会被 mp4 容器默认成 libx264
+    if "H.265" in codec_sel: v_codec = "libx265"
+    elif "AV1" in codec_sel: v_codec = "libsvtav1"
+    else: v_codec = "libx264"
+    if final_hw_encode:
+        if platform.system() == "Darwin":
+            # === Mac VideoToolbox 编码器 ===
+            if "H.264" in codec_sel: v_codec = "h264_videotoolbox"
+            elif "H.265" in codec_sel: v_codec = "hevc_videotoolbox"
+            elif "AV1" in codec_sel: 
+                # 目前大多数 Mac 不支持 AV1 硬编，回退到 CPU 防止报错
+                v_codec = "libsvtav1"
+                final_hw_encode = False 
+        else:
+            # === Windows NVENC 编码器 ===
+            if "H.264" in codec_sel: v_codec = "h264_nvenc"
+            elif "H.265" in codec_sel: v_codec = "hevc_nvenc"
+            elif "AV1" in codec_sel: v_codec = "av1_nvenc"
+    cmd.extend(["-c:v", v_codec])
+
+    # --- 5. 编码参数 (色深、码率控制) ---
+    use_10bit = settings["use_10bit"]
+    # 修正：部分 H.264 硬编不支持 10bit，强制关闭以防报错
+    if final_hw_encode and "H.264" in codec_sel and use_10bit: use_10bit = False
+
+    if final_hw_encode:
+        # === 硬件编码参数 ===
+        if platform.system() == "Darwin":
+            # [Mac 特有配置]
+            # VideoToolbox 不支持 -rc vbr -cq，而是使用 -q:v (0-100, 越高越好)
+            # 映射算法：CRF 20 -> Q 75, CRF 30 -> Q 50
+            mac_quality = int(100 - (crf * 2.2))
+            if mac_quality < 20: mac_quality = 20
+            cmd.extend(["-q:v", str(mac_quality)])
+            if use_10bit: cmd.extend(["-pix_fmt", "p010le"])
+            else: cmd.extend(["-pix_fmt", "yuv420p"])
+        else:
+            # [Windows/NVIDIA 特有配置]
+            if use_10bit:
+                if final_hw_decode: cmd.extend(["-vf", "scale_cuda=format=p010le"]) 
+                else: cmd.extend(["-pix_fmt", "p010le"])
+            else:
+                if final_hw_decode: cmd.extend(["-vf", "scale_cuda=format=yuv420p"]) 
+                else: cmd.extend(["-pix_fmt", "yuv420p"]) 
+            cmd.extend(["-rc", "vbr", "-cq", str(crf), "-b:v", "0"])
+            if "AV1" not in codec_sel: cmd.extend(["-preset", "p4"])
+    else:
+        # === CPU 纯软解参数 (通用) ===
+        if use_10bit: cmd.extend(["-pix_fmt", "yuv420p10le"])
+        else: cmd.extend(["-pix_fmt", "yuv420p"])
+        # SVT-AV1 的 preset 是数字档位，不认识 "medium"
+        cmd.extend(["-crf", str(crf), "-preset", "8" if v_codec == "libsvtav1" else "medium"])
+        if cpus:
+            cmd.extend(["-threads", str(len(cpus))])
+            if v_codec == "libx265":
+                pools = x265_pools_spec(cpus)
+                if pools: cmd.extend(["-x265-params", f"pools={pools}"])
+    
+    # --- 6. 其他参数 ---
+    if audio_file: cmd.extend(["-c:a", "aac", "-b:a", "320k"])
+    elif audio_codec in AUDIO_COPY_CODECS: cmd.extend(["-c:a", "copy"]) # 已是 AAC/Opus，直接流复制
+    elif audio_codec: cmd.extend(["-c:a", "aac", "-b:a", "320k"])
+    if settings["keep_meta"] and not segment: cmd.extend(["-map_metadata", "0"])
+    cmd.extend(["-progress", "pipe:1", "-nostats", output_file])
+    return cmd, final_hw_encode
+
+# === 分段并行编码 (单个长文件占满所有空闲通道) ===
+# 在关键帧处切成 N 段，各段只编码视频并行运行，最后用 concat 分离器无损拼接，
+# 音频在拼接时从源文件整条映射，保持连续
+SEGMENT_PARALLEL = True
+SEGMENT_MIN_DURATION = 900       # 短于该时长 (秒) 的文件不分段
+SEGMENT_MIN_LENGTH = 300         # 每段至少这么长
+SEGMENT_MAX_COUNT = 8
+KEYFRAME_SEARCH_WINDOW = 20      # 在目标时间点之后这么长的范围内找关键帧
+
+# 返回 t 之后最近的视频关键帧时间；找不到时返回 t (重新编码，时间点本身同样精确)
+def find_keyframe_after(path, t):
+    cmd = [FFPROBE_PATH, "-v", "error", "-select_streams", "v:0", "-read_intervals", f"{t:.3f}%+{KEYFRAME_SEARCH_WINDOW}",
+           "-show_entries", "packet=pts_time,flags", "-of", "csv=p=0", path]
+    try:
+        out = subprocess.check_output(cmd, encoding="utf-8", **get_subprocess_args())
+        for line in out.splitlines():
+            parts = line.strip().split(",")
+            if len(parts) >= 2 and "K" in parts[1] and parts[0] not in ("", "N/A") and float(parts[0]) >= t: return float(parts[0])
+    except: pass
+    return t
+
+def plan_segments(path, duration, count):
+    cuts = [0.0]
+    for i in range(1, count):
+        k = find_keyframe_after(path, duration * i / count)
+        if cuts[-1] + SEGMENT_MIN_LENGTH / 2 < k < duration - 1: cuts.append(k)
+    cuts.append(duration)
+    return [(cuts[i], cuts[i + 1] - cuts[i]) for i in range(len(cuts) - 1)]
+
+# 源文件作为第二个输入：提供连续的音轨，以及 (keep_meta 时) 容器元数据与章节，与有无音轨无关
+def build_concat_command(list_file, source, output_file, settings, audio_codec=None, loopback=False):
+    cmd = [FFMPEG_PATH, "-y", "-f", "concat", "-safe", "0", "-i", list_file]
+    use_source = bool(audio_codec) or settings["keep_meta"]
+    if use_source:
+        if loopback: cmd.extend(["-probesize", "50M", "-analyzeduration", "100M"])
+        cmd.extend(["-i", source])
+    cmd.extend(["-map", "0:v:0"])
+    if audio_codec:
+        cmd.extend(["-map", "1:a:0?"])
+        if audio_codec in AUDIO_COPY_CODECS: cmd.extend(["-c:a", "copy"])
+        else: cmd.extend(["-c:a", "aac", "-b:a", "320k"])
+    cmd.extend(["-c:v", "copy"])
+    if settings["keep_meta"]: cmd.extend(["-map_metadata", "1", "-map_chapters", "1"])
+    cmd.extend(["-progress", "pipe:1", "-nostats", output_file])
+    return cmd
+
+# 编码参数默认值 (与 build_encode_command 读取的键一致)；子类只需覆盖自己关心的键
+DEFAULT_ENCODE_SETTINGS = {"codec": "H.264", "use_gpu": False, "hybrid": False, "use_10bit": False, "crf": 23, "keep_meta": True}
+
+# 编码流水线：缓存、调度、FFmpeg 调用。界面相关的部分通过下面几个钩子交给子类
+# (UltraEncoderApp 用 Tk 控件实现，HeadlessEncoder 输出 JSON 行)
+class EncoderCore:
+    def init_core(self):
+        self.file_queue = []       
+        self.task_widgets = {}     
+        self.active_procs = []     
+        self.running = False       
+        self.stop_flag = False     
+        self.queue_lock = threading.Lock() 
+        self.settings = dict(DEFAULT_ENCODE_SETTINGS)
+        self.scheduler = TaskScheduler()
+        self.timeline = TaskTimeline()
+        self.timeline_path = None
+        self.slot_lock = threading.Lock()
+        self.available_indices = [] 
+        self.current_workers = 2   
+        self.prefetch_depth = PREFETCH_DEPTH
+        self.executor = ThreadPoolExecutor(max_workers=16) 
+        self.submitted_tasks = set() 
+        self.temp_dir = ""
+        self.manual_cache_path = None
+        self.output_dir = None
+        self.temp_files = set() 
+        self.ssd_index = None
+        self.ssd_cache_quota_gb = SSD_CACHE_QUOTA_GB
+        self.probe_cache = None
+        self.probe_info = {}
+        self.io_active = set() # 加载线程仍在运行的任务 (渐进缓存时任务可能已在编码)
+        self.segment_busy = 0   # 分段并行额外占用的通道数
+        self.adaptive_concurrency = ADAPTIVE_CONCURRENCY
+        self.concurrency = None
+        self.live_stats = {}    # FFmpeg pid -> 实时 fps / 进度 / 速度 (自适应并发采样与 /metrics)
+        self.cpus_in_use = {}   # 逻辑 CPU -> 绑定在其上的编码进程数
+        METRICS.register(self.collect_metrics)
+        self.total_tasks_run = 0
+        self.finished_tasks_count = 0
+
+    # --- 钩子 (子类覆盖) ---
+    def safe_update(self, func, *args, **kwargs):
+        try: func(*args, **kwargs)
+        except: pass
+    def get_encode_settings(self): return self.settings
+    def get_monitor_channel(self, slot_idx, task_file): return None
+    def on_task_dispatched(self, task_file): pass
+    def on_batch_finished(self): pass
+    def report_error(self, title, message, popup=False): print(f"[{title}] {message}")
+    def report_concurrency(self, decision): print(f"[Concurrency] {decision}")
+
+    # /metrics 抓取时调用 (在服务器线程池中运行)
+    def collect_metrics(self):
+        yield ("cinetico_running", "gauge", "1 while a batch is running", {}, int(self.running))
+        for state, name in STATE_NAMES.items():
+            yield ("cinetico_queue_tasks", "gauge", "Tasks per scheduler state", {"state": name}, self.scheduler.count(state))
+        for tier, entry in CACHE_LEDGER.snapshot().items():
+            for kind in ("reserved", "held"):
+                yield ("cinetico_cache_bytes", "gauge", "Cache ledger bytes per tier", {"tier": tier, "kind": kind}, entry[kind])
+        yield ("cinetico_worker_slots", "gauge", "Compute slots chosen by the user", {}, self.current_workers)
+        yield ("cinetico_worker_limit", "gauge", "Compute slots currently allowed by the concurrency controller", {}, self.worker_limit())
+        for pid, st in list(self.live_stats.items()):
+            labels = {"worker": st["worker"], "pid": pid}
+            yield ("cinetico_worker_fps", "gauge", "Encoded frames per second per ffmpeg process", labels, st["fps"])
+            yield ("cinetico_worker_progress", "gauge", "Progress of the current encode (0-1)", labels, round(st["progress"], 4))
+            yield ("cinetico_worker_speed", "gauge", "Encode speed relative to realtime", labels, st["speed"])
+
+    # 当前允许同时编码的通道数 (自适应并发关闭时即用户设置)
+    def worker_limit(self):
+        return self.concurrency.limit if self.concurrency else self.current_workers
+
+    # 按当前并发数切分 CPU，取与正在运行的编码重叠最少的一份；不需要绑定时返回 None
+    def acquire_cpu_set(self):
+        if not CPU_AFFINITY: return None
+        parts = partition_cpus(self.worker_limit())
+        if not parts: return None
+        with self.slot_lock:
+            cpus = min(parts, key=lambda p: sum(self.cpus_in_use.get(c, 0) for c in p))
+            for c in cpus: self.cpus_in_use[c] = self.cpus_in_use.get(c, 0) + 1
+        return cpus
+
+    def release_cpu_set(self, cpus):
+        if not cpus: return
+        with self.slot_lock:
+            for c in cpus:
+                left = self.cpus_in_use.get(c, 0) - 1
+                if left > 0: self.cpus_in_use[c] = left
+                else: self.cpus_in_use.pop(c, None)
+
+    def clean_junk(self):
+        try:
+            for f in self.temp_files:
+                if os.path.exists(f): os.remove(f)
+        except: pass
+        CACHE_LEDGER.clear("SSD_CACHE")
+        
+    def kill_all_procs(self):
+        for p in list(self.active_procs): 
+            try: p.terminate(); p.kill()
+            except: pass
+        try: 
+            if platform.system() == "Windows":
+                subprocess.run(["taskkill", "/F", "/IM", "ffmpeg.exe"], creationflags=subprocess.CREATE_NO_WINDOW)
+            else:
+                subprocess.run(["pkill", "-f", "ffmpeg"])
+        except: pass
+
+    # SSD 缓存层可用于新拷贝的字节数 (准入与 IO 线程降级共用)：磁盘剩余扣除保留量，加上可按 LRU 淘汰的旧缓存。
+    # 已持有的缓存文件已计入磁盘占用，调用方只需再扣除账本上尚在拷贝中的预留
+    def ssd_cache_free(self):
+        try: free = shutil.disk_usage(self.temp_dir).free - SSD_FREE_RESERVE_GB * 1024**3
+        except: return float("inf")
+        if self.ssd_index: free += self.ssd_index.evictable_bytes()
+        return free
+
+    # on_ready：提供时启用渐进式缓存，达到水位即回调 (任务提前进入就绪)，加载线程继续读完剩余部分
+    def process_caching(self, src_path, widget, lock_obj=None, no_wait=False, allow_ram=True, on_ready=None):
+        file_size = os.path.getsize(src_path)
+        file_size_gb = file_size / (1024**3)
+        # 硬上限：经账本预留 (引擎准入时已预留则直接通过)，超出 MAX_RAM_LOAD_GB 或内存吃紧时直接走 SSD 缓存
+        requested_ram = allow_ram
+        if allow_ram and (memory_under_pressure() or not CACHE_LEDGER.reserve("RAM", src_path, file_size, limit=MAX_RAM_LOAD_GB * 1024**3)): allow_ram = False
+        if not allow_ram: CACHE_LEDGER.release("RAM", src_path)
+        is_ssd = is_drive_ssd(src_path)
+        is_external = is_bus_usb(src_path)
+        if is_ssd and not is_external:
+            CACHE_LEDGER.release("RAM", src_path)
+            CACHE_LEDGER.release("SSD_CACHE", src_path)
+            self.safe_update(widget.set_status, "就绪 (SSD直读)", COLOR_DIRECT, STATUS_READY)
+            widget.source_mode = "DIRECT"
+            return True
+        if allow_ram and file_size_gb < MAX_RAM_LOAD_GB:
+             wait_count = 0
+             limit = 0 if no_wait else 60 
+             wait_start = time.monotonic()
+             while wait_count < limit: 
+                 free_ram = get_free_ram_gb()
+                 available = free_ram - SAFE_RAM_RESERVE
+                 if available > file_size_gb: break 
+                 if wait_count == 0: self.safe_update(widget.set_status, "⏳ 等待内存...", COLOR_WAITING, STATUS_WAIT)
+                 if self.stop_flag: return False
+                 time.sleep(0.5)
+                 wait_count += 1
+             if wait_count: self.timeline.record(src_path, "ram_wait", wait_start)
+        if lock_obj: lock_obj.acquire()
+        locked = bool(lock_obj)
+        try:
+            free_ram = get_free_ram_gb()
+            available_for_cache = free_ram - SAFE_RAM_RESERVE
+            if allow_ram and available_for_cache > file_size_gb and file_size_gb < MAX_RAM_LOAD_GB:
+                self.safe_update(widget.set_status, "📥 载入内存中...", COLOR_RAM, STATUS_CACHING)
+                self.safe_update(widget.set_progress, 0, COLOR_RAM)
+                if on_ready and PROGRESSIVE_RAM_CACHE and file_size > PROGRESSIVE_START_WATERMARK:
+                    return self._load_progressive(src_path, widget, file_size, on_ready)
+                try:
+                    with self.timeline.measure(src_path, "ram_load") as span:
+                        data_buffer = load_file_into_ram(
+                            src_path, file_size,
+                            on_progress=lambda prog: self.safe_update(widget.set_progress, prog, COLOR_READING),
+                            should_stop=lambda: self.stop_flag)
+                        if data_buffer is not None: span["bytes"] = len(data_buffer)
+                    if data_buffer is None:
+                        CACHE_LEDGER.release("RAM", src_path)
+                        return False
+                    token = str(uuid.uuid4().hex) 
+                    GLOBAL_RAM_STORAGE[token] = data_buffer
+                    PATH_TO_TOKEN_MAP[src_path] = token
+                    CACHE_LEDGER.commit("RAM", src_path, len(data_buffer))
+                    self.safe_update(widget.set_status, "就绪 (内存加速)", COLOR_READY_RAM, STATUS_READY)                    
+                    self.safe_update(widget.set_progress, 1, COLOR_READY_RAM)
+                    widget.source_mode = "RAM"
+                    return True
+                except Exception: 
+                    widget.clean_memory() 
+            CACHE_LEDGER.release("RAM", src_path)
+            CACHE_LEDGER.reserve("SSD_CACHE", src_path, file_size)
+            # 拷贝不在锁内进行：不同设备上的文件可以同时写入缓存池
+            if locked:
+                lock_obj.release()
+                locked = False
+            self.safe_update(widget.set_status, "📥 写入缓存...", COLOR_SSD_CACHE, STATUS_CACHING)
+            self.safe_update(widget.set_progress, 0, COLOR_SSD_CACHE)
+            cache_path = None
+            index = self.ssd_index
+            try:
+                hit = index.lookup(src_path) if index else None
+                if hit:
+                    CACHE_LEDGER.commit("SSD_CACHE", src_path, file_size)
+                    widget.ssd_cache_path = hit
+                    widget.source_mode = "SSD_CACHE"
+                    self.safe_update(widget.set_status, "就绪 (缓存命中)", COLOR_SSD_CACHE, STATUS_READY)
+                    self.safe_update(widget.set_progress, 1, COLOR_SSD_CACHE)
+                    return True
+                # 准入时按 RAM 放行、读取前才降级 (内存压力 / 内存不足) 的任务没有经过引擎的 SSD 空间检查：
+                # 按同样的检查决定，放不下就直读源盘
+                if requested_ram and self.ssd_cache_free() - CACHE_LEDGER.reserved_bytes("SSD_CACHE", exclude=src_path) <= file_size:
+                    CACHE_LEDGER.release("SSD_CACHE", src_path)
+                    widget.source_mode = "DIRECT"
+                    self.safe_update(widget.set_status, "就绪 (直读源盘)", COLOR_DIRECT, STATUS_READY)
+                    self.safe_update(widget.set_progress, 1, COLOR_DIRECT)
+                    return True
+                if index:
+                    key, final_path = index.paths_for(src_path)
+                    index.make_room(file_size, min_free=SSD_FREE_RESERVE_GB * 1024**3, owner=src_path)
+                    cache_path = final_path + ".part"
+                else:
+                    fname = os.path.basename(src_path)
+                    final_path = cache_path = os.path.join(self.temp_dir, f"CACHE_{int(time.time())}_{fname}")
+                with self.timeline.measure(src_path, "ssd_copy") as span:
+                    copied = copy_file_fast(src_path, cache_path, file_size,
+                                            on_progress=lambda prog: self.safe_update(widget.set_progress, prog, COLOR_SSD_CACHE),
+                                            should_stop=lambda: self.stop_flag)
+                    span["bytes"] = copied or 0
+                if copied is None:
+                    os.remove(cache_path)
+                    CACHE_LEDGER.release("SSD_CACHE", src_path)
+                    return False
+                if index and copied == file_size:
+                    os.replace(cache_path, final_path)
+                    cache_path = final_path
+                    index.add(key, src_path, cache_path, copied)
+                else: self.temp_files.add(cache_path) # 没有索引 (或拷贝不完整) 的缓存仍按批次清理
+                CACHE_LEDGER.commit("SSD_CACHE", src_path, copied)
+                widget.ssd_cache_path = cache_path
+                widget.source_mode = "SSD_CACHE"
+                self.safe_update(widget.set_status, "就绪 (缓存加速)", COLOR_SSD_CACHE, STATUS_READY)
+                self.safe_update(widget.set_progress, 1, COLOR_SSD_CACHE)
+                return True
+            except:
+                CACHE_LEDGER.release("SSD_CACHE", src_path)
+                if cache_path and os.path.exists(cache_path):
+                    try: os.remove(cache_path)
+                    except: pass
+                self.safe_update(widget.set_status, "缓存失败", COLOR_ERROR, STATUS_ERR)
+                return False
+        finally:
+            if locked: lock_obj.release()
+        
+
+    # 探测缓存放在缓存池目录下；缓存池切换后重新打开
+    def open_probe_cache(self):
+        if not self.temp_dir: return
+        db_path = os.path.join(self.temp_dir, PROBE_DB_NAME)
+        if self.probe_cache and self.probe_cache.db_path == db_path: return
+        if self.probe_cache: self.probe_cache.close()
+        self.probe_cache = ProbeCache(db_path)
+
+    # SSD 缓存索引同样跟随缓存池目录；首次打开时回收上次崩溃遗留的文件
+    def open_ssd_index(self):
+        if not self.temp_dir: return
+        if self.ssd_index and self.ssd_index.cache_dir == self.temp_dir:
+            self.ssd_index.quota = self.ssd_cache_quota_gb * 1024**3
+            return
+        if self.ssd_index: self.ssd_index.close()
+        self.ssd_index = SsdCacheIndex(self.temp_dir, self.ssd_cache_quota_gb * 1024**3)
+        self.ssd_index.reclaim_orphans(keep={os.path.basename(p) for p in CACHE_LEDGER.keys("TEMP")})
+
+    def get_probe(self, path):
+        info = self.probe_info.get(path)
+        if info is None:
+            with self.timeline.measure(path, "probe"): info = probe_media(path, self.probe_cache)
+            if info is not None: self.probe_info[path] = info
+        return info
+
+    def _load_progressive(self, src_path, widget, file_size, on_ready):
+        pb = ProgressiveBuffer(src_path, file_size)
+        token = uuid.uuid4().hex
+        GLOBAL_RAM_STORAGE[token] = pb
+        PATH_TO_TOKEN_MAP[src_path] = token
+        CACHE_LEDGER.commit("RAM", src_path, file_size) # 缓冲区已整体分配
+        widget.source_mode = "RAM"
+        fired = []
+        def on_progress(prog):
+            if fired: return # 已交给编码阶段，进度条归编码使用
+            self.safe_update(widget.set_progress, prog, COLOR_READING)
+            if pb.loaded >= PROGRESSIVE_START_WATERMARK:
+                fired.append(True)
+                on_ready()
+        # 渐进加载在编码开始后仍会继续，计时覆盖整个读盘过程
+        with self.timeline.measure(src_path, "ram_load") as span:
+            result = load_file_into_ram(src_path, file_size, on_progress=on_progress,
+                                        should_stop=lambda: self.stop_flag or pb.cancelled,
+                                        chunk_size=PROGRESSIVE_CHUNK, target=pb)
+            span["bytes"] = pb.loaded
+        if result is None:
+            pb.fail()
+            if not fired: release_source(src_path)
+            return False
+        return True
+
+    # 内存环：达到水位即就绪，加载线程随后跟随 FFmpeg 的读取位置一直运行到任务释放
+    def _load_ring(self, src_path, widget, on_ready):
+        file_size = os.path.getsize(src_path)
+        rb = RingWindowBuffer(src_path, file_size)
+        token = uuid.uuid4().hex
+        GLOBAL_RAM_STORAGE[token] = rb
+        PATH_TO_TOKEN_MAP[src_path] = token
+        CACHE_LEDGER.commit("RAM", src_path, rb.window)
+        self.safe_update(widget.set_status, "📥 载入内存环...", COLOR_RAM, STATUS_CACHING)
+        fired = []
+        def on_progress(prog):
+            if fired: return
+            self.safe_update(widget.set_progress, rb.loaded / rb.window, COLOR_READING)
+            if rb.loaded >= min(PROGRESSIVE_START_WATERMARK, file_size):
+                fired.append(True)
+                on_ready()
+        with self.timeline.measure(src_path, "ring_load"): return rb.run_loader(lambda: self.stop_flag, on_progress=on_progress)
+
+    def get_dur(self, path):
+        return probe_duration(self.get_probe(path))
+
+    def print_batch_summary(self, states):
+        total_in_bytes = 0
+        total_out_bytes = 0
+        file_count = 0
+
+        print("\n" + "="*50)
+        print("          BATCH COMPRESSION SUMMARY          ")
+        print("="*50)
+
+        with self.queue_lock:
+            for f in self.file_queue:
+                card = self.task_widgets[f]
+                # 只统计成功完成的任务
+                if states.get(f) == STATE_DONE and card.final_output_path and os.path.exists(card.final_output_path):
+                    try:
+                        in_size = os.path.getsize(f)
+                        out_size = os.path.getsize(card.final_output_path)
+                        
+                        total_in_bytes += in_size
+                        total_out_bytes += out_size
+                        file_count += 1
+                        
+                        # 打印单个文件详情（可选）
+                        # ratio = (out_size / in_size) * 100
+                        # print(f"[{file_count}] {os.path.basename(f)}: {ratio:.1f}%")
+                    except: pass
+
+        if file_count == 0:
+            print("No files were successfully processed.")
+        else:
+            total_in_mb = total_in_bytes / (1024 * 1024)
+            total_out_mb = total_out_bytes / (1024 * 1024)
+            saved_mb = total_in_mb - total_out_mb
+            
+            # 平均压缩率 (总输出 / 总输入)
+            avg_ratio = (total_out_bytes / total_in_bytes) * 100 if total_in_bytes > 0 else 0
+            
+            print(f"Total Files Processed : {file_count}")
+            print(f"Total Original Size   : {total_in_mb:.2f} MB ({total_in_mb/1024:.2f} GB)")
+            print(f"Total Compressed Size : {total_out_mb:.2f} MB ({total_out_mb/1024:.2f} GB)")
+            print("-" * 50)
+            print(f"Space Saved           : {saved_mb:.2f} MB")
+            print(f"Average Ratio         : {avg_ratio:.2f}% (Output is {avg_ratio:.2f}% of Original)")
+        stage_durs = self.timeline.durations()
+        if stage_durs:
+            print("-" * 50)
+            print(f"{'Stage (s)':<16}{'n':>4}{'p50':>8}{'p90':>8}{'p99':>8}{'total':>9}")
+            for stage, durs in sorted(stage_durs.items(), key=lambda kv: -sum(kv[1])):
+                durs.sort()
+                print(f"{stage:<16}{len(durs):>4}{percentile(durs, 0.5):>8.2f}{percentile(durs, 0.9):>8.2f}{percentile(durs, 0.99):>8.2f}{sum(durs):>9.2f}")
+            crit = self.timeline.critical_path()
+            if crit:
+                share = crit["stage_dur"] / crit["end"] * 100 if crit["end"] > 0 else 0
+                print(f"Critical Path         : {os.path.basename(crit['file'])} -> {crit['stage']} ({crit['stage_dur']:.2f}s, {share:.0f}% of {crit['end']:.2f}s)")
+        if self.timeline_path: print(f"Timeline              : {self.timeline_path}")
+        print("="*50 + "\n")
+
+    def engine(self):
+        ram_limit_bytes = MAX_RAM_LOAD_GB * 1024**3
+        sched = self.scheduler
+        ledger = CACHE_LEDGER
+        is_cache_ssd = is_drive_ssd(self.temp_dir) or (self.manual_cache_path and is_drive_ssd(self.manual_cache_path))
+        # IO 并发由设备占用决定：每个源设备同时只有一个加载任务；缓存池不是 SSD 时，写缓存池也要排队
+        self.io_executor = ThreadPoolExecutor(max_workers=IO_MAX_PARALLEL)
+        cache_dev = None if is_cache_ssd else device_key(self.temp_dir)
+        dev_of = {} # 路径 -> 源设备 (SSD 上的文件为 None，直读)
+        io_devices = {} # 路径 -> 该 IO 任务占用的设备
+        self.probe_info.clear() # 内存结果每批重建，文件改动由磁盘缓存的 (size, mtime) 键识别
+        self.open_probe_cache()
+        self.open_ssd_index()
+        if self.ssd_index: self.ssd_index.pinned.clear() # 新批次开始时没有任务在使用缓存
+        self.concurrency = ConcurrencyController(self.current_workers, log=self.report_concurrency) if self.adaptive_concurrency and self.current_workers > 1 else None
+        timeline = self.timeline
+        timeline.reset()
+        self.timeline_path = None
+        with self.queue_lock:
+            sched.reset((f, STATE_DONE if self.task_widgets[f].status_code == STATE_DONE else STATE_PENDING) for f in self.file_queue)
+        # 不再轮询：每次被状态迁移唤醒后重新规划预读与派发
+        while not self.stop_flag:
+            if self.concurrency:
+                stats = list(self.live_stats.values())
+                self.concurrency.tick([st["fps"] for st in stats], [st["started"] for st in stats])
+            # 盘型 / 设备号 / 剩余空间 / PSI 的探测会读 sysfs、stat 或查 SQLite，不在调度锁内做：
+            # 锁内取候选快照，锁外探测，再回到锁内按最新状态提交迁移
+            with sched.cond:
+                seen = sched.version
+                free_slots = max(0, self.worker_limit() - sched.count(STATE_ENCODING) - self.segment_busy)
+                room = sched.count(STATE_QUEUED_IO, STATE_CACHING, STATE_READY) < free_slots + self.prefetch_depth
+                candidates = sched.peek(STATE_PENDING, PREFETCH_SCAN_LIMIT) if room else []
+            ssd_free, under_pressure = None, False
+            if candidates:
+                for f in candidates:
+                    if f not in dev_of: dev_of[f] = None if is_drive_ssd(f) else device_key(f)
+                ssd_free = self.ssd_cache_free()
+                # 内存吃紧 (PSI) 只在准入时生效：新任务不进 RAM 层，按下面与其他任务相同的空间检查走 SSD 缓存或直读。
+                # 已提交的任务不再改写 source_mode (IO 线程可能已按原决定开始读取)，由 process_caching 在读取前自行复查
+                under_pressure = memory_under_pressure()
+            with sched.cond:
+                missed = sched.version != seen # 探测期间有迁移或 IO 结束：本轮结束后不等待，立即重新规划
+                # 设备占用持续到加载线程真正结束 (渐进缓存的任务进入编码后仍在读盘)
+                for f in [f for f in io_devices if f not in self.io_active]: io_devices.pop(f)
+                busy = set()
+                for devs in io_devices.values(): busy.update(devs)
+                # 预读：保持 (空闲通道 + prefetch_depth) 个文件处于 就绪/加载中
+                for f in candidates:
+                    if sched.state(f) != STATE_PENDING: continue # 探测期间已被移出队列或重置
+                    free_slots = max(0, self.worker_limit() - sched.count(STATE_ENCODING) - self.segment_busy)
+                    if sched.count(STATE_QUEUED_IO, STATE_CACHING, STATE_READY) >= free_slots + self.prefetch_depth: break
+                    card = self.task_widgets[f]
+                    if dev_of[f] is None:
+                        timeline.record(f, "queue_wait", timeline.t0)
+                        timeline.mark(f, "ready")
+                        card.source_mode = "DIRECT"
+                        card.status_code = STATE_READY 
+                        sched.set_state(f, STATE_READY)
+                        self.safe_update(card.set_status, "就绪 (SSD直读)", COLOR_DIRECT, STATE_READY)
+                        self.safe_update(card.set_progress, 1.0, COLOR_DIRECT)
+                        continue 
+                    if dev_of[f] in busy: continue # 该设备正忙：看后面有没有其他设备上的文件
+                    size_bytes = int(card.file_size_gb * 1024**3)
+                    # 准入即预留：RAM 层在账本上原子判断上限，IO 完成后按真实字节转为持有
+                    if not under_pressure and ledger.reserve("RAM", f, size_bytes, limit=ram_limit_bytes): mode = "RAM"
+                    elif RING_BUFFER_MODE and not under_pressure and size_bytes > ram_limit_bytes and size_bytes > RING_WINDOW_BYTES \
+                            and ledger.reserve("RAM", f, RING_WINDOW_BYTES, limit=ram_limit_bytes): mode = "RING" # 超大文件：固定大小的滑动窗口
+                    else:
+                        if cache_dev is not None and cache_dev in busy: continue
+                        if ssd_free - ledger.reserved_bytes("SSD_CACHE") > size_bytes: mode = "SSD_CACHE"
+                        elif sched.count(STATE_QUEUED_IO, STATE_CACHING, STATE_READY, STATE_ENCODING) == 0: mode = "DIRECT" # 预算耗尽且无任务可释放：直接读源盘
+                        else: continue # SSD 预算不够：等前面的任务释放，后面能进 RAM 的小文件照常预读
+                    devs = {dev_of[f]}
+                    if mode == "SSD_CACHE":
+                        ledger.reserve("SSD_CACHE", f, size_bytes)
+                        if cache_dev is not None: devs.add(cache_dev)
+                    timeline.record(f, "queue_wait", timeline.t0)
+                    if mode == "DIRECT":
+                        card.source_mode = "DIRECT"
+                        self.set_task_state(f, "就绪 (直读源盘)", COLOR_DIRECT, STATE_READY)
+                        continue
+                    io_devices[f] = devs
+                    busy.update(devs)
+                    card.source_mode = mode
+                    card.status_code = STATE_QUEUED_IO
+                    sched.set_state(f, STATE_QUEUED_IO)
+                    self.io_active.add(f)
+                    self.io_executor.submit(self._worker_io_task, f)
+                while sched.count(STATE_ENCODING) + self.segment_busy < self.worker_limit():
+                    f = sched.first(STATE_READY)
+                    if f is None: break
+                    card = self.task_widgets[f]
+                    timeline.record(f, "ready_wait", timeline.mark_of(f, "ready", timeline.t0))
+                    card.status_code = STATE_ENCODING
+                    sched.set_state(f, STATE_ENCODING)
+                    self.executor.submit(self._worker_compute_task, f)
+                    self.on_task_dispatched(f)
+                if sched.unfinished() == 0: break
+                # 兜底超时仅用于检查 stop_flag，正常情况下由工作线程的状态迁移唤醒
+                if not missed: sched.cond.wait(1.0)
+        self.io_executor.shutdown(wait=False)
+        self.running = False
+        # 最终状态以调度器为准：界面上可能还排着旧的 set_status
+        with self.queue_lock: states = {f: sched.state(f) for f in self.file_queue}
+        self.timeline_path = timeline.write_jsonl(self.batch_output_dir(states), states)
+        if not self.stop_flag: self.print_batch_summary(states)
+        self.on_batch_finished()
+
+    # 批次输出所在目录：指定了输出目录就用它，否则取第一个完成任务的输出目录 (即其源文件目录)
+    def batch_output_dir(self, states):
+        if self.output_dir: return self.output_dir
+        for f in self.file_queue:
+            if states.get(f) == STATE_DONE: return os.path.dirname(self.task_widgets[f].final_output_path or f)
+        return os.path.dirname(self.file_queue[0]) if self.file_queue else None
+
+    # 状态码同步写入任务行与调度器 (唤醒引擎)，界面文字与颜色仍走 safe_update
+    # 引擎在最后一个任务完成时立即收尾，汇总不能等界面来写状态码
+    def set_task_state(self, task_file, text, color, code):
+        if code == STATE_READY: self.timeline.mark(task_file, "ready")
+        elif code in (STATE_DONE, STATE_ERROR): METRICS.inc("cinetico_tasks_finished_total", state=STATE_NAMES[code])
+        # 任务离开活动区时归还其内存预算 (数据本身由 release_source 释放并注销)
+        if code in (STATE_DONE, STATE_ERROR, STATE_PENDING) and task_file not in PATH_TO_TOKEN_MAP: CACHE_LEDGER.release("RAM", task_file)
+        self.task_widgets[task_file].status_code = code
+        self.scheduler.set_state(task_file, code)
+        self.safe_update(self.task_widgets[task_file].set_status, text, color, code)
+
+    def _worker_io_task(self, task_file):
+        card = self.task_widgets[task_file]
+        early = []
+        def on_ready():
+            early.append(True)
+            self.set_task_state(task_file, "⚡就绪 (边读边编)", COLOR_READY_RAM, STATE_READY)
+        try:
+            self.set_task_state(task_file, "📥正在加载...", COLOR_READING, STATE_CACHING)
+            self.get_probe(task_file) # 提前探测：源盘本来就要读这个文件，编码阶段直接命中
+            if card.source_mode in RAM_TIER_MODES and self.prefers_hw_decode(task_file):
+                # 硬件解码直接读源文件、不走回环：内存副本用不上，边读边编 / 内存环还会和 FFmpeg 同时读这块盘
+                CACHE_LEDGER.release("RAM", task_file)
+                card.source_mode = "DIRECT"
+                self.set_task_state(task_file, "就绪 (直读源盘)", COLOR_DIRECT, STATE_READY)
+                return
+            if card.source_mode == "RING":
+                self._load_ring(task_file, card, on_ready)
+                if early: return
+                release_source(task_file)
+                if not self.stop_flag: self.set_task_state(task_file, "IO 失败", COLOR_ERROR, STATE_ERROR)
+                return
+            success = self.process_caching(task_file, card, lock_obj=None, no_wait=True, allow_ram=card.source_mode == "RAM", on_ready=on_ready)
+            # 已提前就绪：状态由编码阶段接管；加载失败时 FFmpeg 读取会中断并按编码失败处理
+            if early: return
+            if card.source_mode != "RAM": CACHE_LEDGER.release("RAM", task_file) # 降级到 SSD 缓存时归还预算
+            elif success and PIPE_SOURCE_MODE:
+                buf = GLOBAL_RAM_STORAGE.get(PATH_TO_TOKEN_MAP.get(task_file))
+                if buf is not None and is_streamable_container(task_file, buf): card.source_mode = "PIPE"
+            if success:
+                self.set_task_state(task_file, "⚡就绪 (等待编码)", COLOR_READY_RAM if card.source_mode in RAM_TIER_MODES else COLOR_SSD_CACHE, STATE_READY)
+            else: self.set_task_state(task_file, "IO 失败", COLOR_ERROR, STATE_ERROR)
+        except Exception as e:
+            print(f"IO Error: {e}")
+            if not early: self.set_task_state(task_file, "IO 错误", COLOR_ERROR, STATE_ERROR)
+        finally:
+            with self.scheduler.cond:
+                self.io_active.discard(task_file)
+                self.scheduler.wake()
+
+    def analyze_ffmpeg_log(self, logs):
+        log_text = "\n".join(logs[-30:]) 
+        # [修正] 删除了 ("aac", ...) 这个会导致误报的条目
+        error_patterns = [
+            ("Permission denied", "❌ 文件权限不足"), 
+            ("No such file", "❌ 找不到输入文件"), 
+            ("Unknown encoder", "❌ 找不到编码器"), 
+            ("Device mismatch", "❌ 显卡设备不匹配"), 
+            ("out of memory", "❌ 显存/内存不足"), 
+            ("Tag", "❌ 容器格式不兼容"), 
+            ("Invalid data", "❌ 数据流损坏"), 
+            ("Server returned 404", "❌ 内存数据丢失"), 
+            ("Qavg: nan", "❌ 音频编码崩溃")
+        ]
+        for pattern, reason in error_patterns:
+            if pattern in log_text or pattern.lower() in log_text.lower(): return reason
+        
+        # 如果没匹配到已知错误，打印最后几行日志到控制台，方便排查 SSD 到底哪里错了
+        print("--- [Unknown FFmpeg Error Log] ---")
+        print(log_text)
+        print("----------------------------------")
+        return "❌ 未知错误 (请查看控制台)"
+
+    # 编码阶段一定会选硬件解码 (混合模式按通道奇偶决定，无法提前判断)
+    def prefers_hw_decode(self, task_file):
+        settings = self.get_encode_settings()
+        if not settings["use_gpu"] or settings["hybrid"]: return False
+        return self.check_decoding_capability(task_file)["can_hw_decode"]
+
+    def check_decoding_capability(self, input_path):
+        try:
+            info = self.get_probe(input_path)
+            if info is None: raise RuntimeError("ffprobe 无结果")
+            video = probe_stream(info, "video") or {}
+            audio = probe_stream(info, "audio")
+            codec_name = video.get("codec_name", "")
+            pix_fmt = video.get("pix_fmt", "")
+            audio_codec = audio.get("codec_name", "unknown") if audio else None
+            can_hw_decode = True
+            if pix_fmt in HW_UNSUPPORTED_PIX_FMTS:
+                can_hw_decode = False
+                print(f"[Smart Check] 检测到高规格素材 ({pix_fmt})，将强制使用 CPU 解码以保证稳定。")
+            return {"can_hw_decode": can_hw_decode, "pix_fmt": pix_fmt, "codec_name": codec_name, "audio_codec": audio_codec}
+        except Exception as e:
+            print(f"[Check Error] 检测失败，默认回退到 CPU 解码: {e}")
+            # 探测失败时不确定是否有音轨，交给主编码的可选映射 (0:a:0?) 处理
+            return {"can_hw_decode": False, "pix_fmt": "unknown", "codec_name": "unknown", "audio_codec": "unknown"}
+
+    # 启动一次 FFmpeg 编码并读取 -progress 输出，返回退出码
+    # progress_hook(进度, fps)：提供时由调用方汇总进度 (分段并行)，不直接刷新界面
+    def _run_ffmpeg(self, cmd, card, ch_ui, duration, input_size, output_log, pipe_buffer=None, progress_hook=None, cpus=None, worker=-1):
+        # 使用 subprocess 跨平台参数
+        kwargs = get_subprocess_args()
+        stdin_arg = subprocess.PIPE if pipe_buffer is not None else None
+        if platform.system() == "Windows":
+             proc = subprocess.Popen(cmd, stdin=stdin_arg, stdout=subprocess.PIPE, stderr=subprocess.PIPE, startupinfo=kwargs['startupinfo'], creationflags=kwargs['creationflags'])
+        else:
+             proc = subprocess.Popen(affinity_prefix(cpus) + cmd, stdin=stdin_arg, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+             pin_process(proc, cpus)
+
+        self.active_procs.append(proc)
+        if pipe_buffer is not None:
+            threading.Thread(target=feed_stdin_from_buffer, args=(proc, pipe_buffer, lambda: self.stop_flag), daemon=True).start()
+        def log_stderr(p):
+            for l in p.stderr:
+                try: output_log.append(l.decode('utf-8', errors='ignore').strip())
+                except: pass
+        threading.Thread(target=log_stderr, args=(proc,), daemon=True).start()
+        # =========================================================
+        # === 进度读取循环：按块解析 -progress，输出大小取自 total_size，不再 stat 文件 ===
+        # =========================================================
+        start_t = time.time()
+        last_ui_update_time = 0 
+        ui_update_interval = 0.1
+        max_prog_reached = 0.0   # 记录已达到的最大进度：过滤 B 帧造成的时间戳回退，避免进度条抽动
+        
+        for block in iter_progress_blocks(proc.stdout):
+            if self.stop_flag: break
+            if "out_time_us" not in block: continue
+            now = time.time()
+            if now - last_ui_update_time <= ui_update_interval and not block["end"]: continue
+            last_ui_update_time = now
+            fps = block.get("fps", 0.0)
+            raw_prog = (block["out_time_us"] / 1000000.0) / duration
+            if raw_prog > max_prog_reached: max_prog_reached = raw_prog
+            final_prog = min(1.0, max_prog_reached)
+            self.live_stats[proc.pid] = {"worker": worker, "fps": fps, "progress": final_prog, "speed": block.get("speed", 0.0), "started": start_t}
+            if progress_hook:
+                progress_hook(final_prog, fps)
+                continue
+            eta = "--:--"
+            elapsed = now - start_t
+            if final_prog > 0.005:
+                eta_sec = max(0, (elapsed / final_prog) - elapsed)
+                eta = f"{int(eta_sec//60):02d}:{int(eta_sec%60):02d}"
+            ratio = 0.0
+            in_proc = input_size * final_prog
+            if final_prog > 0.01 and in_proc > 0: ratio = (block.get("total_size", 0) / in_proc) * 100
+            self.safe_update(ch_ui.update_data, fps, final_prog, eta, ratio)
+            self.safe_update(card.set_progress, final_prog, COLOR_ACCENT)
+        proc.wait()
+        self.live_stats.pop(proc.pid, None)
+        METRICS.inc("cinetico_ffmpeg_runs_total", result="ok" if proc.returncode == 0 else "stopped" if self.stop_flag else "error")
+        if proc in self.active_procs: self.active_procs.remove(proc)
+        return proc.returncode
+
+    # 队列里只剩这一个长文件、且有空闲通道时，按关键帧切段并行编码，再无损拼接。
+    # 返回 None 表示不适用 (调用方走普通单进程编码)
+    def _encode_segmented(self, task_file, card, ch_ui, source, settings, final_hw_decode, use_loopback, audio_codec, duration, input_size, working_output_file, output_log, cpus=None, slot_idx=-1):
+        if not SEGMENT_PARALLEL or duration < SEGMENT_MIN_DURATION or card.source_mode in ("PIPE", "RING"): return None
+        if self.scheduler.unfinished() != 1: return None
+        _, hw_encode = build_encode_command(source, working_output_file, settings, final_hw_decode)
+        if hw_encode: return None # 硬件编码器并发路数有限，分段无收益
+        extra = []
+        with self.slot_lock:
+            spare = self.worker_limit() - self.scheduler.count(STATE_ENCODING) - self.segment_busy
+            want = min(spare, SEGMENT_MAX_COUNT - 1, int(duration // SEGMENT_MIN_LENGTH) - 1)
+            if want < 1: return None
+            extra = self.available_indices[:want]
+            del self.available_indices[:want]
+            self.segment_busy += want
+        fname = os.path.basename(task_file)
+        seg_id = uuid.uuid4().hex
+        list_file = os.path.join(self.temp_dir, f"TEMP_SEG_{seg_id}.txt")
+        seg_files = []
+        channels = [ch_ui]
+        try:
+            self.safe_update(ch_ui.activate, fname, "✂️ 正在定位关键帧 / Planning Segments...")
+            segments = plan_segments(task_file, duration, 1 + want)
+            if len(segments) < 2: return None
+            for i in extra[:len(segments) - 1]: channels.append(self.get_monitor_channel(i, task_file) or NullChannel())
+            seg_files = [os.path.join(self.temp_dir, f"TEMP_SEG_{seg_id}_{i}.mp4") for i in range(len(segments))]
+            print(f"[Segment] {fname}: 切分为 {len(segments)} 段并行编码")
+            seg_prog = [0.0] * len(segments)
+            seg_fps = [0.0] * len(segments)
+            start_t = time.time()
+            def make_hook(i):
+                def hook(prog, fps):
+                    seg_prog[i], seg_fps[i] = prog, fps
+                    total = sum(p * seg[1] for p, seg in zip(seg_prog, segments)) / duration
+                    elapsed = time.time() - start_t
+                    eta = "--:--"
+                    if total > 0.005:
+                        eta_sec = max(0, elapsed / total - elapsed)
+                        eta = f"{int(eta_sec//60):02d}:{int(eta_sec%60):02d}"
+                    self.safe_update(channels[i].update_data, fps, prog, eta, 0.0)
+                    self.safe_update(card.set_progress, total, COLOR_ACCENT)
+                return hook
+            def run_segment(i):
+                seg_cpus = cpus if i == 0 else self.acquire_cpu_set() # 第 0 段沿用本任务已分到的 CPU
+                try:
+                    cmd, _ = build_encode_command(source, seg_files[i], settings, final_hw_decode, loopback=use_loopback, segment=segments[i], cpus=seg_cpus)
+                    if i: self.safe_update(channels[i].activate, fname, f"Seg {i + 1}/{len(segments)} | Enc:CPU")
+                    log = []
+                    rc = self._run_ffmpeg(cmd, card, channels[i], segments[i][1], 0, log, progress_hook=make_hook(i), cpus=seg_cpus,
+                                          worker=slot_idx if i == 0 else extra[i - 1])
+                    if rc != 0: output_log.extend(log)
+                    return rc
+                finally:
+                    if i: self.release_cpu_set(seg_cpus)
+            self.safe_update(ch_ui.activate, fname, f"Seg 1/{len(segments)} | Enc:CPU")
+            with self.timeline.measure(task_file, "segment_encode") as span:
+                futures = [self.executor.submit(run_segment, i) for i in range(1, len(segments))]
+                codes = [run_segment(0)] + [fu.result() for fu in futures]
+                span["bytes"] = input_size
+            if self.stop_flag: return -1
+            if any(codes):
+                METRICS.inc("cinetico_ffmpeg_retries_total", reason="segment_fallback")
+                return None
+            with open(list_file, "w", encoding="utf-8") as lf:
+                for seg_file in seg_files:
+                    escaped = seg_file.replace("'", "'\\''")
+                    lf.write(f"file '{escaped}'\n")
+            self.safe_update(ch_ui.activate, fname, "🔗 正在拼接分段 / Joining Segments...")
+            cmd = build_concat_command(list_file, source, working_output_file, settings, audio_codec=audio_codec, loopback=use_loopback)
+            with self.timeline.measure(task_file, "concat"):
+                rc = self._run_ffmpeg(cmd, card, ch_ui, duration, input_size, output_log, worker=slot_idx)
+            if rc == 0 or self.stop_flag: return rc
+            METRICS.inc("cinetico_ffmpeg_retries_total", reason="segment_fallback")
+            return None
+        except Exception as e:
+            print(f"[Segment] {fname}: 分段编码异常，改用单进程: {e}")
+            METRICS.inc("cinetico_ffmpeg_retries_total", reason="segment_fallback")
+            return None
+        finally:
+            for f in seg_files + [list_file]:
+                if os.path.exists(f):
+                    try: os.remove(f)
+                    except: pass
+            for ch in channels[1:]: self.safe_update(ch.reset)
+            with self.slot_lock:
+                self.available_indices.extend(extra)
+                self.available_indices.sort()
+                self.segment_busy -= len(extra)
+            self.scheduler.wake()
+
+    def _worker_compute_task(self, task_file):
+        card = self.task_widgets[task_file]
+        fname = os.path.basename(task_file)
+        slot_idx = -1
+        ch_ui = None
+        working_output_file = None 
+        temp_audio_wav = os.path.join(self.temp_dir, f"TEMP_AUDIO_{uuid.uuid4().hex}.wav")
+        output_log = []
+        input_size = 0
+        duration = 1.0
+        cpus = None
+        with self.slot_lock:
+            if self.available_indices:
+                slot_idx = self.available_indices.pop(0)
+                ch_ui = self.get_monitor_channel(slot_idx, task_file)
+        if not ch_ui: ch_ui = NullChannel()
+        try:
+            self.safe_update(ch_ui.activate, fname, "⏳ 正在预处理 / Pre-processing...")
+            info = self.get_probe(task_file)
+            if info is not None:
+                input_size = info.get("size", 0)
+                duration = probe_duration(info)
+                if duration <= 0: duration = 1.0
+            elif os.path.exists(task_file): input_size = os.path.getsize(task_file)
+            decode_info = self.check_decoding_capability(task_file)
+            hw_decode_allowed = decode_info["can_hw_decode"]
+            audio_codec = decode_info["audio_codec"]
+            self.safe_update(card.set_status, "▶️ 智能编码中...", COLOR_ACCENT, STATE_ENCODING)
+            settings = self.get_encode_settings()
+            if not settings["use_gpu"]: cpus = self.acquire_cpu_set()
+            is_even_slot = (slot_idx % 2 == 0)
+            final_hw_decode = settings["use_gpu"] and hw_decode_allowed
+            if settings["hybrid"] and is_even_slot: final_hw_decode = False 
+            if final_hw_decode and card.source_mode in RAM_TIER_MODES:
+                # 硬件解码改读源文件：仍在后台读盘的渐进缓冲 / 内存环先取消并释放，不与 FFmpeg 争用同一块盘
+                buf = GLOBAL_RAM_STORAGE.get(PATH_TO_TOKEN_MAP.get(task_file))
+                if isinstance(buf, RingWindowBuffer) or (isinstance(buf, ProgressiveBuffer) and not buf.done):
+                    release_source(task_file)
+                    card.source_mode = "DIRECT"
+            input_video_source = task_file
+            disk_source = task_file
+            if card.source_mode == "SSD_CACHE" and card.ssd_cache_path:
+                # [新增] 强制转换为绝对路径，防止 FFmpeg 在不同盘符间迷路
+                disk_source = input_video_source = os.path.abspath(card.ssd_cache_path)
+            use_loopback = False
+            pipe_buffer = None
+            if not final_hw_decode and card.source_mode == "PIPE":
+                pipe_buffer = GLOBAL_RAM_STORAGE.get(PATH_TO_TOKEN_MAP.get(task_file))
+                if pipe_buffer is not None: input_video_source = "pipe:0"
+            if not final_hw_decode and pipe_buffer is None:
+                token = PATH_TO_TOKEN_MAP.get(task_file)
+                if not token and LOOPBACK_FILE_TIERS and card.source_mode in ("SSD_CACHE", "DIRECT"):
+                    token = register_file_source(task_file, disk_source)
+                if token:
+                    input_video_source = f"http://127.0.0.1:{self.global_port}/{token}"
+                    use_loopback = True
+            output_dir = self.output_dir or os.path.dirname(task_file)
+            f_name_no_ext = os.path.splitext(fname)[0]
+            date_str = time.strftime("%Y%m%d")
+            final_filename = f"{f_name_no_ext}_Compressed_{date_str}.mp4"
+            final_output_path = os.path.join(output_dir, final_filename)
+            temp_output_filename = f"TEMP_ENC_{uuid.uuid4().hex}.mp4"
+            working_output_file = os.path.join(self.temp_dir, temp_output_filename)
+            CACHE_LEDGER.reserve("TEMP", working_output_file, input_size) # 输出通常小于输入，按输入大小预留
+            info_decode = "GPU" if final_hw_decode else "CPU"
+            tag_source = ""
+            if card.source_mode == "RAM": tag_source = " | RAM"
+            elif card.source_mode == "RING": tag_source = " | RING"
+            elif card.source_mode == "PIPE": tag_source = " | PIPE" if pipe_buffer is not None else " | RAM"
+
+            # 单遍处理：音频直接从输入 0 映射 (AAC/Opus 流复制)。
+            # 只有主编码因音频/解封装失败时，才回退到旧流程：先抽取 WAV 再重跑一次
+            audio_file = None
+            returncode = self._encode_segmented(task_file, card, ch_ui, input_video_source, settings, final_hw_decode, use_loopback, audio_codec,
+                                                duration, input_size, working_output_file, output_log, cpus, slot_idx)
+            if returncode is None: output_log.clear()
+            for attempt in range(2 if returncode is None else 0):
+                cmd, final_hw_encode = build_encode_command(
+                    input_video_source, working_output_file, settings, final_hw_decode,
+                    loopback=use_loopback, audio_file=audio_file, audio_codec=audio_codec, cpus=cpus)
+                info_encode = "GPU" if final_hw_encode else "CPU"
+                self.safe_update(ch_ui.activate, fname, f"Dec:{info_decode} | Enc:{info_encode}{tag_source}")
+                with self.timeline.measure(task_file, "encode") as span:
+                    returncode = self._run_ffmpeg(cmd, card, ch_ui, duration, input_size, output_log, pipe_buffer, cpus=cpus, worker=slot_idx)
+                    if returncode == 0: span["bytes"] = input_size
+                if returncode == 0 or self.stop_flag or attempt == 1: break
+                if not audio_codec or not needs_audio_fallback(output_log): break
+                print(f"[Audio Fallback] {fname}: 主编码失败，改用预抽取音轨重试")
+                METRICS.inc("cinetico_ffmpeg_retries_total", reason="audio_fallback")
+                self.safe_update(ch_ui.activate, fname, "🎵 正在分离音频流 / Extracting Audio...")
+                self.safe_update(card.set_status, "🎵 提取音频...", COLOR_READING, STATE_ENCODING)
+                # 与主编码一样读已缓存的输入：内存副本 (含 PIPE) 走回环地址，SSD 缓存读缓存文件，不再回源盘读一遍
+                token = PATH_TO_TOKEN_MAP.get(task_file)
+                audio_source = f"http://127.0.0.1:{self.global_port}/{token}" if token else disk_source
+                extract_cmd = [FFMPEG_PATH, "-y", "-i", audio_source, "-vn", "-acodec", "pcm_s16le", "-ar", "44100", "-ac", "2", "-f", "wav", temp_audio_wav]
+                kwargs = get_subprocess_args()
+                with self.timeline.measure(task_file, "audio_extract"):
+                    subprocess.run(extract_cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, **kwargs)
+                if os.path.exists(temp_audio_wav): CACHE_LEDGER.commit("TEMP", temp_audio_wav, os.path.getsize(temp_audio_wav))
+                if os.path.exists(temp_audio_wav) and os.path.getsize(temp_audio_wav) > 1024: audio_file = temp_audio_wav
+                else: audio_codec = None # 音轨本身不可用：只保留视频
+                output_log.clear()
+                self.safe_update(card.set_status, "▶️ 智能编码中...", COLOR_ACCENT, STATE_ENCODING)
+            if self.stop_flag:
+                self.set_task_state(task_file, "已停止", COLOR_PAUSED, STATE_PENDING)
+            elif returncode == 0:
+                try:
+                    self.safe_update(card.set_status, "📦 正在回写...", COLOR_MOVING, STATE_DONE)
+                    with self.timeline.measure(task_file, "writeback") as span:
+                        if os.path.exists(working_output_file):
+                            span["bytes"] = os.path.getsize(working_output_file)
+                            shutil.move(working_output_file, final_output_path)
+                    CACHE_LEDGER.release("TEMP", working_output_file)
+                    if settings["keep_meta"] and os.path.exists(final_output_path): shutil.copystat(task_file, final_output_path)
+                    card.final_output_path = final_output_path
+                    final_size_mb = 0
+                    ratio_str = ""
+                    try:
+                        final_size_mb = os.path.getsize(final_output_path)
+                        saved_percent = (1.0 - (final_size_mb / input_size)) * 100
+                        if saved_percent < 0: ratio_str = f"(+{abs(saved_percent):.1f}%)"
+                        else: ratio_str = f"(-{saved_percent:.1f}%)"
+                    except: pass
+                    status_text = f"完成 {ratio_str}"
+                    self.set_task_state(task_file, status_text, COLOR_SUCCESS, STATE_DONE)
+                    self.safe_update(card.set_progress, 1.0, COLOR_SUCCESS)
+                except Exception as move_err:
+                    print(f"Move Error: {move_err}")
+                    self.set_task_state(task_file, "回写失败", COLOR_ERROR, STATE_ERROR)
+                    saved_path = working_output_file
+                    working_output_file = None 
+                    self.report_error("回写错误", f"无法移回原目录，已保留在缓存池：\n{saved_path}", popup=True)
+            else:
+                err_msg = self.analyze_ffmpeg_log(output_log)
+                print(f"Task Failed: {fname}\nReason: {err_msg}")
+                self.set_task_state(task_file, "转码失败", COLOR_ERROR, STATE_ERROR)
+                self.report_error("错误", f"处理 {fname} 时发生错误：\n{err_msg}")
+        except Exception as e:
+            print(f"Critical System Error: {e}")
+            self.set_task_state(task_file, "系统错误", COLOR_ERROR, STATE_ERROR)
+        finally:
+            release_source(task_file)
+            self.release_cpu_set(cpus)
+            CACHE_LEDGER.release("SSD_CACHE", task_file)
+            if self.ssd_index: self.ssd_index.unpin(task_file)
+            CACHE_LEDGER.release("TEMP", temp_audio_wav)
+            if working_output_file: CACHE_LEDGER.release("TEMP", working_output_file)
+            if os.path.exists(temp_audio_wav):
+                try: os.remove(temp_audio_wav)
+                except: pass
+            if working_output_file and os.path.exists(working_output_file):
+                try: os.remove(working_output_file)
+                except: pass
+            # 兜底：异常路径未上报终态时标记为错误，避免引擎永远等待
+            if self.scheduler.state(task_file) == STATE_ENCODING:
+                if task_file not in PATH_TO_TOKEN_MAP: CACHE_LEDGER.release("RAM", task_file)
+                self.scheduler.set_state(task_file, STATE_ERROR)
+            self.safe_update(ch_ui.reset)
+            with self.slot_lock:
+                if slot_idx != -1:
+                    self.available_indices.append(slot_idx)
+                    self.available_indices.sort()
+
+# =========================================================================
+# === 无界面批处理模式 (--headless)，进度以 JSON 行输出到 stdout ===
+# =========================================================================
+VIDEO_EXTS = ('.mp4', '.mkv', '.mov', '.avi', '.ts', '.flv', '.wmv')
+HEADLESS_CODECS = {"h264": "H.264", "h265": "H.265", "hevc": "H.265", "av1": "AV1"}
+
+class JsonLineReporter:
+    def __init__(self, stream):
+        self.stream = stream
+        self.lock = threading.Lock()
+
+    def emit(self, event, **fields):
+        fields = {"event": event, "ts": round(time.time(), 3), **fields}
+        line = json.dumps(fields, ensure_ascii=False)
+        with self.lock:
+            try:
+                self.stream.write(line + "\n")
+                self.stream.flush()
+            except (BrokenPipeError, ValueError): pass
+
+# 无界面监控通道：把 activate / update_data 转成 JSON 进度事件 (每个任务最多 1 次/秒)
+class HeadlessChannel:
+    def __init__(self, reporter, task_file, slot_idx, interval=1.0):
+        self.reporter = reporter
+        self.task_file = task_file
+        self.slot_idx = slot_idx
+        self.interval = interval
+        self.last_emit = 0.0
+
+    def activate(self, filename, tag):
+        self.reporter.emit("stage", file=self.task_file, worker=self.slot_idx, info=tag)
 
-# Windows 优先级常量
-PRIORITY_NORMAL = 0x00000020 
-PRIORITY_ABOVE = 0x00008000  
-PRIORITY_HIGH = 0x00000080   
+    def update_data(self, fps, prog, eta, ratio):
+        now = time.time()
+        if now - self.last_emit < self.interval and prog < 1.0: return
+        self.last_emit = now
+        self.reporter.emit("progress", file=self.task_file, worker=self.slot_idx, fps=round(float(fps), 2),
+                           progress=round(prog, 4), eta=eta, ratio=round(ratio, 2))
+
+    def reset(self): pass
+
+class HeadlessEncoder(EncoderCore):
+    def __init__(self, settings, workers=2, cache_dir=None, output_dir=None, reporter=None):
+        self.init_core()
+        self.task_table = TaskTable(listener=self._on_task_change)
+        self.settings.update(settings)
+        self.current_workers = max(1, workers)
+        self.manual_cache_path = cache_dir
+        self.output_dir = output_dir
+        self.reporter = reporter or JsonLineReporter(sys.stdout)
+        self.global_server, self.global_port = start_global_server()
 
-# --- 辅助函数：跨平台 Subprocess 参数 ---
-# 这是一个关键修复，防止 Mac 上报错
-def get_subprocess_args():
-    if platform.system() == "Windows":
-        si = subprocess.STARTUPINFO()
-        si.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-        return {"startupinfo": si, "creationflags": subprocess.CREATE_NO_WINDOW}
-    return {}
+    def get_monitor_channel(self, slot_idx, task_file):
+        return HeadlessChannel(self.reporter, task_file, slot_idx)
 
-# --- 硬件检测 ---
-def get_total_ram_gb():
-    try:
-        if platform.system() == "Windows":
-            class MEMORYSTATUSEX(ctypes.Structure):
-                _fields_ = [("dwLength", ctypes.c_ulong), ("dwMemoryLoad", ctypes.c_ulong), 
-                            ("ullTotalPhys", ctypes.c_ulonglong), ("ullAvailPhys", ctypes.c_ulonglong), 
-                            ("ullTotalPageFile", ctypes.c_ulonglong), ("ullAvailPageFile", ctypes.c_ulonglong), 
-                            ("ullTotalVirtual", ctypes.c_ulonglong), ("ullAvailVirtual", ctypes.c_ulonglong), 
-                            ("ullAvailExtendedVirtual", ctypes.c_ulonglong)]
-            stat = MEMORYSTATUSEX()
-            stat.dwLength = ctypes.sizeof(stat)
-            ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(stat))
-            return stat.ullTotalPhys / (1024**3)
-        else:
-            return 16.0 # Mac 简化处理
-    except:
-        return 16.0 
+    def report_error(self, title, message, popup=False):
+        self.reporter.emit("error", title=title, message=message)
 
-def get_free_ram_gb():
-    try:
-        if platform.system() == "Windows":
-            class MEMORYSTATUSEX(ctypes.Structure):
-                _fields_ = [("dwLength", ctypes.c_ulong), ("dwMemoryLoad", ctypes.c_ulong), 
-                            ("ullTotalPhys", ctypes.c_ulonglong), ("ullAvailPhys", ctypes.c_ulonglong), 
-                            ("ullTotalPageFile", ctypes.c_ulonglong), ("ullAvailPageFile", ctypes.c_ulonglong), 
-                            ("ullTotalVirtual", ctypes.c_ulonglong), ("ullAvailVirtual", ctypes.c_ulonglong), 
-                            ("ullAvailExtendedVirtual", ctypes.c_ulonglong)]
-            stat = MEMORYSTATUSEX()
-            stat.dwLength = ctypes.sizeof(stat)
-            ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(stat))
-            return stat.ullAvailPhys / (1024**3)
-        else:
-            return 4.0
-    except:
-        return 4.0
+    def report_concurrency(self, decision):
+        self.reporter.emit("concurrency", **decision)
 
-TOTAL_RAM = get_total_ram_gb()
-MAX_RAM_LOAD_GB = max(4.0, TOTAL_RAM - 4.0) 
-SAFE_RAM_RESERVE = 3.0  
+    def _on_task_change(self, task, field):
+        if field != "status": return
+        self.reporter.emit("status", file=task.filepath, state=task.status_code, mode=task.source_mode, text=task.status_text)
+
+    def add_list(self, files):
+        with self.queue_lock:
+            for f in files:
+                f_norm = os.path.normpath(os.path.abspath(f))
+                if f_norm in self.task_widgets or not f_norm.lower().endswith(VIDEO_EXTS): continue
+                self.file_queue.append(f_norm)
+                self.task_widgets[f_norm] = self.task_table.append(f_norm)
+            # 与界面一致：小文件优先
+            self.file_queue.sort(key=lambda x: self.task_widgets[x].file_size_gb)
+
+    def run(self):
+        path = find_best_cache_drive(manual_override=self.manual_cache_path)
+        self.temp_dir = os.path.join(path, "_Ultra_Smart_Cache_")
+        os.makedirs(self.temp_dir, exist_ok=True)
+        self.available_indices = list(range(self.current_workers))
+        self.running = True
+        self.reporter.emit("batch_start", files=len(self.file_queue), workers=self.current_workers, cache_dir=self.temp_dir,
+                           metrics=f"http://127.0.0.1:{self.global_port}/{METRICS_PATH}")
+        set_execution_state(True)
+        try: self.engine()
+        except KeyboardInterrupt: self.stop() # 只结束自己的子进程，不影响本机其他 ffmpeg
+        finally:
+            self.executor.shutdown(wait=True)
+            self.clean_junk()
+            set_execution_state(False)
+        done = sum(1 for t in self.task_widgets.values() if t.status_code == STATE_DONE)
+        failed = len(self.task_widgets) - done
+        self.reporter.emit("batch_done", done=done, failed=failed, stopped=self.stop_flag, ledger=CACHE_LEDGER.snapshot(), timeline=self.timeline_path)
+        if self.stop_flag: return 130
+        return 0 if failed == 0 else 1
+
+    def stop(self, *args):
+        self.stop_flag = True
+        self.scheduler.wake()
+        for p in list(self.active_procs):
+            try: p.terminate()
+            except: pass
+
+def collect_input_files(inputs, recursive=False):
+    files = []
+    for item in inputs:
+        if os.path.isdir(item):
+            if recursive:
+                for root, _, names in os.walk(item):
+                    files.extend(os.path.join(root, n) for n in sorted(names) if n.lower().endswith(VIDEO_EXTS))
+            else:
+                files.extend(os.path.join(item, n) for n in sorted(os.listdir(item)) if n.lower().endswith(VIDEO_EXTS))
+        elif os.path.isfile(item): files.append(item)
+        else: print(f"[Headless] 跳过不存在的路径: {item}")
+    return files
+
+def headless_main(argv):
+    # stdout 专用于 JSON 进度行，其余日志 (含工作线程的 print) 一律改走 stderr
+    json_stdout, sys.stdout = sys.stdout, sys.stderr
+    parser = argparse.ArgumentParser(prog="Cinetico_Encoder.py --headless", description="Cinético 无界面批处理模式")
+    parser.add_argument("--headless", action="store_true")
+    parser.add_argument("inputs", nargs="+", help="视频文件或目录")
+    parser.add_argument("--codec", choices=sorted(HEADLESS_CODECS), default="h264")
+    parser.add_argument("--crf", type=int, default=23)
+    parser.add_argument("--workers", type=int, default=2, help="同时编码数上限 (自适应并发在 1..N 之间调整)")
+    parser.add_argument("--fixed-workers", dest="adaptive", action="store_false", help="关闭自适应并发，始终使用 --workers")
+    parser.add_argument("--prefetch", type=int, default=PREFETCH_DEPTH, help="编码通道之外额外预读的文件数")
+    parser.add_argument("--gpu", action="store_true", help="启用硬件编解码")
+    parser.add_argument("--hybrid", action="store_true", help="异构分流 (偶数通道走 CPU 解码)")
+    parser.add_argument("--10bit", dest="use_10bit", action="store_true")
+    parser.add_argument("--no-meta", dest="keep_meta", action="store_false")
+    parser.add_argument("--cache-dir", default=None)
+    parser.add_argument("--cache-quota", type=float, default=SSD_CACHE_QUOTA_GB, help="SSD 缓存配额 (GB)")
+    parser.add_argument("--output-dir", default=None, help="默认写回源文件所在目录")
+    parser.add_argument("--recursive", action="store_true")
+    parser.add_argument("--metrics-listen", default=None, metavar="HOST:PORT", help="额外在该地址提供 /metrics 供远程抓取")
+    args = parser.parse_args(argv)
+
+    if not check_ffmpeg():
+        print("❌ 找不到 FFmpeg")
+        return 2
+    settings = {"codec": HEADLESS_CODECS[args.codec], "use_gpu": args.gpu, "hybrid": args.hybrid and args.gpu,
+                "use_10bit": args.use_10bit, "crf": args.crf, "keep_meta": args.keep_meta}
+    if args.output_dir: os.makedirs(args.output_dir, exist_ok=True)
+    if args.cache_dir: os.makedirs(args.cache_dir, exist_ok=True)
+    app = HeadlessEncoder(settings, workers=args.workers, cache_dir=args.cache_dir,
+                          output_dir=args.output_dir, reporter=JsonLineReporter(json_stdout))
+    app.prefetch_depth = max(0, args.prefetch)
+    app.adaptive_concurrency = args.adaptive
+    if args.metrics_listen:
+        host, _, port = args.metrics_listen.rpartition(":")
+        app.metrics_server, _ = start_metrics_server(host or "0.0.0.0", int(port))
+    app.ssd_cache_quota_gb = max(0.0, args.cache_quota)
+    app.add_list(collect_input_files(args.inputs, args.recursive))
+    if not app.file_queue:
+        print("[Headless] 没有找到可处理的视频文件")
+        return 2
+    try: signal.signal(signal.SIGTERM, app.stop)
+    except (ValueError, AttributeError): pass
+    return app.run()
+
+if __name__ == "__main__" and HEADLESS_MODE:
+    sys.exit(headless_main(sys.argv[1:]))
+
+# =========================================================================
+# === [模块 3] 图形界面 ===
+# =========================================================================
+
+import customtkinter as ctk  
+import tkinter as tk         
+from tkinter import filedialog, messagebox
+
+# 界面更新总线
+UI_FRAME_MS = 33         # 主线程合并应用更新的间隔 (约 30 帧/秒)
+UI_FRAME_BUDGET = 0.02   # 每帧最多花在应用更新上的时间 (秒)，剩余的顺延到下一帧
+UI_COALESCE_METHODS = ("set_status", "set_progress", "update_data", "activate", "reset", "configure")
 
-print(f"[System] RAM: {TOTAL_RAM:.1f}GB | Cache Limit: {MAX_RAM_LOAD_GB:.1f}GB")
+# 全局视觉配置
+ctk.set_appearance_mode("Dark") 
+ctk.set_default_color_theme("dark-blue")
 
 # 拖拽库
 try:
@@ -261,154 +3277,7 @@ except ImportError:
     class DnDWindow(ctk.CTk): pass 
     HAS_DND = False 
 
-# Windows 电源管理 (Mac 跳过)
-def set_execution_state(enable=True):
-    if platform.system() != "Windows": return
-    ES_CONTINUOUS = 0x80000000
-    ES_SYSTEM_REQUIRED = 0x00000001
-    try:
-        if enable:
-            ctypes.windll.kernel32.SetThreadExecutionState(ES_CONTINUOUS | ES_SYSTEM_REQUIRED)
-        else:
-            ctypes.windll.kernel32.SetThreadExecutionState(ES_CONTINUOUS)
-    except: pass
-
-def disable_power_throttling(process_handle=None):
-    if platform.system() != "Windows": return
-    try:
-        # 省略具体代码，保持原样即可
-        pass
-    except: pass
-
-# 检查 FFmpeg (使用全局路径)
-def check_ffmpeg():
-    try:
-        # 使用 FFMPEG_PATH
-        subprocess.run([FFMPEG_PATH, "-version"], stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
-        return True
-    except: return False
-
-# 磁盘检测
-drive_type_cache = {} 
-def is_drive_ssd(path):
-    if platform.system() != "Windows": return True # Mac 默认当 SSD 处理
-    root = os.path.splitdrive(os.path.abspath(path))[0].upper() 
-    if not root: return False
-    drive_letter = root 
-    if drive_letter in drive_type_cache: return drive_type_cache[drive_letter]
-    is_ssd = False
-    try:
-        h_vol = ctypes.windll.kernel32.CreateFileW(f"\\\\.\\{drive_letter}", 0x80, 0x3, None, 3, 0, None)
-        if h_vol != -1:
-            class STORAGE_PROPERTY_QUERY(ctypes.Structure):
-                _fields_ = [("PropertyId", ctypes.c_uint), ("QueryType", ctypes.c_uint), ("AdditionalParameters", ctypes.c_byte * 1)]
-            query = STORAGE_PROPERTY_QUERY()
-            query.PropertyId = 7 
-            class DEVICE_SEEK_PENALTY_DESCRIPTOR(ctypes.Structure):
-                _fields_ = [("Version", ctypes.c_ulong), ("Size", ctypes.c_ulong), ("IncursSeekPenalty", ctypes.c_bool)]
-            out = DEVICE_SEEK_PENALTY_DESCRIPTOR()
-            bytes_returned = ctypes.c_ulong()
-            ret = ctypes.windll.kernel32.DeviceIoControl(h_vol, 0x002D1400, ctypes.byref(query), ctypes.sizeof(query),
-                                                         ctypes.byref(out), ctypes.sizeof(out), ctypes.byref(bytes_returned), None)
-            ctypes.windll.kernel32.CloseHandle(h_vol)
-            if ret:
-                is_ssd = not out.IncursSeekPenalty 
-                drive_type_cache[drive_letter] = is_ssd
-                return is_ssd
-    except: pass
-    drive_type_cache[drive_letter] = False
-    return False
-
-def is_bus_usb(path):
-    if platform.system() != "Windows": return False
-    try:
-        root = os.path.splitdrive(os.path.abspath(path))[0].upper()
-        if ctypes.windll.kernel32.GetDriveTypeW(root + "\\") == 2: return True 
-        return False
-    except: return False
-
-def find_best_cache_drive(source_drive_letter=None, manual_override=None):
-    if manual_override and os.path.exists(manual_override):
-        return manual_override
-    
-    # Mac/Linux 默认使用临时目录
-    if platform.system() != "Windows":
-        return os.path.expanduser("~/")
-
-    drives = [f"{chr(i)}:\\" for i in range(65, 91) if os.path.exists(f"{chr(i)}:\\")]
-    candidates = []
-    for root in drives:
-        try:
-            d_letter = os.path.splitdrive(root)[0].upper()
-            total, used, free = shutil.disk_usage(root)
-            free_gb = free / (1024**3)
-            if free_gb < 20: continue 
-            is_system = (d_letter == "C:")
-            is_ssd = is_drive_ssd(root)
-            is_usb = is_bus_usb(root)
-            is_source = (source_drive_letter and d_letter == source_drive_letter.upper())
-            level = 0
-            if is_ssd and not is_system and not is_usb: level = 5
-            elif is_ssd and is_system: level = 4
-            elif not is_ssd and not is_source and not is_system: level = 3
-            elif not is_ssd and is_source: level = 2
-            elif is_system: level = 1
-            candidates.append({"path": root, "level": level, "free": free_gb})
-        except: pass
-    candidates.sort(key=lambda x: (x["level"], x["free"]), reverse=True)
-    if candidates: return candidates[0]["path"]
-    else: return "C:\\"
-
-# 全局内存仓库与单例服务器
-GLOBAL_RAM_STORAGE = {} 
-PATH_TO_TOKEN_MAP = {}
-
-class GlobalRamHandler(http.server.SimpleHTTPRequestHandler):
-    def log_message(self, format, *args): pass  
-    def do_GET(self):
-        try:
-            token = self.path.lstrip('/')
-            video_data = GLOBAL_RAM_STORAGE.get(token)
-            if not video_data:
-                self.send_error(404, "Invalid Token")
-                return
-            file_size = len(video_data)
-            start, end = 0, file_size - 1
-            if "Range" in self.headers:
-                try:
-                    range_val = self.headers["Range"].split("=")[1]
-                    start_str, end_str = range_val.split("-")
-                    if start_str: start = int(start_str)
-                    if end_str: end = int(end_str)
-                    elif end_str: 
-                        start = file_size - int(end_str)
-                        end = file_size - 1
-                except: pass
-            if start >= file_size:
-                 self.send_error(416, "Range Not Satisfiable")
-                 return
-            chunk_len = (end - start) + 1
-            self.send_response(HTTPStatus.PARTIAL_CONTENT if "Range" in self.headers else HTTPStatus.OK)
-            self.send_header("Content-Type", "video/mp4") 
-            self.send_header("Content-Range", f"bytes {start}-{end}/{file_size}")
-            self.send_header("Content-Length", str(chunk_len))
-            self.send_header("Accept-Ranges", "bytes")
-            self.end_headers()
-            try: 
-                self.wfile.write(memoryview(video_data)[start : end + 1])
-            except (ConnectionResetError, BrokenPipeError): pass
-        except Exception as e:
-            print(f"Global Server Error: {e}")
-
-def start_global_server():
-    server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), GlobalRamHandler)
-    server.daemon_threads = True
-    port = server.server_address[1]
-    threading.Thread(target=server.serve_forever, daemon=True).start()
-    print(f"[Core] Global Memory Server started on port {port}")
-    return server, port
-
-# UI 组件 (InfinityScope, MonitorChannel, TaskCard, HelpWindow)
+# UI 组件 (InfinityScope, MonitorChannel, TaskCard / VirtualTaskList, HelpWindow)
 # -----------------------------------------------------------
 class InfinityScope(ctk.CTkCanvas):
     def __init__(self, master, **kwargs):
@@ -585,88 +3454,136 @@ class ToastNotification(ctk.CTkFrame):
     def destroy_toast(self):
         self.destroy()
 
+# 任务行控件：由 VirtualTaskList 复用，show() 时绑定到某个 TaskRow，只重设变化了的属性
 class TaskCard(ctk.CTkFrame):
-    def __init__(self, master, index, filepath, **kwargs):
+    def __init__(self, master, **kwargs):
         super().__init__(master, fg_color=COLOR_CARD, corner_radius=10, border_width=0, **kwargs)
         self.grid_columnconfigure(1, weight=1)
-        self.filepath = filepath
-        self.status_code = STATE_PENDING 
-        self.ram_data = None 
-        self.ssd_cache_path = None
-        self.source_mode = "PENDING"
-        
-        # [核心修复 1/2] 初始化进度锁
-        self.ui_max_progress = 0.0
-        
-        try: self.file_size_gb = os.path.getsize(filepath) / (1024**3)
-        except: self.file_size_gb = 0.0
-        self.lbl_index = ctk.CTkLabel(self, text=f"{index:02d}", font=("Impact", 22), 
+        self.row = None
+        self.shown = {}
+        self.lbl_index = ctk.CTkLabel(self, text="", font=("Impact", 22), 
                                       text_color="#555", width=50, anchor="center")
         self.lbl_index.grid(row=0, column=0, rowspan=2, padx=(5, 5), pady=0) 
         name_frame = ctk.CTkFrame(self, fg_color="transparent")
         name_frame.grid(row=0, column=1, sticky="sw", padx=0, pady=(8, 0)) 
-        ctk.CTkLabel(name_frame, text=os.path.basename(filepath), font=("微软雅黑", 12, "bold"), 
-                     text_color="#EEE", anchor="w").pack(side="left")
+        self.lbl_name = ctk.CTkLabel(name_frame, text="", font=("微软雅黑", 12, "bold"), text_color="#EEE", anchor="w")
+        self.lbl_name.pack(side="left")
         self.btn_open = ctk.CTkButton(self, text="📂", width=28, height=22, fg_color="#444", hover_color="#555", 
                                       font=("Segoe UI Emoji", 11), command=self.open_location)
         self.btn_open.grid(row=0, column=2, padx=10, pady=(8,0), sticky="e")
-        self.lbl_status = ctk.CTkLabel(self, text="等待处理", font=("Arial", 10), text_color="#888", anchor="nw")
+        self.lbl_status = ctk.CTkLabel(self, text="", font=("Arial", 10), text_color="#888", anchor="nw")
         self.lbl_status.grid(row=1, column=1, sticky="nw", padx=0, pady=(0, 0)) 
         self.progress = ctk.CTkProgressBar(self, height=6, corner_radius=3, progress_color=COLOR_ACCENT, fg_color="#444")
         self.progress.set(0)
         self.progress.grid(row=2, column=0, columnspan=3, sticky="new", padx=12, pady=(0, 10))
-        self.final_output_path = None
 
     def open_location(self):
+        if self.row is None: return
+        filepath = self.row.filepath
         try: 
             if platform.system() == "Windows":
-                subprocess.run(['explorer', '/select,', os.path.normpath(self.filepath)])
+                subprocess.run(['explorer', '/select,', os.path.normpath(filepath)])
             elif platform.system() == "Darwin":
-                subprocess.run(['open', '-R', self.filepath])
-        except: pass
-
-    def update_index(self, new_index):
-        try:
-            if self.winfo_exists(): self.lbl_index.configure(text=f"{new_index:02d}")
-        except: pass
-        
-    def set_status(self, text, color="#888", code=None):
-        try:
-            if self.winfo_exists():
-                self.lbl_status.configure(text=text, text_color=color)
-                if code is not None: 
-                    self.status_code = code
-                    # [修复点] 这里非常关键！
-                    # 当状态变成 "编码中" (STATE_ENCODING = 4) 时，必须强制重置锁。
-                    # 否则，之前的 "内存/SSD加载完成" (100%) 会一直卡住进度条，
-                    # 导致 1% 的编码进度被当成错误数据拦截掉。
-                    if code == STATE_ENCODING or code == STATE_PENDING or code == STATE_DONE:
-                        self.ui_max_progress = 0.0
+                subprocess.run(['open', '-R', filepath])
         except: pass
-        
-    def set_progress(self, val, color=COLOR_ACCENT):
-        try:
-            if self.winfo_exists():
-                # 进度条防抖 + 单向锁定逻辑
-                if val == 0:
-                    self.ui_max_progress = 0.0
-                elif val >= 1.0:
-                    self.ui_max_progress = 1.0
-                elif val < self.ui_max_progress:
-                    # 拦截回退数据
-                    return 
-                
-                if val > self.ui_max_progress:
-                    self.ui_max_progress = val
 
-                self.progress.set(self.ui_max_progress)
-                self.progress.configure(progress_color=color)
-        except: pass
-        
-    def clean_memory(self):
-        self.source_mode = "PENDING"
-        self.ssd_cache_path = None
-        self.ui_max_progress = 0.0
+    def _set(self, key, value, apply):
+        if self.shown.get(key) != value:
+            self.shown[key] = value
+            apply(value)
+
+    def show(self, row, index):
+        self.row = row
+        t, i = row.table, row.i
+        self._set("index", index, lambda v: self.lbl_index.configure(text=f"{v:02d}"))
+        self._set("name", t.filepath[i], lambda v: self.lbl_name.configure(text=os.path.basename(v)))
+        self._set("status", (t.status_text[i], t.status_color[i]), lambda v: self.lbl_status.configure(text=v[0], text_color=v[1]))
+        self._set("progress", t.progress[i], self.progress.set)
+        self._set("progress_color", t.progress_color[i], lambda v: self.progress.configure(progress_color=v))
+
+    def hide(self):
+        if self.row is None: return
+        self.row = None
+        self.place_forget()
+
+# 虚拟化任务列表：只创建覆盖可见区域的 TaskCard，滚动时重新绑定到对应的任务行。
+# 列表长度只影响 rows 这个 Python 列表，与控件数量无关
+TASK_ROW_HEIGHT = 72
+TASK_ROW_GAP = 8
+
+class VirtualTaskList(ctk.CTkFrame):
+    def __init__(self, master, **kwargs):
+        super().__init__(master, fg_color="transparent", **kwargs)
+        self.rows = []      # 按显示顺序排列的 TaskRow
+        self.pos_of = {}    # 路径 -> 显示位置
+        self.offset = 0     # 像素滚动偏移
+        self.pool = []
+        self.body = ctk.CTkFrame(self, fg_color="transparent")
+        self.body.pack(side="left", fill="both", expand=True)
+        self.scrollbar = ctk.CTkScrollbar(self, command=self._on_scrollbar)
+        self.scrollbar.pack(side="right", fill="y")
+        self.body.bind("<Configure>", lambda e: self.relayout())
+        self._bind_wheel(self.body)
+
+    def set_rows(self, rows):
+        self.rows = rows
+        self.pos_of = {row.filepath: i for i, row in enumerate(rows)}
+        self.scroll_to(self.offset)
+
+    def _view_height(self): return max(1, self.body.winfo_height())
+
+    def scroll_to(self, offset):
+        max_offset = max(0, len(self.rows) * TASK_ROW_HEIGHT - self._view_height())
+        self.offset = int(max(0, min(offset, max_offset)))
+        self.relayout()
+
+    # 与原来的定位方式一致：目标行上方留出约一行半
+    def scroll_to_task(self, path):
+        pos = self.pos_of.get(path)
+        if pos is not None: self.scroll_to((pos - 1.5) * TASK_ROW_HEIGHT)
+
+    def relayout(self):
+        view_h = self._view_height()
+        need = min(view_h // TASK_ROW_HEIGHT + 2, len(self.rows))
+        while len(self.pool) < need:
+            card = TaskCard(self.body)
+            self._bind_wheel(card)
+            self.pool.append(card)
+        first, shift = divmod(self.offset, TASK_ROW_HEIGHT)
+        for k, card in enumerate(self.pool):
+            pos = first + k
+            if k < need and pos < len(self.rows):
+                card.show(self.rows[pos], pos + 1)
+                card.place(x=0, y=k * TASK_ROW_HEIGHT - shift, relwidth=1.0, height=TASK_ROW_HEIGHT - TASK_ROW_GAP)
+            else: card.hide()
+        total = len(self.rows) * TASK_ROW_HEIGHT
+        if total <= view_h: self.scrollbar.set(0.0, 1.0)
+        else: self.scrollbar.set(self.offset / total, (self.offset + view_h) / total)
+
+    # 模型变化时调用：只有该行当前可见才触碰控件
+    def refresh_task(self, row):
+        pos = self.pos_of.get(row.filepath)
+        if pos is None: return
+        k = pos - self.offset // TASK_ROW_HEIGHT
+        if 0 <= k < len(self.pool) and self.pool[k].row is not None and self.pool[k].row.i == row.i: self.pool[k].show(row, pos + 1)
+
+    def _on_scrollbar(self, *args):
+        if args[0] == "moveto": self.scroll_to(float(args[1]) * len(self.rows) * TASK_ROW_HEIGHT)
+        elif args[0] == "scroll":
+            step = TASK_ROW_HEIGHT if args[2] == "units" else self._view_height()
+            self.scroll_to(self.offset + int(args[1]) * step)
+
+    def _on_wheel(self, event):
+        if event.num == 4: delta = -1
+        elif event.num == 5: delta = 1
+        else: delta = -1 if event.delta > 0 else 1
+        self.scroll_to(self.offset + delta * TASK_ROW_HEIGHT)
+
+    def _bind_wheel(self, widget):
+        for seq in ("<MouseWheel>", "<Button-4>", "<Button-5>"):
+            try: widget.bind(seq, self._on_wheel, add="+")
+            except: pass
+        for child in widget.winfo_children(): self._bind_wheel(child)
         
 class HelpWindow(ctk.CTkToplevel):
     def __init__(self, *args, **kwargs):
@@ -764,29 +3681,35 @@ class HelpWindow(ctk.CTkToplevel):
         ctk.CTkLabel(inner, text=body_cn, font=self.FONT_BODY_CN, text_color=self.COL_TEXT_LOW, justify="left", anchor="w", wraplength=950).pack(fill="x")
 
 # 主程序
-class UltraEncoderApp(DnDWindow):
+class UltraEncoderApp(DnDWindow, EncoderCore):
+    # 界面更新总线：任何线程都只向队列追加，主线程每帧合并一次。
+    # 设值类方法 (状态/进度/文字) 按 (方法, 关键字) 合并，只应用最新值；任务行刷新按任务合并 (见 _on_task_change)；
+    # 弹窗、动画等一次性调用按原顺序逐个执行
     def safe_update(self, func, *args, **kwargs):
-        if self.winfo_exists():
-            self.after(10, partial(self._guarded_call, func, *args, **kwargs))
+        if getattr(func, "__name__", "") in UI_COALESCE_METHODS: key = (func, tuple(sorted(kwargs)))
+        else: key = object()
+        self.ui_bus.append((key, func, args, kwargs))
+    def _ui_pump(self):
+        pending = self.ui_pending
+        while True:
+            try: key, func, args, kwargs = self.ui_bus.popleft()
+            except IndexError: break
+            pending[key] = (func, args, kwargs)
+            pending.move_to_end(key) # 顺序以最后一次投递为准 (例如 reset 之后的 activate 仍在其后)
+        deadline = time.perf_counter() + UI_FRAME_BUDGET
+        while pending and time.perf_counter() < deadline:
+            _, (func, args, kwargs) = pending.popitem(last=False)
+            self._guarded_call(func, *args, **kwargs)
+        try: self.after(UI_FRAME_MS, self._ui_pump)
+        except: pass
     def _guarded_call(self, func, *args, **kwargs):
         try:
             if self.winfo_exists(): func(*args, **kwargs)
         except: pass
-    def scroll_to_card(self, widget):
-        try:
-            target_file = None
-            for f, card in self.task_widgets.items():
-                if card == widget: target_file = f; break
-            if not target_file: return
-            if target_file in self.file_queue:
-                index = self.file_queue.index(target_file) - 1 
-                total = len(self.file_queue)               
-                if total > 1:
-                    target_pos = index / total
-                    if index > 0: target_pos = max(0.0, target_pos - (1 / total) * 0.5)
-                    self.scroll._parent_canvas.yview_moveto(target_pos)
-                    self.after(100, lambda: self.scroll._parent_canvas.yview_moveto(target_pos))
-        except: pass
+    # 任务模型变化：只有可见行需要刷新控件 (工作线程里的变化经更新总线转到主线程)
+    def _on_task_change(self, row, field):
+        if threading.current_thread() is threading.main_thread(): self.task_list.refresh_task(row)
+        else: self.ui_bus.append((("refresh_task", row.filepath), self.task_list.refresh_task, (row,), {})) # 每帧每个任务只刷新一次
     def preload_help_window(self):
         try:
             self.help_window = HelpWindow(self) 
@@ -802,27 +3725,15 @@ class UltraEncoderApp(DnDWindow):
         self.configure(fg_color=COLOR_BG_MAIN)
         self.minsize(1200, 850) 
         self.protocol("WM_DELETE_WINDOW", self.on_closing) 
-        self.file_queue = []       
-        self.task_widgets = {}     
-        self.active_procs = []     
-        self.running = False       
-        self.stop_flag = False     
-        self.queue_lock = threading.Lock() 
-        self.slot_lock = threading.Lock()
+        self.init_core()
+        self.ui_bus = deque()            # 工作线程投递的界面更新 (deque.append 线程安全，无需加锁)
+        self.ui_pending = OrderedDict()  # 主线程：合并后待应用的更新，键 -> 最新调用
+        self.task_table = TaskTable(listener=self._on_task_change)
         self.read_lock = threading.Lock()
         self.gpu_lock = threading.Lock()
         self.gpu_active_count = 0  
         self.total_vram_gb = self.get_total_vram_gb() 
         self.monitor_slots = []    
-        self.available_indices = [] 
-        self.current_workers = 2   
-        self.executor = ThreadPoolExecutor(max_workers=16) 
-        self.submitted_tasks = set() 
-        self.temp_dir = ""
-        self.manual_cache_path = None
-        self.temp_files = set() 
-        self.total_tasks_run = 0
-        self.finished_tasks_count = 0
         self.setup_ui() 
         self.global_server, self.global_port = start_global_server()
         disable_power_throttling() 
@@ -832,6 +3743,7 @@ class UltraEncoderApp(DnDWindow):
             self.drop_target_register(DND_FILES)
             self.dnd_bind('<<Drop>>', self.drop_file)
         self.after(200, self.preload_help_window)
+        self.after(UI_FRAME_MS, self._ui_pump)
 
     # 在主类 UltraEncoderApp 中添加调用方法
     def show_toast(self, message, icon="✨"):
@@ -862,11 +3774,11 @@ class UltraEncoderApp(DnDWindow):
 
     def check_placeholder(self):
         if not self.file_queue:
-            self.scroll.pack_forget()
+            self.task_list.pack_forget()
             self.lbl_placeholder.pack(fill="both", expand=True, padx=10, pady=5)
         else:
             self.lbl_placeholder.pack_forget()
-            self.scroll.pack(fill="both", expand=True, padx=10, pady=5)
+            self.task_list.pack(fill="both", expand=True, padx=10, pady=5)
 
     def add_list(self, files):
         with self.queue_lock: 
@@ -878,9 +3790,7 @@ class UltraEncoderApp(DnDWindow):
                 if f_norm.lower().endswith(('.mp4', '.mkv', '.mov', '.avi', '.ts', '.flv', '.wmv')):
                     self.file_queue.append(f_norm) 
                     existing_paths.add(f_norm) 
-                    if f_norm not in self.task_widgets:
-                        card = TaskCard(self.scroll, 0, f_norm) 
-                        self.task_widgets[f_norm] = card
+                    if f_norm not in self.task_widgets: self.task_widgets[f_norm] = self.task_table.append(f_norm)
                     new_added = True
             
             if not new_added: return
@@ -895,26 +3805,22 @@ class UltraEncoderApp(DnDWindow):
             for f in self.file_queue:
                 widget = self.task_widgets[f]
                 # 如果任务已经在跑了，或者已经进了内存/SSD缓存，就不要动它的位置
-                if widget.status_code in LOCKED_STATES or widget.source_mode in ["RAM", "SSD_CACHE", "DIRECT"]:
+                if widget.status_code in LOCKED_STATES or widget.source_mode in ["RAM", "PIPE", "RING", "SSD_CACHE", "DIRECT"]:
                     immutable_queue.append(f)
                 else:
                     mutable_queue.append(f)
 
             # 对可动区按文件大小排序 (从小到大)
-            mutable_queue.sort(key=lambda x: os.path.getsize(x))
+            mutable_queue.sort(key=lambda x: self.task_widgets[x].file_size_gb)
 
             # 合并队列
             self.file_queue = immutable_queue + mutable_queue
+            if self.running:
+                for f in mutable_queue: self.scheduler.add(f, STATE_PENDING)
+                self.scheduler.reorder(self.file_queue)
             
-            # === [UI 刷新：重绘列表] ===
-            for widget in self.task_widgets.values():
-                widget.pack_forget()
-
-            for i, f in enumerate(self.file_queue):
-                if f in self.task_widgets:
-                    card = self.task_widgets[f]
-                    card.pack(fill="x", pady=4)
-                    card.update_index(i + 1)
+            # === [UI 刷新：虚拟列表只重绑可见行] ===
+            self.task_list.set_rows([self.task_widgets[f] for f in self.file_queue])
             
             # 视觉反馈
             if self.running: 
@@ -976,29 +3882,13 @@ class UltraEncoderApp(DnDWindow):
         set_execution_state(False)
         os._exit(0)
     
-    def clean_junk(self):
-        try:
-            for f in self.temp_files:
-                if os.path.exists(f): os.remove(f)
-        except: pass
-        
-    def kill_all_procs(self):
-        for p in list(self.active_procs): 
-            try: p.terminate(); p.kill()
-            except: pass
-        try: 
-            if platform.system() == "Windows":
-                subprocess.run(["taskkill", "/F", "/IM", "ffmpeg.exe"], creationflags=subprocess.CREATE_NO_WINDOW)
-            else:
-                subprocess.run(["pkill", "-f", "ffmpeg"])
-        except: pass
-
     def sys_check(self):
         if not check_ffmpeg():
             messagebox.showerror("错误", "找不到 FFmpeg！自动下载失败，请手动安装。")
             return
         threading.Thread(target=self.scan_disk, daemon=True).start()
         threading.Thread(target=self.gpu_monitor_loop, daemon=True).start()
+        threading.Thread(target=self.cache_monitor_loop, daemon=True).start()
         self.update_monitor_layout()
 
     def get_total_vram_gb(self):
@@ -1041,11 +3931,24 @@ class UltraEncoderApp(DnDWindow):
             except: pass
             time.sleep(1)
 
+    # 缓存账本计数 (内存层 已用/上限，SSD 缓存层已用)
+    def cache_monitor_loop(self):
+        while True:
+            snap = CACHE_LEDGER.snapshot()
+            ram_gb = (snap["RAM"]["reserved"] + snap["RAM"]["held"]) / (1024**3)
+            ssd_gb = (snap["SSD_CACHE"]["reserved"] + snap["SSD_CACHE"]["held"]) / (1024**3)
+            color = COLOR_SSD_CACHE if ram_gb > MAX_RAM_LOAD_GB * 0.9 else "#555"
+            text = f"RAM {ram_gb:.1f}/{MAX_RAM_LOAD_GB:.0f}G | SSD {ssd_gb:.1f}G"
+            if self.running and self.concurrency: text += f" | 并发 {self.concurrency.limit}/{self.current_workers}"
+            self.safe_update(self.lbl_cache.configure, text=text, text_color=color)
+            time.sleep(1)
+
     def scan_disk(self):
         path = find_best_cache_drive(manual_override=self.manual_cache_path)
         cache_dir = os.path.join(path, "_Ultra_Smart_Cache_")
         os.makedirs(cache_dir, exist_ok=True)
         self.temp_dir = cache_dir
+        self.open_ssd_index()
         self.safe_update(self.btn_cache.configure, text=f"缓存池: {path} (点击修改)")
 
     def select_cache_folder(self):
@@ -1064,6 +3967,7 @@ class UltraEncoderApp(DnDWindow):
             self.stop()
 
     def detect_optimal_concurrency(self):
+        # 自适应并发开启时，这里的检测结果即为上限：ConcurrencyController 只会在 1..N 之间向下调整
         optimal_n = 2
         try:
             gpu_name = "Unknown"
@@ -1342,7 +4246,7 @@ class UltraEncoderApp(DnDWindow):
         self.seg_codec.pack(fill="x")
         self.btn_action = ctk.CTkButton(l_btm, text="COMPRESS / 压制", height=55, corner_radius=12, font=("微软雅黑", 18, "bold"), fg_color=COLOR_ACCENT, hover_color=COLOR_ACCENT_HOVER, text_color="#000", command=self.toggle_action)
         self.btn_action.pack(fill="x", padx=UNIFIED_PAD_X, pady=20)
-        self.scroll = ctk.CTkScrollableFrame(left, fg_color="transparent")
+        self.task_list = VirtualTaskList(left)
         self.lbl_placeholder = ctk.CTkLabel(left, text="📂\n\nDrag & Drop Video Files Here\n拖入视频文件开启任务", font=("微软雅黑", 16, "bold"), text_color="#444444", justify="center")
         self.check_placeholder()
         right = ctk.CTkFrame(self, fg_color=COLOR_PANEL_RIGHT, corner_radius=0)
@@ -1354,6 +4258,8 @@ class UltraEncoderApp(DnDWindow):
         self.lbl_run_status.pack(side="left", padx=20, pady=2) 
         self.lbl_gpu = ctk.CTkLabel(r_head, text="GPU: --W | --°C", font=("Consolas", 14, "bold"), text_color="#444")
         self.lbl_gpu.pack(side="right")
+        self.lbl_cache = ctk.CTkLabel(r_head, text="", font=("Consolas", 12), text_color="#555")
+        self.lbl_cache.pack(side="right", padx=15)
         # [修改] 使用普通的 Frame，彻底告别滚动条
         self.monitor_frame = ctk.CTkFrame(right, fg_color="transparent")
         self.monitor_frame.pack(fill="both", expand=True, padx=25, pady=(0, 15))
@@ -1363,13 +4269,13 @@ class UltraEncoderApp(DnDWindow):
 
     def clear_all(self):
         if self.running: return 
-        for k, v in self.task_widgets.items(): v.destroy()
         self.task_widgets.clear()
+        self.task_table.clear()
         self.file_queue.clear()
+        self.task_list.set_rows([])
+        self.task_list.scroll_to(0)
         self.check_placeholder()
         self.finished_tasks_count = 0
-        try: self.scroll._parent_canvas.yview_moveto(0.0)
-        except: pass
         self.reset_ui_state()
         self.lbl_run_status.configure(text="")
         self.update_monitor_layout(force_reset=True)
@@ -1472,85 +4378,32 @@ class UltraEncoderApp(DnDWindow):
                 # === 单列模式 ===
                 ch.grid(row=i, column=0, columnspan=2, sticky="ew", padx=5, pady=5)
 
-    def process_caching(self, src_path, widget, lock_obj=None, no_wait=False):
-        file_size = os.path.getsize(src_path)
-        file_size_gb = file_size / (1024**3)
-        is_ssd = is_drive_ssd(src_path)
-        is_external = is_bus_usb(src_path)
-        if is_ssd and not is_external:
-            self.safe_update(widget.set_status, "就绪 (SSD直读)", COLOR_DIRECT, STATUS_READY)
-            widget.source_mode = "DIRECT"
-            return True
-        if file_size_gb < MAX_RAM_LOAD_GB:
-             wait_count = 0
-             limit = 0 if no_wait else 60 
-             while wait_count < limit: 
-                 free_ram = get_free_ram_gb()
-                 available = free_ram - SAFE_RAM_RESERVE
-                 if available > file_size_gb: break 
-                 if wait_count == 0: self.safe_update(widget.set_status, "⏳ 等待内存...", COLOR_WAITING, STATUS_WAIT)
-                 if self.stop_flag: return False
-                 time.sleep(0.5)
-                 wait_count += 1
-        if lock_obj: lock_obj.acquire()
-        try:
-            free_ram = get_free_ram_gb()
-            available_for_cache = free_ram - SAFE_RAM_RESERVE
-            if available_for_cache > file_size_gb and file_size_gb < MAX_RAM_LOAD_GB:
-                self.safe_update(widget.set_status, "📥 载入内存中...", COLOR_RAM, STATUS_CACHING)
-                self.safe_update(widget.set_progress, 0, COLOR_RAM)
-                try:
-                    chunk_size = 64 * 1024 * 1024 
-                    data_buffer = bytearray()
-                    read_len = 0
-                    with open(src_path, 'rb') as f:
-                        while True:
-                            if self.stop_flag: return False
-                            chunk = f.read(chunk_size)
-                            if not chunk: break
-                            data_buffer.extend(chunk) 
-                            read_len += len(chunk)
-                            if file_size > 0:
-                                prog = read_len / file_size
-                                self.safe_update(widget.set_progress, prog, COLOR_READING)
-                    token = str(uuid.uuid4().hex) 
-                    GLOBAL_RAM_STORAGE[token] = data_buffer
-                    PATH_TO_TOKEN_MAP[src_path] = token
-                    self.safe_update(widget.set_status, "就绪 (内存加速)", COLOR_READY_RAM, STATUS_READY)                    
-                    self.safe_update(widget.set_progress, 1, COLOR_READY_RAM)
-                    widget.source_mode = "RAM"
-                    return True
-                except Exception: 
-                    widget.clean_memory() 
-            self.safe_update(widget.set_status, "📥 写入缓存...", COLOR_SSD_CACHE, STATUS_CACHING)
-            self.safe_update(widget.set_progress, 0, COLOR_SSD_CACHE)
-            try:
-                fname = os.path.basename(src_path)
-                cache_path = os.path.join(self.temp_dir, f"CACHE_{int(time.time())}_{fname}")
-                copied = 0
-                with open(src_path, 'rb') as fsrc:
-                    with open(cache_path, 'wb') as fdst:
-                        while True:
-                            if self.stop_flag: 
-                                fdst.close(); os.remove(cache_path); return False
-                            chunk = fsrc.read(32*1024*1024) 
-                            if not chunk: break
-                            fdst.write(chunk)
-                            copied += len(chunk)
-                            if file_size > 0:
-                                self.safe_update(widget.set_progress, copied/file_size, COLOR_SSD_CACHE)
-                self.temp_files.add(cache_path)
-                widget.ssd_cache_path = cache_path
-                widget.source_mode = "SSD_CACHE"
-                self.safe_update(widget.set_status, "就绪 (缓存加速)", COLOR_SSD_CACHE, STATUS_READY)
-                self.safe_update(widget.set_progress, 1, COLOR_SSD_CACHE)
-                return True
-            except:
-                self.safe_update(widget.set_status, "缓存失败", COLOR_ERROR, STATUS_ERR)
-                return False
-        finally:
-            if lock_obj: lock_obj.release()
-        
+    # --- EncoderCore 钩子 ---
+    def get_encode_settings(self):
+        return {"codec": self.codec_var.get(), "use_gpu": self.gpu_var.get(), "hybrid": self.hybrid_var.get(),
+                "use_10bit": self.depth_10bit_var.get(), "crf": self.crf_var.get(), "keep_meta": self.keep_meta_var.get()}
+
+    def get_monitor_channel(self, slot_idx, task_file):
+        if slot_idx < len(self.monitor_slots): return self.monitor_slots[slot_idx]
+        return None
+
+    def on_task_dispatched(self, task_file):
+        self.safe_update(self.task_list.scroll_to_task, task_file)
+
+    def report_error(self, title, message, popup=False):
+        if popup: self.show_custom_popup(title, message)
+        else: self.safe_update(messagebox.showerror, title, message)
+
+    def on_batch_finished(self):
+        if not self.stop_flag:
+            self.safe_update(self.launch_fireworks)
+            def set_complete_state():
+                self.btn_action.configure(text="COMPLETED / 已完成", fg_color=COLOR_SUCCESS, hover_color="#27AE60", state="disabled")
+                self.lbl_run_status.configure(text="✨ All Tasks Finished")
+                self.btn_clear.configure(state="normal") 
+            self.safe_update(set_complete_state)
+        else: self.safe_update(self.reset_ui_state)
+
     def run(self):
         if not self.file_queue: return
         if self.running: return
@@ -1577,15 +4430,13 @@ class UltraEncoderApp(DnDWindow):
                     card.set_status("等待处理", "#888", STATUS_WAIT)
                     card.set_progress(0)
                     card.clean_memory() 
-                    if card.ssd_cache_path and os.path.exists(card.ssd_cache_path):
-                        try: os.remove(card.ssd_cache_path)
-                        except: pass
-                    card.ssd_cache_path = None
+                    card.ssd_cache_path = None # 缓存文件保留在持久化缓存池中，重跑时按键命中
                     card.source_mode = "PENDING"
         threading.Thread(target=self.engine, daemon=True).start()
 
     def stop(self):
         self.stop_flag = True
+        self.scheduler.wake()
         self.kill_all_procs()
         self.btn_action.configure(text="正在停止...", state="disabled")
 
@@ -1595,15 +4446,6 @@ class UltraEncoderApp(DnDWindow):
         self.btn_clear.configure(state="normal")
         self.update_monitor_layout(force_reset=True)
 
-    def get_dur(self, path):
-        try:
-            # 使用 FFMPEG_PATH 衍生出的 FFPROBE_PATH
-            cmd = [FFPROBE_PATH, "-v", "error", "-show_entries", "format=duration", "-of", "default=noprint_wrappers=1:nokey=1", path]
-            kwargs = get_subprocess_args()
-            out = subprocess.check_output(cmd, **kwargs).strip()
-            return float(out)
-        except: return 0
-
     def add_file(self):
         files = filedialog.askopenfilenames(title="选择视频文件", filetypes=[("Video Files", "*.mp4 *.mkv *.mov *.avi *.ts *.flv *.wmv")])
         if files: 
@@ -1741,449 +4583,6 @@ class UltraEncoderApp(DnDWindow):
             if 'top' in locals() and top.winfo_exists(): top.destroy()
             self.show_toast("✨ 所有任务已完成 / All Tasks Finished! ✨", "🏆")
 
-    def print_batch_summary(self):
-        total_in_bytes = 0
-        total_out_bytes = 0
-        file_count = 0
-
-        print("\n" + "="*50)
-        print("          BATCH COMPRESSION SUMMARY          ")
-        print("="*50)
-
-        with self.queue_lock:
-            for f in self.file_queue:
-                card = self.task_widgets[f]
-                # 只统计成功完成的任务
-                if card.status_code == STATE_DONE and card.final_output_path and os.path.exists(card.final_output_path):
-                    try:
-                        in_size = os.path.getsize(f)
-                        out_size = os.path.getsize(card.final_output_path)
-                        
-                        total_in_bytes += in_size
-                        total_out_bytes += out_size
-                        file_count += 1
-                        
-                        # 打印单个文件详情（可选）
-                        # ratio = (out_size / in_size) * 100
-                        # print(f"[{file_count}] {os.path.basename(f)}: {ratio:.1f}%")
-                    except: pass
-
-        if file_count == 0:
-            print("No files were successfully processed.")
-        else:
-            total_in_mb = total_in_bytes / (1024 * 1024)
-            total_out_mb = total_out_bytes / (1024 * 1024)
-            saved_mb = total_in_mb - total_out_mb
-            
-            # 平均压缩率 (总输出 / 总输入)
-            avg_ratio = (total_out_bytes / total_in_bytes) * 100 if total_in_bytes > 0 else 0
-            
-            print(f"Total Files Processed : {file_count}")
-            print(f"Total Original Size   : {total_in_mb:.2f} MB ({total_in_mb/1024:.2f} GB)")
-            print(f"Total Compressed Size : {total_out_mb:.2f} MB ({total_out_mb/1024:.2f} GB)")
-            print("-" * 50)
-            print(f"Space Saved           : {saved_mb:.2f} MB")
-            print(f"Average Ratio         : {avg_ratio:.2f}% (Output is {avg_ratio:.2f}% of Original)")
-        print("="*50 + "\n")
-
-    def engine(self):
-        total_ram_limit = MAX_RAM_LOAD_GB 
-        current_ram_usage = 0.0            
-        is_cache_ssd = is_drive_ssd(self.temp_dir) or (self.manual_cache_path and is_drive_ssd(self.manual_cache_path))
-        io_concurrency = self.current_workers if is_cache_ssd else 1
-        self.io_executor = ThreadPoolExecutor(max_workers=io_concurrency)
-        while not self.stop_flag:
-            active_io_count = 0
-            active_compute_count = 0
-            current_ram_usage = 0.0
-            with self.queue_lock:
-                for f in self.file_queue:
-                    card = self.task_widgets[f]
-                    if card.source_mode == "RAM" and card.status_code not in [STATE_DONE, STATE_ERROR]:
-                        current_ram_usage += card.file_size_gb
-                    if card.status_code in [STATE_QUEUED_IO, STATE_CACHING]: active_io_count += 1
-                    elif card.status_code == STATE_ENCODING: active_compute_count += 1
-            with self.queue_lock:
-                for f in self.file_queue:
-                    card = self.task_widgets[f]
-                    if card.status_code == STATE_PENDING:
-                        source_is_ssd = is_drive_ssd(f)
-                        if source_is_ssd:
-                            card.source_mode = "DIRECT"
-                            card.status_code = STATE_READY 
-                            self.safe_update(card.set_status, "就绪 (SSD直读)", COLOR_DIRECT, STATE_READY)
-                            self.safe_update(card.set_progress, 1.0, COLOR_DIRECT)
-                            continue 
-                        else:
-                            if active_io_count >= 1: break 
-                            predicted_usage = current_ram_usage + card.file_size_gb
-                            if predicted_usage < total_ram_limit:
-                                should_use_ram = True
-                                current_ram_usage += card.file_size_gb 
-                            else: should_use_ram = False 
-                            card.source_mode = "RAM" if should_use_ram else "SSD_CACHE"
-                            card.status_code = STATE_QUEUED_IO
-                            active_io_count += 1
-                            self.io_executor.submit(self._worker_io_task, f)
-                            break
-            if active_compute_count < self.current_workers:
-                with self.queue_lock:
-                    for f in self.file_queue:
-                        card = self.task_widgets[f]
-                        if card.status_code == STATE_READY:
-                            card.status_code = STATE_ENCODING
-                            active_compute_count += 1
-                            self.executor.submit(self._worker_compute_task, f)
-                            self.safe_update(self.scroll_to_card, card)
-                            if active_compute_count >= self.current_workers: break
-            all_done = True
-            with self.queue_lock:
-                for f in self.file_queue:
-                    if self.task_widgets[f].status_code not in [STATE_DONE, STATE_ERROR]: all_done = False; break
-            if all_done and active_io_count == 0 and active_compute_count == 0: break
-            time.sleep(0.1) 
-        self.running = False
-        if not self.stop_flag:
-            self.safe_update(self.launch_fireworks)
-            self.print_batch_summary()
-            def set_complete_state():
-                self.btn_action.configure(text="COMPLETED / 已完成", fg_color=COLOR_SUCCESS, hover_color="#27AE60", state="disabled")
-                self.lbl_run_status.configure(text="✨ All Tasks Finished")
-                self.btn_clear.configure(state="normal") 
-            self.safe_update(set_complete_state)
-        else: self.safe_update(self.reset_ui_state)
-
-    def _worker_io_task(self, task_file):
-        card = self.task_widgets[task_file]
-        try:
-            self.safe_update(card.set_status, "📥正在加载...", COLOR_READING, STATE_CACHING)
-            success = self.process_caching(task_file, card, lock_obj=None, no_wait=True)
-            if success:
-                self.safe_update(card.set_status, "⚡就绪 (等待编码)", COLOR_READY_RAM if card.source_mode == "RAM" else COLOR_SSD_CACHE, STATE_READY)
-            else: self.safe_update(card.set_status, "IO 失败", COLOR_ERROR, STATE_ERROR)
-        except Exception as e:
-            print(f"IO Error: {e}")
-            self.safe_update(card.set_status, "IO 错误", COLOR_ERROR, STATE_ERROR)
-
-    def analyze_ffmpeg_log(self, logs):
-        log_text = "\n".join(logs[-30:]) 
-        # [修正] 删除了 ("aac", ...) 这个会导致误报的条目
-        error_patterns = [
-            ("Permission denied", "❌ 文件权限不足"), 
-            ("No such file", "❌ 找不到输入文件"), 
-            ("Unknown encoder", "❌ 找不到编码器"), 
-            ("Device mismatch", "❌ 显卡设备不匹配"), 
-            ("out of memory", "❌ 显存/内存不足"), 
-            ("Tag", "❌ 容器格式不兼容"), 
-            ("Invalid data", "❌ 数据流损坏"), 
-            ("Server returned 404", "❌ 内存数据丢失"), 
-            ("Qavg: nan", "❌ 音频编码崩溃")
-        ]
-        for pattern, reason in error_patterns:
-            if pattern in log_text or pattern.lower() in log_text.lower(): return reason
-        
-        # 如果没匹配到已知错误，打印最后几行日志到控制台，方便排查 SSD 到底哪里错了
-        print("--- [Unknown FFmpeg Error Log] ---")
-        print(log_text)
-        print("----------------------------------")
-        return "❌ 未知错误 (请查看控制台)"
-
-    def check_decoding_capability(self, input_path):
-        try:
-            # 使用全局 FFPROBE_PATH
-            cmd = [FFPROBE_PATH, "-v", "error", "-select_streams", "v:0", "-show_entries", "stream=pix_fmt,codec_name", "-of", "csv=p=0", input_path]
-            kwargs = get_subprocess_args()
-            output = subprocess.check_output(cmd, encoding='utf-8', **kwargs).strip()
-            parts = output.split(',')
-            codec_name = parts[0].strip()
-            pix_fmt = parts[1].strip() if len(parts) > 1 else ""
-            unsupported_pix_fmts = ["yuv422p10le", "yuv422p10be", "yuv422p12le", "yuv422p12be", "yuv444p10le", "yuv444p12le"]
-            can_hw_decode = True
-            if pix_fmt in unsupported_pix_fmts:
-                can_hw_decode = False
-                print(f"[Smart Check] 检测到高规格素材 ({pix_fmt})，将强制使用 CPU 解码以保证稳定。")
-            return {"can_hw_decode": can_hw_decode, "pix_fmt": pix_fmt, "codec_name": codec_name}
-        except Exception as e:
-            print(f"[Check Error] 检测失败，默认回退到 CPU 解码: {e}")
-            return {"can_hw_decode": False, "pix_fmt": "unknown", "codec_name": "unknown"}
-
-    def _worker_compute_task(self, task_file):
-        card = self.task_widgets[task_file]
-        fname = os.path.basename(task_file)
-        slot_idx = -1
-        ch_ui = None
-        proc = None
-        working_output_file = None 
-        temp_audio_wav = os.path.join(self.temp_dir, f"TEMP_AUDIO_{uuid.uuid4().hex}.wav")
-        output_log = []
-        input_size = 0
-        duration = 1.0
-        with self.slot_lock:
-            if self.available_indices:
-                slot_idx = self.available_indices.pop(0)
-                if slot_idx < len(self.monitor_slots): ch_ui = self.monitor_slots[slot_idx]
-        if not ch_ui: 
-            class DummyUI: 
-                def activate(self, *a): pass
-                def update_data(self, *a): pass
-                def reset(self): pass
-            ch_ui = DummyUI()
-        try:
-            self.safe_update(ch_ui.activate, fname, "⏳ 正在预处理 / Pre-processing...")
-            if os.path.exists(task_file):
-                input_size = os.path.getsize(task_file)
-                duration = self.get_dur(task_file)
-                if duration <= 0: duration = 1.0
-            need_audio_extract = True 
-            decode_info = self.check_decoding_capability(task_file)
-            hw_decode_allowed = decode_info["can_hw_decode"]
-            has_audio = False
-            if need_audio_extract:
-                self.safe_update(ch_ui.activate, fname, "🎵 正在分离音频流 / Extracting Audio...")
-                self.safe_update(card.set_status, "🎵 提取音频...", COLOR_READING, STATE_ENCODING)
-                # 使用全局 FFMPEG_PATH
-                extract_cmd = [FFMPEG_PATH, "-y", "-i", task_file, "-vn", "-acodec", "pcm_s16le", "-ar", "44100", "-ac", "2", "-f", "wav", temp_audio_wav]
-                kwargs = get_subprocess_args()
-                subprocess.run(extract_cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, **kwargs)
-                if os.path.exists(temp_audio_wav) and os.path.getsize(temp_audio_wav) > 1024: has_audio = True
-            self.safe_update(card.set_status, "▶️ 智能编码中...", COLOR_ACCENT, STATE_ENCODING)
-            codec_sel = self.codec_var.get()
-            using_gpu = self.gpu_var.get()
-            is_mixed_mode = self.hybrid_var.get()
-            is_even_slot = (slot_idx % 2 == 0)
-            final_hw_decode = using_gpu and hw_decode_allowed
-            if is_mixed_mode and is_even_slot: final_hw_decode = False 
-            final_hw_encode = using_gpu
-            input_video_source = task_file
-            if not final_hw_decode and card.source_mode == "RAM":
-                token = PATH_TO_TOKEN_MAP.get(task_file)
-                if token: input_video_source = f"http://127.0.0.1:{self.global_port}/{token}"
-            elif card.source_mode == "SSD_CACHE" and card.ssd_cache_path:
-                # [新增] 强制转换为绝对路径，防止 FFmpeg 在不同盘符间迷路
-                input_video_source = os.path.abspath(card.ssd_cache_path)
-            output_dir = os.path.dirname(task_file)
-            f_name_no_ext = os.path.splitext(fname)[0]
-            date_str = time.strftime("%Y%m%d")
-            final_filename = f"{f_name_no_ext}_Compressed_{date_str}.mp4"
-            final_output_path = os.path.join(output_dir, final_filename)
-            temp_output_filename = f"TEMP_ENC_{uuid.uuid4().hex}.mp4"
-            working_output_file = os.path.join(self.temp_dir, temp_output_filename)
-            
-            # =========================================================
-            # === [修复版] 构建 FFmpeg 命令 (自动识别 Win/Mac) ===
-            # =========================================================
-            cmd = [FFMPEG_PATH, "-y"]
-            
-            # --- 1. 硬件解码参数配置 ---
-            if final_hw_decode:
-                if platform.system() == "Darwin":
-                    # Mac 硬件解码
-                    cmd.extend(["-hwaccel", "videotoolbox"])
-                else:
-                    # Windows (NVIDIA) 硬件解码
-                    cmd.extend(["-hwaccel", "cuda", "-hwaccel_output_format", "cuda"])
-                    # cmd.extend(["-extra_hw_frames", "2"]) 
-
-            # --- 2. 输入源参数 ---
-            if not final_hw_decode and card.source_mode == "RAM":
-                cmd.extend(["-probesize", "50M", "-analyzeduration", "100M"])
-            
-            cmd.extend(["-i", input_video_source])
-            if has_audio: cmd.extend(["-i", temp_audio_wav])
-            
-            # --- 3. 映射流 ---
-            cmd.extend(["-map", "0:v:0"])
-            if has_audio: cmd.extend(["-map", "1:a:0"])
-
-            # --- 4. 编码器选择逻辑 ---
-            v_codec = "libx264" # 默认 CPU 编码
-            if final_hw_encode:
-                if platform.system() == "Darwin":
-                    # === Mac VideoToolbox 编码器 ===
-                    if "H.264" in codec_sel: v_codec = "h264_videotoolbox"
-                    elif "H.265" in codec_sel: v_codec = "hevc_videotoolbox"
-                    elif "AV1" in codec_sel: 
-                        # 目前大多数 Mac 不支持 AV1 硬编，回退到 CPU 防止报错
-                        # (M3 Pro/Max 支持，但为了兼容性建议先软解，或者你需要手动改为 libaom-av1)
-                        v_codec = "libsvtav1"
-                        final_hw_encode = False 
-                else:
-                    # === Windows NVENC 编码器 ===
-                    if "H.264" in codec_sel: v_codec = "h264_nvenc"
-                    elif "H.265" in codec_sel: v_codec = "hevc_nvenc"
-                    elif "AV1" in codec_sel: v_codec = "av1_nvenc"
-                
-                cmd.extend(["-c:v", v_codec])
-
-            # --- 5. 编码参数 (色深、码率控制) ---
-            use_10bit = self.depth_10bit_var.get()
-            # 修正：部分 H.264 硬编不支持 10bit，强制关闭以防报错
-            if final_hw_encode and "H.264" in codec_sel and use_10bit: use_10bit = False
-
-            if final_hw_encode:
-                # === 硬件编码参数 ===
-                if platform.system() == "Darwin":
-                    # [Mac 特有配置]
-                    # VideoToolbox 不支持 -rc vbr -cq，而是使用 -q:v (0-100, 越高越好)
-                    # 我们需要把 CRF (16-40, 越低越好) 映射反转一下
-                    # 映射算法：CRF 20 -> Q 75, CRF 30 -> Q 50
-                    mac_quality = int(100 - (self.crf_var.get() * 2.2))
-                    if mac_quality < 20: mac_quality = 20
-                    cmd.extend(["-q:v", str(mac_quality)])
-                    
-                    # Mac 10-bit 处理
-                    if use_10bit: cmd.extend(["-pix_fmt", "p010le"])
-                    else: cmd.extend(["-pix_fmt", "yuv420p"])
-
-                else:
-                    # [Windows/NVIDIA 特有配置]
-                    if use_10bit:
-                        if final_hw_decode: cmd.extend(["-vf", "scale_cuda=format=p010le"]) 
-                        else: cmd.extend(["-pix_fmt", "p010le"])
-                    else:
-                        if final_hw_decode: cmd.extend(["-vf", "scale_cuda=format=yuv420p"]) 
-                        else: cmd.extend(["-pix_fmt", "yuv420p"]) 
-                    
-                    cmd.extend(["-rc", "vbr", "-cq", str(self.crf_var.get()), "-b:v", "0"])
-                    if "AV1" not in codec_sel: cmd.extend(["-preset", "p4"])
-
-            else:
-                # === CPU 纯软解参数 (通用) ===
-                if use_10bit: cmd.extend(["-pix_fmt", "yuv420p10le"])
-                else: cmd.extend(["-pix_fmt", "yuv420p"])
-                cmd.extend(["-crf", str(self.crf_var.get()), "-preset", "medium"])
-            
-            # --- 6. 其他参数 ---
-            if has_audio: cmd.extend(["-c:a", "aac", "-b:a", "320k"])
-            if self.keep_meta_var.get(): cmd.extend(["-map_metadata", "0"])
-            cmd.extend(["-progress", "pipe:1", "-nostats", working_output_file])
-            # =========================================================
-
-            # 使用 subprocess 跨平台参数
-            kwargs = get_subprocess_args()
-            if platform.system() == "Windows":
-                 proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, startupinfo=kwargs['startupinfo'], creationflags=kwargs['creationflags'])
-            else:
-                 proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-
-            self.active_procs.append(proc)
-            def log_stderr(p):
-                for l in p.stderr:
-                    try: output_log.append(l.decode('utf-8', errors='ignore').strip())
-                    except: pass
-            threading.Thread(target=log_stderr, args=(proc,), daemon=True).start()
-            info_decode = "GPU" if final_hw_decode else "CPU"
-            info_encode = "GPU" if final_hw_encode else "CPU"
-            tag_info = f"Dec:{info_decode} | Enc:{info_encode}"
-            if card.source_mode == "RAM": tag_info += " | RAM"
-            self.safe_update(ch_ui.activate, fname, tag_info)
-            # =========================================================
-            # === [修复版] 进度读取循环 (解决 Mac 进度条回跳/抽动问题) ===
-            # =========================================================
-            progress_stats = {}
-            start_t = time.time()
-            last_ui_update_time = 0 
-            ui_update_interval = 0.1 # 加快刷新频率让动画更丝滑
-            max_prog_reached = 0.0   # [核心修复] 记录已达到的最大进度
-            
-            for line in proc.stdout:
-                if self.stop_flag: break
-                try: 
-                    line_str = line.decode('utf-8', errors='ignore').strip()
-                    if not line_str: continue
-                    
-                    if "=" in line_str:
-                        key, value = line_str.split("=", 1)
-                        progress_stats[key.strip()] = value.strip()
-                        
-                        if key.strip() == "out_time_us":
-                            now = time.time()
-                            # 限制 UI 刷新频率，防止主线程卡顿
-                            if now - last_ui_update_time > ui_update_interval:
-                                fps = float(progress_stats.get("fps", "0")) if "fps" in progress_stats else 0.0
-                                current_us = int(value.strip())
-                                
-                                # 计算原始进度
-                                raw_prog = (current_us / 1000000.0) / duration
-                                
-                                # [核心修复逻辑]
-                                # 只有当新进度大于历史最大进度时，才更新 UI
-                                # 这样可以过滤掉 B 帧造成的“时间戳回退”，解决进度条抽搐
-                                if raw_prog > max_prog_reached:
-                                    max_prog_reached = raw_prog
-                                
-                                # 确保不超过 100%
-                                final_prog = min(1.0, max_prog_reached)
-                                
-                                eta = "--:--"
-                                elapsed = now - start_t
-                                if final_prog > 0.005:
-                                    eta_sec = (elapsed / final_prog) - elapsed
-                                    if eta_sec < 0: eta_sec = 0
-                                    eta = f"{int(eta_sec//60):02d}:{int(eta_sec%60):02d}"
-                                
-                                ratio = 0.0
-                                if working_output_file and os.path.exists(working_output_file) and final_prog > 0.01:
-                                    curr_size = os.path.getsize(working_output_file)
-                                    in_proc = input_size * final_prog
-                                    if in_proc > 0: ratio = (curr_size / in_proc) * 100
-                                
-                                self.safe_update(ch_ui.update_data, fps, final_prog, eta, ratio)
-                                self.safe_update(card.set_progress, final_prog, COLOR_ACCENT)
-                                last_ui_update_time = now
-                except: pass
-            proc.wait()
-            if proc in self.active_procs: self.active_procs.remove(proc)
-            if os.path.exists(temp_audio_wav):
-                try: os.remove(temp_audio_wav)
-                except: pass
-            if self.stop_flag:
-                self.safe_update(card.set_status, "已停止", COLOR_PAUSED, STATE_PENDING)
-            elif proc.returncode == 0:
-                try:
-                    self.safe_update(card.set_status, "📦 正在回写...", COLOR_MOVING, STATE_DONE)
-                    if os.path.exists(working_output_file): shutil.move(working_output_file, final_output_path)
-                    if self.keep_meta_var.get() and os.path.exists(final_output_path): shutil.copystat(task_file, final_output_path)
-                    card.final_output_path = final_output_path
-                    final_size_mb = 0
-                    ratio_str = ""
-                    try:
-                        final_size_mb = os.path.getsize(final_output_path)
-                        saved_percent = (1.0 - (final_size_mb / input_size)) * 100
-                        if saved_percent < 0: ratio_str = f"(+{abs(saved_percent):.1f}%)"
-                        else: ratio_str = f"(-{saved_percent:.1f}%)"
-                    except: pass
-                    status_text = f"完成 {ratio_str}"
-                    self.safe_update(card.set_status, status_text, COLOR_SUCCESS, STATE_DONE)
-                    self.safe_update(card.set_progress, 1.0, COLOR_SUCCESS)
-                except Exception as move_err:
-                    print(f"Move Error: {move_err}")
-                    self.safe_update(card.set_status, "回写失败", COLOR_ERROR, STATE_ERROR)
-                    saved_path = working_output_file
-                    working_output_file = None 
-                    self.show_custom_popup("回写错误", f"无法移回原目录，已保留在缓存池：\n{saved_path}")
-            else:
-                err_msg = self.analyze_ffmpeg_log(output_log)
-                print(f"Task Failed: {fname}\nReason: {err_msg}")
-                self.safe_update(card.set_status, "转码失败", COLOR_ERROR, STATE_ERROR)
-                self.safe_update(messagebox.showerror, "错误", f"处理 {fname} 时发生错误：\n{err_msg}")
-        except Exception as e:
-            print(f"Critical System Error: {e}")
-            self.safe_update(card.set_status, "系统错误", COLOR_ERROR, STATE_ERROR)
-        finally:
-            token = PATH_TO_TOKEN_MAP.get(task_file)
-            if token and token in GLOBAL_RAM_STORAGE:
-                 del GLOBAL_RAM_STORAGE[token]
-                 del PATH_TO_TOKEN_MAP[task_file]
-            if working_output_file and os.path.exists(working_output_file):
-                try: os.remove(working_output_file)
-                except: pass
-            self.safe_update(ch_ui.reset)
-            with self.slot_lock:
-                if slot_idx != -1:
-                    self.available_indices.append(slot_idx)
-                    self.available_indices.sort()
-
 if __name__ == "__main__":
     try:
         if platform.system() == "Windows":
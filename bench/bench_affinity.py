@@ -0,0 +1,69 @@
+# CPU 分区基准 (需要 ffmpeg)：2 / 3 / 4 个软件编码同时运行时的总吞吐
+#   free   - 不绑定 CPU，每个 FFmpeg 按全部核心开线程 (旧行为)
+#   pinned - 按 partition_cpus 分到互不重叠的 CPU 集合 (NUMA / SMT 感知)，
+#            build_encode_command 据此设置 -threads 与 x264/x265 线程池
+# 吞吐以 "总编码视频时长 / 墙钟" 表示 (倍速)，越大越好
+# 用法: python bench/bench_affinity.py [--input clip.mp4 | --duration 60] [--codec H.264|H.265] [--workers 2 3 4]
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from common import load_core, require_ffmpeg
+
+def make_source(path, duration):
+    subprocess.run(["ffmpeg", "-v", "error", "-y", "-f", "lavfi", "-i", f"testsrc2=size=1920x1080:rate=30:duration={duration}",
+                    "-c:v", "libx264", "-preset", "ultrafast", "-g", "60", path], check=True)
+
+def encode(c, src, out, settings, cpus):
+    cmd, _ = c.build_encode_command(src, out, settings, False, cpus=cpus)
+    # 与 _run_ffmpeg 相同的绑定方式 (taskset 前缀或 Popen 之后设置)，线程池里不用 preexec_fn
+    proc = subprocess.Popen(c.affinity_prefix(cpus) + cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    c.pin_process(proc, cpus)
+    _, err = proc.communicate()
+    if proc.returncode != 0: raise RuntimeError(err[-2000:])
+
+def run_batch(c, src, work, settings, n, pinned):
+    parts = c.partition_cpus(n) if pinned else []
+    if pinned and not parts: return None
+    t = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=n) as pool:
+        list(pool.map(lambda i: encode(c, src, os.path.join(work, f"out_{i}.mp4"), settings, parts[i] if parts else None), range(n)))
+    return time.perf_counter() - t
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--input")
+    parser.add_argument("--duration", type=int, default=60, help="生成测试片的时长 (秒)")
+    parser.add_argument("--codec", default="H.264", choices=["H.264", "H.265"])
+    parser.add_argument("--crf", type=int, default=23)
+    parser.add_argument("--workers", type=int, nargs="+", default=[2, 3, 4])
+    parser.add_argument("--dir", default=tempfile.gettempdir())
+    args = parser.parse_args()
+    if not require_ffmpeg(): return 2
+    if not hasattr(os, "sched_setaffinity"): print("当前系统不支持 sched_setaffinity，只能测 free 模式")
+    c = load_core()
+    settings = {**c.DEFAULT_ENCODE_SETTINGS, "codec": args.codec, "crf": args.crf}
+    work = tempfile.mkdtemp(prefix="cinetico_aff_", dir=args.dir)
+    try:
+        src = args.input or os.path.join(work, "source.mp4")
+        if not args.input: make_source(src, args.duration)
+        duration = c.probe_duration(c.probe_media(src))
+        topo = c.linux_cpu_topology()
+        print(f"source {duration:.1f}s, {args.codec} crf {args.crf}, {os.cpu_count()} CPUs, "
+              f"{len(topo)} physical cores, {len({node for node, _ in topo})} NUMA node(s)")
+        for n in args.workers:
+            row = []
+            for pinned in (False, True):
+                wall = run_batch(c, src, work, settings, n, pinned)
+                row.append("n/a" if wall is None else f"{n * duration / wall:6.2f}x ({wall:6.1f} s)")
+            print(f"{n} workers: free {row[0]}   pinned {row[1]}")
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,110 @@
+# 环回服务器请求延迟与 CPU 基准：8 个并发读取方对同一内存 token 发随机 64KB Range 请求
+#   legacy  - 旧实现：ThreadingTCPServer + SimpleHTTPRequestHandler (HTTP/1.0，每个请求一次握手 + 一个线程)
+#   asyncio - GlobalRamServer：单事件循环，HTTP/1.1 keep-alive，每个读取方复用一条连接
+# 服务器在子进程中运行，结束时报告子进程自身的 CPU 时间，客户端开销不计入
+# 用法: python bench/bench_keepalive.py [--readers 8] [--requests 500]
+import argparse
+import http.client
+import http.server
+import os
+import socketserver
+import subprocess
+import sys
+import threading
+import time
+
+from common import load_core
+
+PAYLOAD_SIZE = 64 * 1024 * 1024
+TOKEN = "bench"
+
+def payload():
+    return bytes(range(256)) * (PAYLOAD_SIZE // 256)
+
+# 与旧版 GlobalRamHandler 相同的处理方式 (只保留本基准用到的单段 Range)
+def legacy_server(data):
+    class Handler(http.server.SimpleHTTPRequestHandler):
+        def log_message(self, format, *args): pass
+        def do_GET(self):
+            start, end = 0, len(data) - 1
+            if "Range" in self.headers:
+                start_str, end_str = self.headers["Range"].split("=")[1].split("-")
+                start, end = int(start_str), int(end_str)
+            self.send_response(206 if "Range" in self.headers else 200)
+            self.send_header("Content-Type", "video/mp4")
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(data)}")
+            self.send_header("Content-Length", str(end - start + 1))
+            self.send_header("Accept-Ranges", "bytes")
+            self.end_headers()
+            self.wfile.write(memoryview(data)[start:end + 1])
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server.server_address[1]
+
+def serve(mode):
+    data = payload()
+    if mode == "legacy": port = legacy_server(data)
+    else:
+        c = load_core()
+        c.GLOBAL_RAM_STORAGE[TOKEN] = data
+        _, port = c.start_global_server()
+    cpu0 = time.process_time()
+    print(f"PORT {port}", flush=True)
+    sys.stdin.readline()
+    print(f"CPU {time.process_time() - cpu0:.4f}", flush=True)
+
+def reader(port, keep_alive, count, seed, latencies, size):
+    conn = None
+    for i in range(count):
+        start = (seed * 7919 + i * 104729) % (PAYLOAD_SIZE - size)
+        t = time.perf_counter()
+        if conn is None: conn = http.client.HTTPConnection("127.0.0.1", port)
+        conn.request("GET", f"/{TOKEN}", headers={"Range": f"bytes={start}-{start + size - 1}"})
+        resp = conn.getresponse()
+        body = resp.read()
+        latencies.append(time.perf_counter() - t)
+        assert len(body) == size
+        if not keep_alive:
+            conn.close()
+            conn = None
+    if conn: conn.close()
+
+# 子进程的启动日志也走 stdout，只取带标记的行
+def read_tagged(proc, tag):
+    while True:
+        line = proc.stdout.readline()
+        if not line: raise RuntimeError("服务器子进程提前退出")
+        if line.startswith(tag + " "): return line.split()[1]
+
+def run(mode, readers, count, size):
+    proc = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--serve", mode], stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+    port = int(read_tagged(proc, "PORT"))
+    latencies = []
+    threads = [threading.Thread(target=reader, args=(port, mode == "asyncio", count, i, latencies, size)) for i in range(readers)]
+    t = time.perf_counter()
+    for th in threads: th.start()
+    for th in threads: th.join()
+    wall = time.perf_counter() - t
+    proc.stdin.write("\n")
+    proc.stdin.flush()
+    cpu = float(read_tagged(proc, "CPU"))
+    proc.wait()
+    latencies.sort()
+    n = len(latencies)
+    print(f"{mode:<8}: p50 {latencies[n // 2] * 1000:6.2f} ms  p99 {latencies[int(n * 0.99)] * 1000:6.2f} ms  "
+          f"{n / wall:7.0f} req/s  server CPU {cpu:.2f} s ({cpu / n * 1e6:.0f} us/req)")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=500, help="每个读取方的请求数")
+    parser.add_argument("--size-kb", type=int, default=64)
+    parser.add_argument("--serve", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.serve: return serve(args.serve)
+    print(f"{args.readers} readers x {args.requests} requests, {args.size_kb} KB ranges")
+    for mode in ("legacy", "asyncio"): run(mode, args.readers, args.requests, args.size_kb * 1024)
+
+if __name__ == "__main__":
+    main()
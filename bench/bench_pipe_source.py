@@ -0,0 +1,89 @@
+# PIPE 源模式 vs HTTP 环回：同一份内存缓存分别经 stdin 管道与 http://127.0.0.1 交给读取进程
+# 比较读取进程 (FFmpeg 或合成读取器) 的 CPU 与峰值 RSS，以及本进程一侧 (服务器事件循环 / 管道写线程) 的 CPU
+#   --input 给出可流式读取的媒体文件 (TS / MKV / 分片 MP4) 且 PATH 中有 ffmpeg 时，读取进程为
+#   ffmpeg -map 0 -c copy -f null -，HTTP 路径带上原来的 -probesize 50M -analyzeduration 100M
+#   否则用随机数据 + Python 读取器，只比较传输本身
+# 用法: python bench/bench_pipe_source.py [--input clip.mkv | --size-mb 512]
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from common import load_core, make_file
+
+SYNTH_STDIN = "import sys\nb=bytearray(1<<22)\nf=sys.stdin.buffer.raw\nwhile f.readinto(b): pass\n"
+SYNTH_HTTP = ("import sys, http.client\nc=http.client.HTTPConnection('127.0.0.1', int(sys.argv[1]))\n"
+              "c.request('GET', '/' + sys.argv[2])\nr=c.getresponse()\nb=bytearray(1<<22)\nwhile r.readinto(b): pass\n")
+
+def consumer_cmd(mode, use_ffmpeg, port, token):
+    if use_ffmpeg:
+        if mode == "pipe": src = ["-i", "pipe:0"]
+        else: src = ["-nostdin", "-probesize", "50M", "-analyzeduration", "100M", "-i", f"http://127.0.0.1:{port}/{token}"]
+        return ["ffmpeg", "-v", "error", *src, "-map", "0", "-c", "copy", "-f", "null", "-"]
+    if mode == "pipe": return [sys.executable, "-c", SYNTH_STDIN]
+    return [sys.executable, "-c", SYNTH_HTTP, str(port), token]
+
+# 读取进程的峰值 RSS：轮询 /proc/<pid>/status 的 VmHWM (exec 之后重新计数；
+# wait4 的 ru_maxrss 会把 fork 时继承的本进程内存也算进去)
+def watch_hwm(pid, cmd, peak):
+    expected = "\0".join(cmd) + "\0"
+    while True:
+        try:
+            with open(f"/proc/{pid}/cmdline") as f:
+                if f.read() != expected: # 还没 exec：此时的 VmHWM 属于 fork 出来的本进程副本
+                    time.sleep(0.001)
+                    continue
+            with open(f"/proc/{pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmHWM:"): peak[0] = max(peak[0], int(line.split()[1]))
+        except OSError: return
+        time.sleep(0.01)
+
+def run(c, mode, buf, use_ffmpeg, port, token):
+    cmd = consumer_cmd(mode, use_ffmpeg, port, token)
+    cpu0 = time.process_time()
+    t = time.perf_counter()
+    proc = subprocess.Popen(cmd, stdin=subprocess.PIPE if mode == "pipe" else subprocess.DEVNULL)
+    peak = [0]
+    threading.Thread(target=watch_hwm, args=(proc.pid, cmd, peak), daemon=True).start()
+    writer = None
+    if mode == "pipe":
+        writer = threading.Thread(target=c.feed_stdin_from_buffer, args=(proc, buf), daemon=True)
+        writer.start()
+    _, status, usage = os.wait4(proc.pid, 0)
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    if writer: writer.join()
+    wall = time.perf_counter() - t
+    ours = time.process_time() - cpu0
+    theirs = usage.ru_utime + usage.ru_stime
+    print(f"{mode:<5}: {wall:6.2f} s wall, reader CPU {theirs:5.2f} s, reader peak RSS {peak[0] / 1024:6.1f} MB, "
+          f"server/writer CPU {ours:5.2f} s, rc={proc.returncode}")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--input", help="可流式读取的媒体文件 (需要 ffmpeg)")
+    parser.add_argument("--size-mb", type=int, default=512, help="未给 --input 时的随机数据大小")
+    args = parser.parse_args()
+    c = load_core()
+    use_ffmpeg = bool(args.input) and shutil.which("ffmpeg") is not None
+    if args.input and not use_ffmpeg: print("PATH 中没有 ffmpeg，改用合成读取器")
+    path = args.input or make_file(os.path.join(tempfile.gettempdir(), f"cinetico_bench_{args.size_mb}mb.bin"), args.size_mb * 1024 * 1024)
+    try:
+        size = os.path.getsize(path)
+        buf = c.load_file_into_ram(path, size)
+        if args.input and not c.is_streamable_container(path, buf): print("注意：该文件不是可流式读取的容器，引擎不会为它选择 PIPE 模式")
+        server, port = c.start_global_server()
+        token = "bench-pipe"
+        c.GLOBAL_RAM_STORAGE[token] = buf
+        print(f"source: {os.path.basename(path)} ({size / 1024**2:.0f} MB), reader: {'ffmpeg -c copy' if use_ffmpeg else 'python'}")
+        for mode in ("http", "pipe"): run(c, mode, buf, use_ffmpeg, port, token)
+        server.shutdown()
+    finally:
+        if not args.input: os.remove(path)
+
+if __name__ == "__main__":
+    main()
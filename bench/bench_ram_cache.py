@@ -0,0 +1,58 @@
+# 内存缓存加载基准：旧的 64MB 分块 bytearray.extend  vs  load_file_into_ram (按大小预分配匿名 mmap + readinto)
+# 每种方式在独立子进程中运行，比较耗时与峰值 RSS (ru_maxrss)。先读一遍文件让两者都命中页缓存，
+# 测的是内存拷贝与扩容开销而不是磁盘速度
+# 用法: python bench/bench_ram_cache.py [--size-mb 2048] [--dir /path/on/target/disk]
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from common import load_core, make_file
+
+def legacy_load(path):
+    data = bytearray()
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(64 * 1024 * 1024)
+            if not chunk: break
+            data.extend(chunk)
+    return data
+
+def child(mode, path):
+    size = os.path.getsize(path)
+    if mode == "mmap": c = load_core()
+    base = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    t = time.perf_counter()
+    buf = legacy_load(path) if mode == "bytearray" else c.load_file_into_ram(path, size)
+    dt = time.perf_counter() - t
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - base
+    assert len(buf) == size
+    print(f"{dt:.4f} {peak * 1024}")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size-mb", type=int, default=1024)
+    parser.add_argument("--dir", default=tempfile.gettempdir())
+    parser.add_argument("--keep", action="store_true", help="保留测试文件")
+    parser.add_argument("--child", nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child: return child(*args.child)
+    size = args.size_mb * 1024 * 1024
+    path = make_file(os.path.join(args.dir, f"cinetico_bench_{args.size_mb}mb.bin"), size)
+    try:
+        with open(path, "rb") as f:
+            while f.read(64 * 1024 * 1024): pass
+        print(f"file: {args.size_mb} MB")
+        for mode in ("bytearray", "mmap"):
+            out = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", mode, path], capture_output=True, text=True, check=True)
+            dt, peak = out.stdout.split()[-2:]
+            dt, peak = float(dt), int(peak)
+            print(f"{mode:<10}: {size / dt / 1e6:7.0f} MB/s, {float(dt):.2f} s, peak RSS +{peak / 1024**2:.0f} MB ({peak / size:.2f}x file)")
+    finally:
+        if not args.keep: os.remove(path)
+
+if __name__ == "__main__":
+    main()
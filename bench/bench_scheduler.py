@@ -0,0 +1,101 @@
+# 调度开销基准：N 个合成任务 (默认 10k)
+#   旧引擎：每 0.1s 在 queue_lock 下全表扫描统计状态 —— 测单次扫描耗时，换算成 10 次/秒的 CPU 占用
+#   TaskScheduler：引擎线程在条件变量上等待，工作线程上报状态迁移 —— 测跑完整批的墙钟与引擎线程 CPU
+# 用法: python bench/bench_scheduler.py [--tasks 10000] [--workers 4]
+import argparse
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from common import load_core
+
+class LegacyCard:
+    __slots__ = ("status_code", "source_mode", "file_size_gb")
+    def __init__(self, code):
+        self.status_code = code
+        self.source_mode = "RAM"
+        self.file_size_gb = 0.5
+
+# 旧 engine() 单次循环中的三次全表扫描 (统计、找待处理、找就绪)，不含派发本身
+def legacy_pass(c, queue, cards, lock):
+    io = compute = 0
+    ram = 0.0
+    with lock:
+        for f in queue:
+            card = cards[f]
+            if card.source_mode == "RAM" and card.status_code not in [c.STATE_DONE, c.STATE_ERROR]: ram += card.file_size_gb
+            if card.status_code in [c.STATE_QUEUED_IO, c.STATE_CACHING]: io += 1
+            elif card.status_code == c.STATE_ENCODING: compute += 1
+    with lock:
+        for f in queue:
+            if cards[f].status_code == c.STATE_PENDING: break
+    with lock:
+        for f in queue:
+            if cards[f].status_code == c.STATE_READY: break
+    with lock:
+        for f in queue:
+            if cards[f].status_code not in [c.STATE_DONE, c.STATE_ERROR]: break
+    return io, compute, ram
+
+def bench_legacy(c, n):
+    # 批次进行到一半时的典型状态：前一半已完成，后一半待处理
+    queue = [f"/v/clip{i}.mp4" for i in range(n)]
+    cards = {f: LegacyCard(c.STATE_DONE if i < n // 2 else c.STATE_PENDING) for i, f in enumerate(queue)}
+    lock = threading.Lock()
+    passes = 200
+    t = time.perf_counter()
+    for _ in range(passes): legacy_pass(c, queue, cards, lock)
+    return (time.perf_counter() - t) / passes
+
+# 与 EncoderCore.engine 相同的派发结构：预读 -> 就绪 -> 编码 -> 完成，工作线程不做实际工作
+def bench_scheduler(c, n, workers):
+    sched = c.TaskScheduler()
+    sched.reset((f"/v/clip{i}.mp4", c.STATE_PENDING) for i in range(n))
+    io_pool = ThreadPoolExecutor(max_workers=2)
+    pool = ThreadPoolExecutor(max_workers=workers)
+    def io_task(f):
+        sched.set_state(f, c.STATE_CACHING)
+        sched.set_state(f, c.STATE_READY)
+    def compute_task(f):
+        sched.set_state(f, c.STATE_DONE)
+    wakes = 0
+    cpu0 = time.thread_time()
+    t = time.perf_counter()
+    with sched.cond:
+        while True:
+            wakes += 1
+            for f in sched.peek(c.STATE_PENDING, 64):
+                if sched.count(c.STATE_QUEUED_IO, c.STATE_CACHING, c.STATE_READY) >= workers + 2: break
+                sched.set_state(f, c.STATE_QUEUED_IO)
+                io_pool.submit(io_task, f)
+            while sched.count(c.STATE_ENCODING) < workers:
+                f = sched.first(c.STATE_READY)
+                if f is None: break
+                sched.set_state(f, c.STATE_ENCODING)
+                pool.submit(compute_task, f)
+            if sched.unfinished() == 0: break
+            sched.cond.wait(1.0)
+    wall = time.perf_counter() - t
+    cpu = time.thread_time() - cpu0
+    io_pool.shutdown()
+    pool.shutdown()
+    return wall, cpu, wakes
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tasks", type=int, default=10000)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+    c = load_core()
+    n = args.tasks
+    per_pass = bench_legacy(c, n)
+    print(f"tasks: {n}")
+    print(f"legacy polling : {per_pass * 1000:.2f} ms per pass under queue_lock -> {per_pass * 10 * 100:.1f}% of a core at 10 passes/s, even when idle")
+    print(f"                 batch lower bound {n * 0.1:.0f} s (one load started per 0.1 s pass)")
+    wall, cpu, wakes = bench_scheduler(c, n, args.workers)
+    transitions = n * 5
+    print(f"TaskScheduler  : {wall:.2f} s wall for the whole batch, engine thread CPU {cpu * 1000:.0f} ms "
+          f"({cpu / transitions * 1e6:.1f} us per transition, {wakes} wakes); 0% when idle")
+
+if __name__ == "__main__":
+    main()
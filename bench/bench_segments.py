@@ -0,0 +1,89 @@
+# 分段并行编码基准 (需要 ffmpeg)：同一个长文件用单进程编码 vs 按关键帧切成 N 段并行编码再无损拼接
+# 分段部分使用与 EncoderCore._encode_segmented 相同的函数：plan_segments / build_encode_command / build_concat_command，
+# 每段绑定 partition_cpus 分出的 CPU 集合；最后用 ffprobe 比较两份输出的总时长与音视频流时长
+# 用法: python bench/bench_segments.py [--input long.mp4 | --duration 240] [--codec H.264|H.265] [--segments 4]
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from common import load_core, require_ffmpeg
+
+def make_source(path, duration):
+    # 带音轨的测试片：720p30，每 2 秒一个关键帧 (与常见相机素材接近)
+    subprocess.run(["ffmpeg", "-v", "error", "-y", "-f", "lavfi", "-i", f"testsrc2=size=1280x720:rate=30:duration={duration}",
+                    "-f", "lavfi", "-i", f"sine=frequency=440:duration={duration}", "-c:v", "libx264", "-preset", "ultrafast",
+                    "-g", "60", "-c:a", "aac", "-shortest", path], check=True)
+
+def probe_durations(c, path):
+    info = c.run_ffprobe(path)
+    streams = {}
+    for st in info.get("streams", []): streams.setdefault(st.get("codec_type"), float(st.get("duration", "nan")))
+    return c.probe_duration(info), streams
+
+def run(c, cmd, cpus=None):
+    proc = subprocess.Popen(c.affinity_prefix(cpus) + cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    c.pin_process(proc, cpus)
+    _, err = proc.communicate()
+    if proc.returncode != 0: raise RuntimeError(err[-2000:])
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--input", help="已有的长视频 (默认生成测试片)")
+    parser.add_argument("--duration", type=int, default=240, help="生成测试片的时长 (秒)")
+    parser.add_argument("--codec", default="H.264", choices=["H.264", "H.265"])
+    parser.add_argument("--crf", type=int, default=23)
+    parser.add_argument("--segments", type=int, default=max(2, min(8, (os.cpu_count() or 4) // 4)))
+    parser.add_argument("--dir", default=tempfile.gettempdir())
+    args = parser.parse_args()
+    if not require_ffmpeg(): return 2
+    c = load_core()
+    settings = {**c.DEFAULT_ENCODE_SETTINGS, "codec": args.codec, "crf": args.crf}
+    work = tempfile.mkdtemp(prefix="cinetico_seg_", dir=args.dir)
+    src = args.input or os.path.join(work, "source.mp4")
+    if not args.input: make_source(src, args.duration)
+    info = c.probe_media(src)
+    duration = c.probe_duration(info)
+    audio = c.probe_stream(info, "audio")
+    audio_codec = audio.get("codec_name", "unknown") if audio else None
+    print(f"source: {os.path.basename(src)} {duration:.1f}s, {args.codec} crf {args.crf}, {os.cpu_count()} CPUs")
+    try:
+        # 单进程
+        single = os.path.join(work, "single.mp4")
+        cmd, _ = c.build_encode_command(src, single, settings, False, audio_codec=audio_codec)
+        t = time.perf_counter()
+        run(c, cmd)
+        single_s = time.perf_counter() - t
+
+        # 分段并行 + 拼接 (计时包含关键帧定位)
+        segmented = os.path.join(work, "segmented.mp4")
+        t = time.perf_counter()
+        segments = c.plan_segments(src, duration, args.segments)
+        parts = c.partition_cpus(len(segments)) or [None] * len(segments)
+        seg_files = [os.path.join(work, f"seg_{i}.mp4") for i in range(len(segments))]
+        def encode(i):
+            cmd, _ = c.build_encode_command(src, seg_files[i], settings, False, segment=segments[i], cpus=parts[i])
+            run(c, cmd, parts[i])
+        with ThreadPoolExecutor(max_workers=len(segments)) as pool: list(pool.map(encode, range(len(segments))))
+        list_file = os.path.join(work, "list.txt")
+        with open(list_file, "w", encoding="utf-8") as lf:
+            for f in seg_files: lf.write(f"file '{f}'\n")
+        run(c, c.build_concat_command(list_file, src, segmented, settings, audio_codec=audio_codec))
+        seg_s = time.perf_counter() - t
+
+        print(f"single    : {single_s:7.2f} s")
+        print(f"segmented : {seg_s:7.2f} s  ({len(segments)} segments, speedup {single_s / seg_s:.2f}x)")
+        for name, path in (("single", single), ("segmented", segmented)):
+            fmt, streams = probe_durations(c, path)
+            av = streams.get("video", float("nan")) - streams.get("audio", float("nan"))
+            print(f"{name:<10}: duration {fmt:.3f}s (source {duration:.3f}s), video-audio {av * 1000:+.0f} ms")
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+if __name__ == "__main__":
+    sys.exit(main())
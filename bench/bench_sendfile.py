@@ -0,0 +1,68 @@
+# 环回服务器吞吐基准 (MB/s)：
+#   ram      - GLOBAL_RAM_STORAGE 中的内存缓冲，经 asyncio 写出
+#   sendfile - GLOBAL_FILE_STORAGE 中的磁盘文件 (SSD 缓存 / 直读源)，由 loop.sendfile 交给内核拷贝
+#   direct   - 不经过服务器，客户端直接读文件 (FFmpeg 直接打开路径时的上限)
+# 客户端用 http.client 按 4MB 读取并丢弃；文件先读一遍进页缓存
+# 用法: python bench/bench_sendfile.py [--size-mb 512] [--dir DIR]
+import argparse
+import http.client
+import os
+import tempfile
+
+from common import best_of, load_core, make_file
+
+READ_SIZE = 4 * 1024 * 1024
+
+def fetch(port, token):
+    conn = http.client.HTTPConnection("127.0.0.1", port)
+    try:
+        conn.request("GET", f"/{token}")
+        resp = conn.getresponse()
+        buf = bytearray(READ_SIZE)
+        total = 0
+        while True:
+            n = resp.readinto(buf)
+            if not n: break
+            total += n
+        return total
+    finally:
+        conn.close()
+
+def read_direct(path):
+    buf = bytearray(READ_SIZE)
+    total = 0
+    with open(path, "rb", buffering=0) as f:
+        while True:
+            n = f.readinto(buf)
+            if not n: break
+            total += n
+    return total
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size-mb", type=int, default=512)
+    parser.add_argument("--dir", default=tempfile.gettempdir())
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    c = load_core()
+    size = args.size_mb * 1024 * 1024
+    path = make_file(os.path.join(args.dir, f"cinetico_bench_{args.size_mb}mb.bin"), size)
+    server, port = c.start_global_server()
+    try:
+        read_direct(path)
+        ram_token = "bench-ram"
+        c.GLOBAL_RAM_STORAGE[ram_token] = c.load_file_into_ram(path, size)
+        file_token = c.register_file_source(path, path)
+        print(f"file: {args.size_mb} MB, best of {args.repeat}")
+        for name, fn in (("ram", lambda: fetch(port, ram_token)), ("sendfile", lambda: fetch(port, file_token)), ("direct", lambda: read_direct(path))):
+            assert fn() == size
+            dt = best_of(fn, args.repeat)
+            print(f"{name:<9}: {size / dt / 1e6:7.0f} MB/s")
+    finally:
+        c.GLOBAL_RAM_STORAGE.pop("bench-ram", None)
+        c.release_source(path)
+        server.shutdown()
+        os.remove(path)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+# 任务列表基准：1k / 10k / 50k 个任务时添加文件的耗时与任务模型内存
+#   model - 与 add_list 相同的流程：TaskTable.append + 按大小排序 + 生成显示顺序与 pos_of 索引
+#   --gui - 另外测 VirtualTaskList.set_rows + 首次绘制 + 滚动到底部的耗时与控件数量
+#           (需要 customtkinter 与可用的显示器)
+# 内存用 tracemalloc 单独跑一遍，避免追踪开销计入耗时
+# 用法: python bench/bench_task_list.py [--counts 1000 10000 50000] [--gui]
+import argparse
+import importlib.util
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+import types
+
+from common import SRC, load_core
+
+# 空文件即可：TaskTable 只读取大小
+def make_files(folder, n):
+    paths = []
+    for i in range(n):
+        path = os.path.join(folder, f"clip_{i:06d}.mp4")
+        with open(path, "wb") as f: f.truncate((i * 7919) % 100_000)
+        paths.append(path)
+    return paths
+
+def build_model(c, files):
+    table = c.TaskTable(listener=lambda row, field: None)
+    widgets, queue = {}, []
+    for f in files:
+        f_norm = os.path.normpath(os.path.abspath(f))
+        queue.append(f_norm)
+        widgets[f_norm] = table.append(f_norm)
+    queue.sort(key=lambda x: widgets[x].file_size_gb)
+    rows = [widgets[f] for f in queue]
+    pos_of = {row.filepath: i for i, row in enumerate(rows)}
+    return table, rows, pos_of
+
+def bench_model(c, files, counts):
+    for n in counts:
+        t = time.perf_counter()
+        build_model(c, files[:n])
+        dt = time.perf_counter() - t
+        tracemalloc.start()
+        keep = build_model(c, files[:n])
+        cur, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del keep
+        print(f"{n:>6} tasks: add {dt * 1000:7.1f} ms, model + index {cur / 1024 / 1024:6.2f} MB (peak {peak / 1024 / 1024:.2f} MB)")
+
+# 界面部分需要完整脚本 (含 customtkinter)，以非 __main__ 方式加载，不会启动应用
+def load_gui():
+    with open(SRC, encoding="utf-8") as f: src = f.read()
+    module = types.ModuleType("cinetico_gui")
+    module.__file__ = SRC
+    argv = sys.argv
+    sys.argv = [SRC]
+    try: exec(compile(src, SRC, "exec"), module.__dict__)
+    finally: sys.argv = argv
+    return module
+
+def bench_gui(files, counts):
+    if importlib.util.find_spec("customtkinter") is None: return print("跳过 --gui：未安装 customtkinter")
+    if sys.platform.startswith("linux") and not os.environ.get("DISPLAY"): return print("跳过 --gui：没有 DISPLAY")
+    g = load_gui()
+    root = g.ctk.CTk()
+    root.geometry("900x700")
+    task_list = g.VirtualTaskList(root)
+    task_list.pack(fill="both", expand=True)
+    root.update()
+    for n in counts:
+        _, rows, _ = build_model(g, files[:n])
+        t = time.perf_counter()
+        task_list.set_rows(rows)
+        root.update()
+        first = time.perf_counter() - t
+        t = time.perf_counter()
+        task_list.scroll_to(len(rows) * g.TASK_ROW_HEIGHT)
+        root.update()
+        scroll = time.perf_counter() - t
+        print(f"{n:>6} tasks: set_rows + draw {first * 1000:7.1f} ms, scroll to end {scroll * 1000:6.1f} ms, {len(task_list.pool)} cards")
+    root.destroy()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--counts", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--gui", action="store_true")
+    parser.add_argument("--dir", default=tempfile.gettempdir())
+    args = parser.parse_args()
+    work = tempfile.mkdtemp(prefix="cinetico_list_", dir=args.dir)
+    try:
+        files = make_files(work, max(args.counts))
+        bench_model(load_core(), files, args.counts)
+        if args.gui: bench_gui(files, args.counts)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+if __name__ == "__main__":
+    sys.exit(main())
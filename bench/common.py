@@ -0,0 +1,45 @@
+# 基准脚本与测试 (tests/conftest.py) 共用：加载主程序的核心部分 (图形界面之前)，
+# 按无界面模式执行，不需要 customtkinter / 显示器
+import os
+import shutil
+import sys
+import time
+import types
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC = os.path.join(ROOT, "Cinetico_Encoder.py")
+GUI_MARKER = "# === [模块 3]"
+
+def load_core():
+    with open(SRC, encoding="utf-8") as f: src = f.read()
+    module = types.ModuleType("cinetico_core")
+    module.__file__ = SRC
+    argv = sys.argv
+    sys.argv = [SRC, "--headless"]
+    try: exec(compile(src[:src.index(GUI_MARKER)], SRC, "exec"), module.__dict__)
+    finally: sys.argv = argv
+    return module
+
+# 生成指定大小的随机内容文件 (已存在且大小一致时复用)
+def make_file(path, size, chunk=64 * 1024 * 1024):
+    if os.path.exists(path) and os.path.getsize(path) == size: return path
+    with open(path, "wb") as f:
+        left = size
+        while left > 0:
+            n = min(chunk, left)
+            f.write(os.urandom(n))
+            left -= n
+    return path
+
+def best_of(fn, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t)
+    return best
+
+def require_ffmpeg():
+    if shutil.which("ffmpeg") and shutil.which("ffprobe"): return True
+    print("需要 PATH 中的 ffmpeg / ffprobe")
+    return False
@@ -0,0 +1,67 @@
+# 预读流水线仿真：用真实的 EncoderCore.engine 调度，加载与编码都替换成 sleep
+# 源文件分布在若干块机械盘上，比较编码通道的空闲时间：
+#   serial   - 所有文件视为同一设备 (接近旧引擎 "同时只有一个 IO 任务")
+#   depth=K  - 按设备串行、不同设备并行，编码通道之外额外预读 K 个文件
+# 用法: python bench/sim_prefetch.py [--files 24] [--devices 3] [--workers 2] [--io 0.3] [--encode 0.2]
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+from common import load_core
+
+def simulate(c, files, workers, depth, io_s, encode_s, serial):
+    c.is_drive_ssd = lambda p: False
+    c.device_key = (lambda p: "hdd") if serial else (lambda p: p.split("/")[1])
+
+    class Sim(c.HeadlessEncoder):
+        def __init__(self):
+            self.init_core()
+            self.task_table = c.TaskTable()
+            self.current_workers = workers
+            self.prefetch_depth = depth
+            self.adaptive_concurrency = False
+            self.temp_dir = tempfile.gettempdir()
+            self.busy = 0.0
+            self.lock = threading.Lock()
+        def process_caching(self, f, card, lock_obj=None, no_wait=False, allow_ram=True, on_ready=None):
+            time.sleep(io_s)
+            return True
+        def get_probe(self, f): return None
+        def _worker_compute_task(self, f):
+            time.sleep(encode_s)
+            with self.lock: self.busy += encode_s
+            self.set_task_state(f, "done", None, c.STATE_DONE)
+        def print_batch_summary(self, states): pass
+        def on_batch_finished(self): pass
+
+    sim = Sim()
+    for f in files:
+        sim.file_queue.append(f)
+        sim.task_widgets[f] = sim.task_table.append(f)
+        sim.task_widgets[f].file_size_gb = 0.5
+    t = time.perf_counter()
+    sim.engine()
+    wall = time.perf_counter() - t
+    idle = workers * wall - sim.busy
+    return wall, idle
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=24)
+    parser.add_argument("--devices", type=int, default=3)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--io", type=float, default=0.3, help="每个文件的加载时间 (秒)")
+    parser.add_argument("--encode", type=float, default=0.2, help="每个文件的编码时间 (秒)")
+    args = parser.parse_args()
+    c = load_core()
+    c.TaskTimeline.write_jsonl = lambda self, directory, states=None: None
+    files = [f"/d{i % args.devices}/clip{i}.mp4" for i in range(args.files)]
+    print(f"{args.files} files on {args.devices} devices, {args.workers} workers, load {args.io}s, encode {args.encode}s")
+    for label, depth, serial in [("serial", 0, True), ("depth=0", 0, False), ("depth=1", 1, False), ("depth=2", 2, False), ("depth=4", 4, False)]:
+        wall, idle = simulate(c, files, args.workers, depth, args.io, args.encode, serial)
+        print(f"{label:<8}: wall {wall:5.2f} s, worker idle {idle:5.2f} s ({idle / (args.workers * wall) * 100:4.1f}% of slot time)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,13 @@
+import os
+import sys
+
+import pytest
+
+# 加载器与基准脚本共用一份 (bench/common.py)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bench"))
+from common import load_core
+
+
+@pytest.fixture(scope="session")
+def core():
+    return load_core()
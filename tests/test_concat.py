@@ -0,0 +1,26 @@
+def settings(core, **kw):
+    return {**core.DEFAULT_ENCODE_SETTINGS, **kw}
+
+
+def test_silent_source_keeps_metadata(core):
+    cmd = core.build_concat_command("list.txt", "src.mov", "out.mp4", settings(core, keep_meta=True))
+    assert cmd[cmd.index("src.mov") - 1] == "-i"
+    assert cmd[cmd.index("-map_metadata") + 1] == "1"
+    assert cmd[cmd.index("-map_chapters") + 1] == "1"
+    assert "1:a:0?" not in cmd
+
+
+def test_silent_source_without_meta_skips_source(core):
+    cmd = core.build_concat_command("list.txt", "src.mov", "out.mp4", settings(core, keep_meta=False))
+    assert "src.mov" not in cmd
+    assert "-map_metadata" not in cmd
+
+
+def test_audio_source(core):
+    cmd = core.build_concat_command("list.txt", "src.mov", "out.mp4", settings(core, keep_meta=False), audio_codec="aac")
+    assert cmd.count("src.mov") == 1
+    assert cmd[cmd.index("1:a:0?") + 1:cmd.index("1:a:0?") + 3] == ["-c:a", "copy"]
+    assert "-map_metadata" not in cmd
+    cmd = core.build_concat_command("list.txt", "src.mov", "out.mp4", settings(core, keep_meta=True), audio_codec="pcm_s24le")
+    assert cmd[cmd.index("-c:a") + 1] == "aac"
+    assert cmd[cmd.index("-map_metadata") + 1] == "1"
@@ -0,0 +1,86 @@
+import os
+import subprocess
+import sys
+import time
+from collections import Counter
+
+import pytest
+
+
+@pytest.fixture
+def controller(core, monkeypatch):
+    # 每次 tick 都是一个决策窗口，不读取真实的 /proc/stat
+    monkeypatch.setattr(core, "CONCURRENCY_INTERVAL", 0)
+    monkeypatch.setattr(core, "CONCURRENCY_MIN_SAMPLES", 1)
+    monkeypatch.setattr(core, "read_cpu_times", lambda: None)
+
+    def run(curve, max_workers, ticks=60):
+        log = []
+        cc = core.ConcurrencyController(max_workers, log=log.append)
+        for _ in range(ticks):
+            n = cc.limit
+            cc.tick([curve[n] / n] * n)
+        return cc, log
+    return run
+
+
+def settled_level(log):
+    return Counter(d["workers"] for d in log).most_common(1)[0][0]
+
+
+def test_keeps_best_level_over_slightly_worse_one(controller):
+    # 3 个通道比 4 个慢约 4% (在持平容差内)，也不能停在 3
+    cc, log = controller({1: 90, 2: 170, 3: 240, 4: 250}, 4)
+    assert settled_level(log) == 4
+    assert all(d["next"] == 4 for d in log if d["reason"] in ("worse", "converged"))
+
+
+def test_finds_interior_optimum(controller):
+    cc, log = controller({1: 100, 2: 180, 3: 230, 4: 210, 5: 200, 6: 190}, 6)
+    assert settled_level(log) == 3
+
+
+def test_prefers_fewer_workers_on_exact_tie(controller):
+    cc, log = controller({1: 120, 2: 200, 3: 250, 4: 250}, 4)
+    assert settled_level(log) == 3
+
+
+def test_never_exceeds_cap(controller):
+    cc, log = controller({1: 100, 2: 200, 3: 300}, 3)
+    assert max(d["next"] for d in log) <= 3
+    assert settled_level(log) == 3
+
+
+
+def test_holds_while_task_in_first_window(core, controller):
+    # 窗口内有任务刚开始 (换了文件)：不同文件的 fps 不可比，不采样也不移动档位
+    log = []
+    cc = core.ConcurrencyController(4, log=log.append)
+    for _ in range(10): cc.tick([60.0] * 4, [time.time()] * 4)
+    assert not log and cc.limit == 4
+    # 同一批任务跑满整窗后恢复决策
+    cc.tick([60.0] * 4, [0.0] * 4)
+    assert log and log[0]["workers"] == 4
+
+@pytest.mark.skipif(not hasattr(os, "sched_getaffinity"), reason="Linux affinity API")
+@pytest.mark.parametrize("taskset", [True, False])
+def test_pinned_child_affinity(core, monkeypatch, taskset):
+    cpus = {min(os.sched_getaffinity(0))}
+    if not taskset: monkeypatch.setattr(core, "TASKSET_PATH", None)
+    elif not core.TASKSET_PATH: pytest.skip("taskset not installed")
+    proc = subprocess.Popen(core.affinity_prefix(cpus) + [sys.executable, "-c", "import sys; sys.stdin.read()"], stdin=subprocess.PIPE)
+    try:
+        core.pin_process(proc, cpus)
+        # taskset 在 exec 目标程序之前设置亲和性；等 Python 子进程启动后再读
+        deadline = time.monotonic() + 5
+        while os.sched_getaffinity(proc.pid) != cpus and time.monotonic() < deadline: time.sleep(0.01)
+        assert os.sched_getaffinity(proc.pid) == cpus
+    finally:
+        proc.communicate(b"")
+
+
+def test_pin_process_ignores_exited_child(core, monkeypatch):
+    monkeypatch.setattr(core, "TASKSET_PATH", None)
+    proc = subprocess.Popen([sys.executable, "-c", "pass"])
+    proc.wait()
+    core.pin_process(proc, {0})
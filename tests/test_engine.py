@@ -0,0 +1,215 @@
+import io
+import os
+import threading
+
+import pytest
+
+
+# 真实的 EncoderCore.engine 调度，加载与编码替换成记录调用的桩 (与 bench/sim_prefetch.py 相同的做法)
+@pytest.fixture
+def sim(core, tmp_path, monkeypatch):
+    monkeypatch.setattr(core, "is_drive_ssd", lambda p: False)
+    monkeypatch.setattr(core, "is_bus_usb", lambda p: False)
+    monkeypatch.setattr(core, "device_key", lambda p: p.split("/")[1])
+    write_jsonl = core.TaskTimeline.write_jsonl
+    monkeypatch.setattr(core.TaskTimeline, "write_jsonl", lambda self, directory, states=None: None)
+
+    class Sim(core.HeadlessEncoder):
+        def __init__(self, files, workers=2):
+            self.init_core()
+            self.task_table = core.TaskTable()
+            self.current_workers = workers
+            self.adaptive_concurrency = False
+            self.temp_dir = str(tmp_path)
+            self.admitted = {}
+            self.lock = threading.Lock()
+            for f in files:
+                self.file_queue.append(f)
+                self.task_widgets[f] = self.task_table.append(f)
+                self.task_widgets[f].file_size_gb = 0.5
+        def process_caching(self, f, card, lock_obj=None, no_wait=False, allow_ram=True, on_ready=None):
+            with self.lock: self.admitted[f] = card.source_mode
+            return True
+        def get_probe(self, f): return None
+        def _worker_compute_task(self, f):
+            self.set_task_state(f, "done", None, core.STATE_DONE)
+        def print_batch_summary(self, states): pass
+        def on_batch_finished(self): pass
+    Sim.write_jsonl = staticmethod(write_jsonl)
+    yield Sim
+    for tier in core.LEDGER_TIERS: core.CACHE_LEDGER.clear(tier)
+
+
+def test_pressure_applies_at_admission(core, sim, monkeypatch):
+    monkeypatch.setattr(core, "memory_under_pressure", lambda: True)
+    enc = sim([f"/d{i % 3}/clip{i}.mp4" for i in range(6)])
+    enc.engine()
+    assert enc.admitted and set(enc.admitted.values()) == {"SSD_CACHE"}
+    assert all(enc.scheduler.state(f) == core.STATE_DONE for f in enc.file_queue)
+
+
+def test_no_pressure_uses_ram(core, sim, monkeypatch):
+    monkeypatch.setattr(core, "memory_under_pressure", lambda: False)
+    enc = sim([f"/d{i % 3}/clip{i}.mp4" for i in range(6)])
+    enc.engine()
+    assert set(enc.admitted.values()) == {"RAM"}
+
+
+
+
+# SSD 预算不够的大文件不挡住队列：后面能放进 RAM 的小文件先预读
+def test_ssd_budget_exhausted_does_not_block_ram_candidates(core, sim, monkeypatch):
+    monkeypatch.setattr(core, "memory_under_pressure", lambda: False)
+    monkeypatch.setattr(core, "MAX_RAM_LOAD_GB", 0.5)
+    monkeypatch.setattr(core, "RING_BUFFER_MODE", False)
+    enc = sim(["/d0/a.mp4", "/d1/big.mp4", "/d2/small.mp4"])
+    monkeypatch.setattr(enc, "ssd_cache_free", lambda: 0.3 * 1024**3)
+    enc.task_widgets["/d0/a.mp4"].file_size_gb = 0.4
+    enc.task_widgets["/d1/big.mp4"].file_size_gb = 0.4
+    enc.task_widgets["/d2/small.mp4"].file_size_gb = 0.05
+    small_admitted = threading.Event()
+    caching = enc.process_caching
+    def process_caching(f, card, **kw):
+        if f == "/d2/small.mp4": small_admitted.set()
+        if f == "/d0/a.mp4": small_admitted.wait(5) # a 占着 RAM 预算期间 small 必须已经开始加载
+        return caching(f, card, **kw)
+    monkeypatch.setattr(enc, "process_caching", process_caching)
+    enc.engine()
+    assert small_admitted.is_set()
+    assert enc.admitted == {"/d0/a.mp4": "RAM", "/d2/small.mp4": "RAM", "/d1/big.mp4": "RAM"}
+    assert list(enc.admitted)[-1] == "/d1/big.mp4"
+
+
+# 批次时间线与输出文件放在一起，不写进缓存池
+def test_timeline_written_next_to_outputs(core, sim, tmp_path, monkeypatch):
+    monkeypatch.setattr(core, "memory_under_pressure", lambda: False)
+    monkeypatch.setattr(core.TaskTimeline, "write_jsonl", sim.write_jsonl)
+    src = tmp_path / "src"
+    src.mkdir()
+    enc = sim([str(src / f"clip{i}.mp4") for i in range(2)])
+    enc.engine()
+    assert enc.timeline_path and os.path.dirname(enc.timeline_path) == str(src)
+    assert not [n for n in os.listdir(tmp_path) if n.startswith(core.TIMELINE_PREFIX)]
+    out = tmp_path / "out"
+    out.mkdir()
+    enc = sim([str(src / "clip9.mp4")])
+    enc.output_dir = str(out)
+    enc.engine()
+    assert os.path.dirname(enc.timeline_path) == str(out)
+
+# 盘型 / 设备号 / 剩余空间 / PSI 探测都在调度锁外进行
+def test_probes_run_outside_scheduler_lock(core, sim, monkeypatch):
+    enc = sim([f"/d{i % 3}/clip{i}.mp4" for i in range(6)])
+    held = []
+    def probe(result):
+        def fn(*args):
+            held.append(enc.scheduler.cond._is_owned())
+            return result
+        return fn
+    monkeypatch.setattr(core, "is_drive_ssd", probe(False))
+    monkeypatch.setattr(core, "device_key", lambda p: held.append(enc.scheduler.cond._is_owned()) or p.split("/")[1])
+    monkeypatch.setattr(core, "memory_under_pressure", probe(False))
+    monkeypatch.setattr(enc, "ssd_cache_free", probe(float("inf")))
+    enc.engine()
+    assert held and not any(held)
+    assert all(enc.scheduler.state(f) == core.STATE_DONE for f in enc.file_queue)
+
+# 准入时按 RAM 放行、读取前才遇到内存压力：SSD 缓存放不下时直读源盘，不绕过空间检查
+def test_late_demotion_checks_ssd_space(core, tmp_path, monkeypatch):
+    src = tmp_path / "clip.mp4"
+    src.write_bytes(b"\0" * 4096)
+    monkeypatch.setattr(core, "memory_under_pressure", lambda: True)
+    monkeypatch.setattr(core, "is_drive_ssd", lambda p: False)
+    monkeypatch.setattr(core, "is_bus_usb", lambda p: False)
+    enc = core.EncoderCore()
+    enc.init_core()
+    enc.temp_dir = str(tmp_path)
+    row = core.TaskTable().append(str(src))
+    monkeypatch.setattr(enc, "ssd_cache_free", lambda: 1024)
+    assert enc.process_caching(str(src), row, no_wait=True, allow_ram=True)
+    assert row.source_mode == "DIRECT"
+    assert not core.CACHE_LEDGER.holds("SSD_CACHE", str(src)) and not core.CACHE_LEDGER.holds("RAM", str(src))
+
+
+@pytest.fixture
+def gpu_encoder(core, tmp_path, monkeypatch):
+    monkeypatch.setattr(core.EncoderCore, "check_decoding_capability",
+                        lambda self, p: {"can_hw_decode": True, "pix_fmt": "yuv420p", "codec_name": "h264", "audio_codec": "aac"})
+    settings = {**core.DEFAULT_ENCODE_SETTINGS, "use_gpu": True, "hybrid": False}
+    enc = core.HeadlessEncoder(settings, workers=1, cache_dir=str(tmp_path), reporter=core.JsonLineReporter(io.StringIO()))
+    enc.temp_dir = str(tmp_path)
+    clip = tmp_path / "clip.mp4"
+    clip.write_bytes(b"\0" * 4096)
+    enc.add_list([str(clip)])
+    f = enc.file_queue[0]
+    enc.scheduler.reset([(f, core.STATE_QUEUED_IO)])
+    yield enc, f
+    core.METRICS.collectors.remove(enc.collect_metrics)
+    enc.global_server.shutdown()
+    core.release_source(f)
+    for tier in core.LEDGER_TIERS: core.CACHE_LEDGER.clear(tier)
+
+
+# 一定走硬件解码时 (直接读源文件) 不启动内存环 / 整读，归还 RAM 预算后按直读就绪
+@pytest.mark.parametrize("mode", ["RING", "RAM"])
+def test_hw_decode_skips_ram_loader(core, gpu_encoder, mode, monkeypatch):
+    enc, f = gpu_encoder
+    monkeypatch.setattr(enc, "_load_ring", lambda *a: pytest.fail("ring loader started"))
+    monkeypatch.setattr(enc, "process_caching", lambda *a, **kw: pytest.fail("RAM loader started"))
+    card = enc.task_widgets[f]
+    card.source_mode = mode
+    core.CACHE_LEDGER.reserve("RAM", f, 4096)
+    enc._worker_io_task(f)
+    assert card.source_mode == "DIRECT"
+    assert enc.scheduler.state(f) == core.STATE_READY
+    assert not core.CACHE_LEDGER.holds("RAM", f)
+
+
+# 编码阶段才确定硬件解码时 (如混合模式)：仍在加载的渐进缓冲要先取消释放，FFmpeg 改读源文件
+def test_hw_decode_cancels_progressive_loader(core, gpu_encoder, monkeypatch):
+    enc, f = gpu_encoder
+    card = enc.task_widgets[f]
+    pb = core.ProgressiveBuffer(f, 4096)
+    token = "tok"
+    core.GLOBAL_RAM_STORAGE[token] = pb
+    core.PATH_TO_TOKEN_MAP[f] = token
+    card.source_mode = "RAM"
+    cmds = []
+    def run_ffmpeg(cmd, *args, **kw):
+        cmds.append(cmd)
+        return 1
+    monkeypatch.setattr(enc, "_run_ffmpeg", run_ffmpeg)
+    monkeypatch.setattr(enc, "analyze_ffmpeg_log", lambda logs: "fake")
+    enc._worker_compute_task(f)
+    assert pb.cancelled and token not in core.GLOBAL_RAM_STORAGE
+    assert card.source_mode == "DIRECT"
+    assert f in cmds[0] and not any("127.0.0.1" in a for a in cmds[0])
+
+
+# 音频回退抽取 WAV 时读已缓存的输入，而不是源文件
+@pytest.mark.parametrize("mode", ["RAM", "SSD_CACHE"])
+def test_audio_fallback_reads_cached_input(core, gpu_encoder, tmp_path, mode, monkeypatch):
+    enc, f = gpu_encoder
+    enc.settings["use_gpu"] = False
+    card = enc.task_widgets[f]
+    card.source_mode = mode
+    if mode == "RAM":
+        core.GLOBAL_RAM_STORAGE["tok"] = b"\0" * 4096
+        core.PATH_TO_TOKEN_MAP[f] = "tok"
+        expected = f"http://127.0.0.1:{enc.global_port}/tok"
+    else:
+        monkeypatch.setattr(core, "LOOPBACK_FILE_TIERS", False)
+        cached = tmp_path / "CACHE_k_clip.mp4"
+        cached.write_bytes(b"\0" * 4096)
+        card.ssd_cache_path = str(cached)
+        expected = str(cached)
+    monkeypatch.setattr(core, "SEGMENT_PARALLEL", False)
+    monkeypatch.setattr(core, "needs_audio_fallback", lambda log: True)
+    monkeypatch.setattr(enc, "_run_ffmpeg", lambda *a, **kw: 1)
+    monkeypatch.setattr(enc, "analyze_ffmpeg_log", lambda logs: "fake")
+    extracts = []
+    monkeypatch.setattr(enc, "get_probe", lambda p: None)
+    monkeypatch.setattr(core.subprocess, "run", lambda cmd, **kw: extracts.append(cmd))
+    enc._worker_compute_task(f)
+    assert len(extracts) == 1
+    assert extracts[0][extracts[0].index("-i") + 1] == expected
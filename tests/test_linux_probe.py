@@ -0,0 +1,150 @@
+import os
+import platform
+
+import pytest
+
+MOUNTINFO = """\
+22 1 259:2 / / rw,relatime shared:1 - ext4 /dev/nvme0n1p2 rw
+30 22 8:1 / /mnt/hdd rw - ext4 /dev/sda1 rw
+31 22 8:17 / /media/usb\\040stick rw - vfat /dev/sdb1 rw
+33 22 8:33 / /mnt/dock rw - xfs /dev/sdc1 rw
+32 22 0:5 / /dev/shm rw - tmpfs tmpfs rw
+"""
+
+MEMINFO = """\
+MemTotal:       32768000 kB
+MemFree:         1024000 kB
+MemAvailable:   16384000 kB
+Cached:          8192000 kB
+"""
+
+
+def write(root, rel, text):
+    path = root / rel
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text)
+    return path
+
+
+# 样例目录树：nvme 系统盘 (SSD)、sda 机械盘、sdb 可移动 U 盘、sdc 挂在 USB 总线上的硬盘盒
+@pytest.fixture
+def fx(core, tmp_path, monkeypatch):
+    proc, sys_root = tmp_path / "proc", tmp_path / "sys"
+    write(proc, "self/mountinfo", MOUNTINFO)
+    write(proc, "meminfo", MEMINFO)
+    write(sys_root, "block/nvme0n1/queue/rotational", "0\n")
+    write(sys_root, "block/sda/queue/rotational", "1\n")
+    write(sys_root, "block/sda/sda1/partition", "1\n")
+    (sys_root / "class/block").mkdir(parents=True)
+    (sys_root / "class/block/sda1").symlink_to(sys_root / "block/sda/sda1")
+    write(sys_root, "block/sdb/queue/rotational", "1\n")
+    write(sys_root, "block/sdb/removable", "1\n")
+    write(sys_root, "block/sdc/queue/rotational", "1\n")
+    write(sys_root, "block/sdc/removable", "0\n")
+    usb_dev = sys_root / "devices/pci0000:00/usb2/2-1/host0/target0/sdc"
+    usb_dev.mkdir(parents=True)
+    (sys_root / "block/sdc/device").symlink_to(usb_dev)
+    monkeypatch.setattr(core, "PROC_ROOT", str(proc))
+    monkeypatch.setattr(core, "SYSFS_ROOT", str(sys_root))
+    core.invalidate_mount_cache()
+    yield proc, sys_root
+    core.invalidate_mount_cache()
+
+
+def test_meminfo(core, fx):
+    info = core.read_meminfo()
+    assert info["MemTotal"] == 32768000 * 1024
+    assert info["MemAvailable"] == 16384000 * 1024
+
+
+def test_mount_table_unescapes(core, fx):
+    mounts = {m["mount"]: m for m in core.read_mount_table()}
+    assert mounts["/media/usb stick"]["source"] == "/dev/sdb1"
+    assert mounts["/dev/shm"]["fstype"] == "tmpfs"
+
+
+@pytest.mark.parametrize("path, disk", [
+    ("/home/user/clip.mp4", "nvme0n1"),
+    ("/mnt/hdd/a/b.mkv", "sda"),
+    ("/media/usb stick/c.mov", "sdb"),
+    ("/mnt/dock/d.mxf", "sdc"),
+    ("/dev/shm/e.ts", None),
+])
+def test_disk_for_path(core, fx, path, disk):
+    assert core.linux_disk_for_path(path) == disk
+
+
+def test_rotational_and_usb(core, fx):
+    assert core.linux_is_rotational("nvme0n1") is False
+    assert core.linux_is_rotational("sda") is True
+    assert core.linux_is_rotational("missing") is None
+    assert not core.linux_is_usb("nvme0n1")
+    assert not core.linux_is_usb("sda")
+    assert core.linux_is_usb("sdb")   # removable
+    assert core.linux_is_usb("sdc")   # 挂在 USB 总线上
+
+
+@pytest.mark.skipif(platform.system() != "Linux", reason="Linux backend")
+def test_is_drive_ssd(core, fx, monkeypatch):
+    monkeypatch.setattr(core, "drive_type_cache", {})
+    assert core.is_drive_ssd("/home/user/clip.mp4")
+    assert not core.is_drive_ssd("/mnt/hdd/a.mkv")
+    assert core.is_drive_ssd("/dev/shm/x.ts") # 无法判断时沿用旧行为
+    assert core.is_bus_usb("/media/usb stick/c.mov")
+    assert not core.is_bus_usb("/mnt/hdd/a.mkv")
+
+
+def test_mount_table_is_cached(core, fx, monkeypatch):
+    calls = []
+    real = core.read_mount_table
+    monkeypatch.setattr(core, "read_mount_table", lambda: calls.append(1) or real())
+    for _ in range(50): core.linux_disk_for_path("/mnt/hdd/a.mkv")
+    assert len(calls) == 1
+    monkeypatch.setattr(core, "MOUNT_TABLE_TTL", -1)
+    core.linux_disk_for_path("/mnt/hdd/a.mkv")
+    assert len(calls) == 2
+
+
+def test_disk_memoized_per_device(core, fx, tmp_path, monkeypatch):
+    # 真实存在的路径按 st_dev 记忆：同一设备上的第二个文件不再做挂载点匹配
+    a, b = tmp_path / "a.mp4", tmp_path / "b.mp4"
+    a.write_bytes(b""); b.write_bytes(b"")
+    first = core.linux_disk_for_path(str(a))
+    monkeypatch.setattr(core, "mount_for_path", lambda *args: pytest.fail("mount table scanned again"))
+    assert core.linux_disk_for_path(str(b)) == first
+
+
+def test_cgroup_v2_limit_and_psi(core, fx):
+    proc, sys_root = fx
+    write(proc, "self/cgroup", "0::/user.slice/encode.scope\n")
+    cg = sys_root / "fs/cgroup"
+    write(cg, "cgroup.controllers", "cpu io memory pids\n")
+    write(cg, "user.slice/memory.max", str(4 * 1024**3))
+    write(cg, "user.slice/encode.scope/memory.max", "max\n")
+    write(cg, "user.slice/encode.scope/memory.current", str(1024**3))
+    write(cg, "user.slice/encode.scope/memory.pressure",
+          "some avg10=12.50 avg60=3.00 avg300=1.00 total=100\nfull avg10=2.00 avg60=0.00 avg300=0.00 total=10\n")
+    # 本层不设限，祖先的限额仍然生效
+    assert core.read_cgroup_memory() == (4 * 1024**3, 1024**3)
+    assert core.read_memory_pressure() == 12.5
+
+
+def test_cgroup_v1_limit(core, fx):
+    proc, sys_root = fx
+    write(proc, "self/cgroup", "12:cpu,cpuacct:/docker/abc\n5:memory:/docker/abc\n")
+    mem = sys_root / "fs/cgroup/memory"
+    write(mem, "memory.limit_in_bytes", str(9223372036854771712))
+    write(mem, "docker/abc/memory.limit_in_bytes", str(2 * 1024**3))
+    write(mem, "docker/abc/memory.usage_in_bytes", str(512 * 1024**2))
+    assert core.read_cgroup_memory() == (2 * 1024**3, 512 * 1024**2)
+
+
+def test_no_cgroup_limit_and_global_psi(core, fx):
+    proc, sys_root = fx
+    write(proc, "self/cgroup", "0::/\n")
+    write(sys_root, "fs/cgroup/cgroup.controllers", "cpu io memory\n")
+    write(sys_root, "fs/cgroup/memory.max", "max\n")
+    assert core.read_cgroup_memory() == (None, None)
+    # 没有 cgroup 的 memory.pressure：退回全局 /proc/pressure/memory
+    write(proc, "pressure/memory", "some avg10=0.30 avg60=0.10 avg300=0.00 total=5\n")
+    assert core.read_memory_pressure() == 0.3
@@ -0,0 +1,74 @@
+import http.client
+import io
+import threading
+
+import pytest
+
+
+def scrape(port, method="GET"):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+    try:
+        conn.request(method, "/metrics")
+        resp = conn.getresponse()
+        return resp.status, resp.getheader("Content-Type"), resp.read().decode("utf-8")
+    finally:
+        conn.close()
+
+
+@pytest.fixture
+def encoder(core, tmp_path, monkeypatch):
+    errors = []
+    # render() 吞掉采集异常只打印日志：记录下来，断言抓取过程中没有出错
+    monkeypatch.setattr(core, "print", lambda *args, **kw: errors.append(" ".join(map(str, args))), raising=False)
+    enc = core.HeadlessEncoder(dict(core.DEFAULT_ENCODE_SETTINGS), workers=2, reporter=core.JsonLineReporter(io.StringIO()))
+    clip = tmp_path / "clip.mp4"
+    clip.write_bytes(b"\0" * 1024)
+    enc.add_list([str(clip)])
+    yield enc, errors
+    core.METRICS.collectors.remove(enc.collect_metrics)
+    enc.global_server.shutdown()
+
+
+def test_metrics_endpoint(core):
+    srv = core.GlobalRamServer()
+    port = srv.start()
+    try:
+        core.METRICS.inc("cinetico_loopback_requests_total", tier="RAM")
+        status, ctype, body = scrape(port)
+        assert status == 200
+        assert ctype.startswith("text/plain; version=0.0.4")
+        assert "# TYPE cinetico_loopback_requests_total counter" in body
+        assert 'cinetico_loopback_requests_total{tier="RAM"}' in body
+        status, _, body = scrape(port, "HEAD")
+        assert status == 200 and body == ""
+    finally:
+        srv.shutdown()
+
+
+def test_scrape_during_active_task(core, encoder):
+    enc, errors = encoder
+    f = enc.file_queue[0]
+    enc.running = True
+    enc.scheduler.reset([(f, core.STATE_ENCODING)])
+    stop = threading.Event()
+
+    # 模拟 _run_ffmpeg 的进度循环：不断写入 / 移除 live_stats
+    def progress():
+        pid = 100000
+        while not stop.is_set():
+            enc.live_stats[pid] = {"worker": 0, "fps": 42.0, "progress": 0.5, "speed": 1.4}
+            enc.live_stats.pop(pid - 1, None)
+            pid += 1
+    t = threading.Thread(target=progress, daemon=True)
+    t.start()
+    try:
+        for _ in range(20):
+            status, _, body = scrape(enc.global_port)
+            assert status == 200
+            assert "cinetico_running 1" in body
+            assert 'cinetico_queue_tasks{state="encoding"} 1' in body
+            assert "cinetico_worker_fps{" in body
+    finally:
+        stop.set()
+        t.join()
+    assert not [e for e in errors if "[Metrics]" in e]
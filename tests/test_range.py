@@ -0,0 +1,197 @@
+import http.client
+import os
+import socket
+
+import pytest
+
+
+def test_parse_single_and_open_ended(core):
+    assert core.parse_byte_ranges("bytes=0-99", 1000) == [(0, 99)]
+    assert core.parse_byte_ranges("bytes=500-", 1000) == [(500, 999)]
+
+
+def test_parse_suffix(core):
+    assert core.parse_byte_ranges("bytes=-100", 1000) == [(900, 999)]
+    # 后缀长于文件：返回整个文件
+    assert core.parse_byte_ranges("bytes=-5000", 1000) == [(0, 999)]
+
+
+def test_parse_clamps_end(core):
+    assert core.parse_byte_ranges("bytes=990-5000", 1000) == [(990, 999)]
+
+
+def test_parse_unsatisfiable(core):
+    assert core.parse_byte_ranges("bytes=1000-", 1000) == []
+    assert core.parse_byte_ranges("bytes=-0", 1000) == []
+    assert core.parse_byte_ranges("bytes=0-10", 0) == []
+
+
+@pytest.mark.parametrize("header", ["items=0-10", "bytes=", "bytes=abc", "bytes=10-5", "bytes=1-2-3", "bytes 0-10", "bytes=0-x"])
+def test_parse_malformed_is_ignored(core, header):
+    assert core.parse_byte_ranges(header, 1000) is None
+
+
+def test_parse_too_many_parts_is_ignored(core):
+    header = "bytes=" + ",".join(f"{i}-{i}" for i in range(core.MAX_RANGE_PARTS + 1))
+    assert core.parse_byte_ranges(header, 1000) is None
+
+
+def test_plan_full_and_single(core):
+    status, headers, body = core.plan_range_response("tok", 1000)
+    assert status == 200 and dict(headers)["Content-Length"] == "1000" and body == [(0, 1000)]
+    status, headers, body = core.plan_range_response("tok", 1000, "bytes=-10")
+    assert status == 206
+    assert dict(headers)["Content-Range"] == "bytes 990-999/1000"
+    assert body == [(990, 10)]
+
+
+def test_plan_unsatisfiable(core):
+    status, headers, body = core.plan_range_response("tok", 1000, "bytes=2000-")
+    assert status == 416
+    assert dict(headers)["Content-Range"] == "bytes */1000"
+    assert body == []
+
+
+def test_plan_multipart(core):
+    status, headers, body = core.plan_range_response("tok", 1000, "bytes=0-9,-5")
+    h = dict(headers)
+    assert status == 206
+    assert h["Content-Type"] == f"multipart/byteranges; boundary={core.MULTIPART_BOUNDARY}"
+    assert [item for item in body if isinstance(item, tuple)] == [(0, 10), (995, 5)]
+    total = sum(len(item) if isinstance(item, bytes) else item[1] for item in body)
+    assert int(h["Content-Length"]) == total
+
+
+def test_plan_if_range(core):
+    etag = core.make_etag("tok", 1000)
+    status, _, _ = core.plan_range_response("tok", 1000, "bytes=0-9", if_range=etag)
+    assert status == 206
+    # ETag 不匹配或日期形式：忽略 Range，返回整个文件
+    status, _, body = core.plan_range_response("tok", 1000, "bytes=0-9", if_range='"other-1000"')
+    assert status == 200 and body == [(0, 1000)]
+    status, _, _ = core.plan_range_response("tok", 1000, "bytes=0-9", if_range="Wed, 21 Oct 2015 07:28:00 GMT")
+    assert status == 200
+
+
+@pytest.fixture(scope="module")
+def server(core):
+    srv = core.GlobalRamServer()
+    port = srv.start()
+    yield port
+    srv.shutdown()
+
+
+@pytest.fixture
+def payload():
+    return bytes(range(256)) * 4096 + b"tail"
+
+
+@pytest.fixture(params=["ram", "file"])
+def token(request, core, payload, tmp_path):
+    if request.param == "ram":
+        tok = "test-ram-token"
+        core.GLOBAL_RAM_STORAGE[tok] = payload
+        yield tok
+        core.GLOBAL_RAM_STORAGE.pop(tok, None)
+    else:
+        path = tmp_path / "src.bin"
+        path.write_bytes(payload)
+        tok = core.register_file_source(str(path), str(path))
+        yield tok
+        core.release_source(str(path))
+
+
+def test_keep_alive_round_trip(server, token, payload):
+    conn = http.client.HTTPConnection("127.0.0.1", server, timeout=10)
+    try:
+        conn.request("HEAD", f"/{token}")
+        resp = conn.getresponse()
+        assert resp.status == 200 and resp.read() == b""
+        assert int(resp.getheader("Content-Length")) == len(payload)
+        etag = resp.getheader("ETag")
+        sock = conn.sock
+
+        conn.request("GET", f"/{token}", headers={"Range": "bytes=-4"})
+        resp = conn.getresponse()
+        assert resp.status == 206 and resp.read() == b"tail"
+
+        conn.request("GET", f"/{token}", headers={"Range": "bytes=100-199", "If-Range": etag})
+        resp = conn.getresponse()
+        assert resp.status == 206 and resp.read() == payload[100:200]
+
+        conn.request("GET", f"/{token}", headers={"Range": "bytes=0-1,10-11"})
+        resp = conn.getresponse()
+        body = resp.read()
+        assert resp.status == 206 and payload[0:2] in body and payload[10:12] in body
+
+        conn.request("GET", f"/{token}", headers={"Range": f"bytes={len(payload)}-"})
+        resp = conn.getresponse()
+        assert resp.status == 416
+        resp.read()
+
+        conn.request("GET", f"/{token}")
+        resp = conn.getresponse()
+        assert resp.status == 200 and resp.read() == payload
+        # 所有请求都复用同一条连接
+        assert conn.sock is sock
+    finally:
+        conn.close()
+
+
+def test_unknown_token_and_method(server):
+    conn = http.client.HTTPConnection("127.0.0.1", server, timeout=10)
+    try:
+        conn.request("GET", "/no-such-token")
+        resp = conn.getresponse()
+        assert resp.status == 404
+        resp.read()
+        conn.request("POST", "/no-such-token", body=b"x")
+        resp = conn.getresponse()
+        assert resp.status == 405 and resp.getheader("Allow") == "GET, HEAD"
+        resp.read()
+    finally:
+        conn.close()
+
+
+
+def test_too_many_headers_closes(core, server):
+    sock = socket.create_connection(("127.0.0.1", server), timeout=10)
+    try:
+        extra = "".join(f"X-H{i}: v\r\n" for i in range(core.LOOPBACK_MAX_HEADERS + 5))
+        sock.sendall(f"GET /no-such-token HTTP/1.1\r\nHost: x\r\n{extra}\r\n".encode("latin-1"))
+        data = b""
+        while True:
+            try: chunk = sock.recv(65536)
+            except ConnectionResetError: break # 未读完的头部使关闭变成 RST
+            if not chunk: break # 服务端关闭连接
+            data += chunk
+        head = data.split(b"\r\n\r\n", 1)[0].decode("latin-1")
+        assert head.startswith("HTTP/1.1 431 ")
+        assert "Connection: close" in head
+    finally:
+        sock.close()
+
+def test_ring_far_span_opens_source_once(core, server, tmp_path, monkeypatch):
+    # 窗口外的长区间逐块从源盘发送，但整个请求只打开一次源文件
+    data = os.urandom(8 * 1024 * 1024)
+    path = tmp_path / "ring.bin"
+    path.write_bytes(data)
+    opens = []
+    def counting_open(p, *a, **k):
+        if p == str(path): opens.append(p)
+        return open(p, *a, **k)
+    monkeypatch.setattr(core, "open", counting_open, raising=False)
+    monkeypatch.setattr(core, "PROGRESSIVE_FAR_GAP", 1024 * 1024)
+    monkeypatch.setattr(core, "RING_REBASE_BYTES", 1 << 40)
+    ring = core.RingWindowBuffer(str(path), len(data), window=1024 * 1024)
+    core.GLOBAL_RAM_STORAGE["test-ring-token"] = ring
+    conn = http.client.HTTPConnection("127.0.0.1", server, timeout=10)
+    try:
+        conn.request("GET", "/test-ring-token", headers={"Range": "bytes=3145728-"})
+        resp = conn.getresponse()
+        assert resp.status == 206 and resp.read() == data[3145728:]
+        assert len(opens) == 1
+    finally:
+        conn.close()
+        ring.cancel()
+        core.GLOBAL_RAM_STORAGE.pop("test-ring-token", None)
@@ -0,0 +1,95 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+
+@pytest.fixture
+def index(core, tmp_path):
+    idx = core.SsdCacheIndex(str(tmp_path), quota_bytes=100)
+    core.CACHE_LEDGER.clear("SSD_CACHE")
+    for i in range(3):
+        name = f"CACHE_k{i}_clip{i}.mp4"
+        (tmp_path / name).write_bytes(b"x" * 30)
+        idx.add(f"k{i}", f"/src/clip{i}.mp4", str(tmp_path / name), 30)
+        idx.unpin(f"/src/clip{i}.mp4")
+    yield idx
+    idx.close()
+    core.CACHE_LEDGER.clear("SSD_CACHE")
+
+
+def test_make_room_within_quota(core, index):
+    index.make_room(10, owner="/src/new.mp4")
+    assert index.total_bytes() == 90
+    assert core.CACHE_LEDGER.holds("SSD_CACHE", "/src/new.mp4")
+
+
+def test_make_room_counts_in_flight_reservations(core, index, tmp_path):
+    # 另一个拷贝已预留 40 字节：90 + 40 + 20 超出 100 字节配额，最旧的两个条目要被淘汰
+    core.CACHE_LEDGER.reserve("SSD_CACHE", "/src/other.mp4", 40)
+    index.make_room(20, owner="/src/new.mp4")
+    assert index.total_bytes() == 30
+    assert sorted(n for n in os.listdir(tmp_path) if n.startswith("CACHE_")) == ["CACHE_k2_clip2.mp4"]
+
+
+def test_make_room_does_not_count_own_reservation_twice(core, index):
+    core.CACHE_LEDGER.reserve("SSD_CACHE", "/src/new.mp4", 10)
+    index.make_room(10, owner="/src/new.mp4")
+    assert index.total_bytes() == 90
+
+
+def test_make_room_skips_pinned(core, index):
+    index.pinned.add("/src/clip0.mp4")
+    index.make_room(60, owner="/src/new.mp4")
+    # clip0 正在使用：跳过它，淘汰其余条目
+    assert index.total_bytes() == 30
+    assert sorted(n for n in os.listdir(index.cache_dir) if n.startswith("CACHE_")) == ["CACHE_k0_clip0.mp4"]
+
+
+def test_pin_normalizes_relative_paths(core, index, tmp_path, monkeypatch):
+    # 条目按绝对路径存 src：相对路径钉住的文件同样不能被淘汰，解钉后才可以
+    src = tmp_path / "rel.mp4"
+    src.write_bytes(b"y" * 10)
+    monkeypatch.chdir(tmp_path)
+    key, path = index.paths_for("rel.mp4")
+    (tmp_path / os.path.basename(path)).write_bytes(b"y" * 10)
+    index.add(key, "rel.mp4", path, 10)
+    assert index.lookup("rel.mp4") == path
+    assert index.evictable_bytes() == 90
+    index.unpin(str(src))
+    assert index.evictable_bytes() == 100
+
+
+def age(path, seconds):
+    t = os.path.getmtime(path) - seconds
+    os.utime(path, (t, t))
+
+
+def test_reclaim_orphans(core, index, tmp_path):
+    for name in ("TEMP_ENC_old.mp4", "TEMP_ENC_live.mp4", "CACHE_x_stale.mp4.part", "TEMP_AUDIO_new.wav"):
+        (tmp_path / name).write_bytes(b"z")
+    for name in ("TEMP_ENC_old.mp4", "TEMP_ENC_live.mp4", "CACHE_x_stale.mp4.part"):
+        age(tmp_path / name, core.ORPHAN_MIN_AGE + 60)
+    index.reclaim_orphans(keep={"TEMP_ENC_live.mp4"})
+    left = set(os.listdir(tmp_path))
+    assert "TEMP_ENC_old.mp4" not in left and "CACHE_x_stale.mp4.part" not in left
+    assert {"TEMP_ENC_live.mp4", "TEMP_AUDIO_new.wav", "CACHE_k0_clip0.mp4"} <= left
+
+
+def test_reclaim_skips_while_other_instance_alive(core, index, tmp_path):
+    other = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(30)"])
+    try:
+        (tmp_path / f"LOCK_{other.pid}").write_text(str(other.pid))
+        (tmp_path / "TEMP_ENC_theirs.mp4").write_bytes(b"z")
+        age(tmp_path / "TEMP_ENC_theirs.mp4", core.ORPHAN_MIN_AGE + 60)
+        index.reclaim_orphans()
+        assert (tmp_path / "TEMP_ENC_theirs.mp4").exists()
+    finally:
+        other.kill()
+        other.wait()
+    # 对方退出后锁文件失效：清掉锁并正常回收
+    index.reclaim_orphans()
+    assert not (tmp_path / f"LOCK_{other.pid}").exists()
+    assert not (tmp_path / "TEMP_ENC_theirs.mp4").exists()
+    assert (tmp_path / f"LOCK_{os.getpid()}").exists()